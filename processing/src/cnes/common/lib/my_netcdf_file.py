@@ -22,6 +22,10 @@ import cnes.common.lib.my_variables as my_var
 import cnes.common.service_error as service_error
 
 
+# Max number of records covered by a hyperslab read by getVarValueAtIndex (bounds memory use)
+NC_READ_BLOCK_SIZE = 1000000
+
+
 class myNcReader(object):
 
     def __init__(self, in_filename):
@@ -174,7 +178,7 @@ class myNcReader(object):
         for value in list_var:
             print(value + " - units = " + self.getVarUnit(value, in_group=in_group))
     
-    def getVarValue(self, in_name, in_group=None):
+    def getVarValue(self, in_name, in_group=None, in_dtype=None, out_buffer=None):
         """
         Get the data associated to the variable in_name
         The multiplication by the scale_factor is done if there is a scale_factor attribute 
@@ -184,51 +188,125 @@ class myNcReader(object):
         :type in_name: string
         :param in_group: group containing the variable in_name
         :type in_group: netCDF4.Group
+        :param in_dtype: type of the output data (ex: np.float32 to save memory); default = type of the variable
+        :type in_dtype: numpy dtype
+        :param out_buffer: array in which the data is decoded (must have the shape of the variable); default = new array
+        :type out_buffer: numpy array
         
         :return: out_data = formatted data
         :rtype: [depend on the input variable]
         """
-        logger = logging.getLogger(self.__class__.__name__)
 
         # 0 - Select the group to study
         if in_group is None:
             cur_content = self.content
         else:
             cur_content = in_group
+        cur_var = cur_content.variables[in_name]
         
-        # 1 - Get data
-        out_data = np.copy(cur_content.variables[in_name][:])
-        # TODO: remove when input variables corrected (no NaN values anymore)
+        # 1 - Get data and decode it
+        return self.decodeVarValue(in_name, cur_var.__dict__, cur_var[:], in_dtype=in_dtype, out_buffer=out_buffer)
+    
+    def getVarValues(self, in_list_names, in_group=None, in_index=None, in_dtype=None):
+        """
+        Get the data associated to several variables at once
+        
+        :param in_list_names: names of the variables
+        :type in_list_names: list of string
+        :param in_group: group containing the variables
+        :type in_group: netCDF4.Group
+        :param in_index: indices of the wanted records of 1D variables (cf. getVarValueAtIndex); default = all records
+        :type in_index: 1D-array of int
+        :param in_dtype: type of the output data of float variables (ex: np.float32 to save memory); default = type of each variable
+        :type in_dtype: numpy dtype
+        
+        :return: out_data = dictionary with key=variable name and value=formatted data
+        :rtype: dict
+        """
+        
+        out_data = {}
+        
+        for name in in_list_names:
+            # Keep type of not float variables
+            cur_dtype = in_dtype
+            if in_dtype is not None:
+                if in_group is None:
+                    cur_var = self.content.variables[name]
+                else:
+                    cur_var = in_group.variables[name]
+                if cur_var.dtype.kind != "f":
+                    cur_dtype = None
+            # Read and decode data
+            if in_index is None:
+                out_data[name] = self.getVarValue(name, in_group=in_group, in_dtype=cur_dtype)
+            else:
+                out_data[name] = self.getVarValueAtIndex(name, in_index, in_group=in_group, in_dtype=cur_dtype)
+            
+        return out_data
+    
+    def decodeVarValue(self, in_name, in_attributes, in_data, in_dtype=None, out_buffer=None):
+        """
+        Decode raw data of the variable in_name, in a single vectorized pass over the output array:
+        NaN values are replaced by _FillValue, and values other than _FillValue are multiplied by 
+        the scale_factor if there is a scale_factor attribute (float data only)
+        
+        :param in_name: name of the variable (for log)
+        :type in_name: string
+        :param in_attributes: attributes of the variable
+        :type in_attributes: dict
+        :param in_data: raw data of the variable (may be out_buffer itself, to decode in place)
+        :type in_data: numpy array or numpy masked array
+        :param in_dtype: type of the output data; default = type of in_data
+        :type in_dtype: numpy dtype
+        :param out_buffer: array in which the data is decoded (must have the shape of in_data); default = new array
+        :type out_buffer: numpy array
+        
+        :return: out_data = formatted data
+        :rtype: [depend on the input variable]
+        """
+        logger = logging.getLogger(self.__class__.__name__)
+        
+        # 1 - Init output data
+        raw_data = np.ma.getdata(in_data)
+        if out_buffer is None:
+            if in_dtype is None:
+                out_data = np.empty(raw_data.shape, dtype=raw_data.dtype)
+            else:
+                out_data = np.empty(raw_data.shape, dtype=in_dtype)
+        else:
+            if out_buffer.shape != raw_data.shape:
+                raise ValueError("decodeVarValue: buffer for {} variable must be of shape {} (currently {})".format(in_name, raw_data.shape, out_buffer.shape))
+            out_data = out_buffer
+        if out_data is not raw_data:
+            np.copyto(out_data, raw_data, casting="same_kind")
+        
+        # 2 - Decoding only applies to float data
         out_type = str(out_data.dtype)
-        if out_type.startswith("float") or out_type.startswith("double"):
-            nan_idx = np.argwhere(np.isnan(out_data))
-            nb_nan = len(nan_idx)
-            if nb_nan > 0:
-                try:
-                    logger.warning("{} NaN values remaining in {} variable => replaced by {}".format(nb_nan, in_name, cur_content.variables[in_name]._FillValue))
-                    out_data[nan_idx] = cur_content.variables[in_name]._FillValue
-                except AttributeError:
-                    logger.warning("{} NaN values remaining in {} variable => replaced by {} (_FillValue unknown)".format(nb_nan, in_name, my_var.FV_NETCDF[out_type]))
-                    out_data[nan_idx] = my_var.FV_NETCDF[out_type]
+        if out_data.dtype.kind != "f":
+            return out_data
+        fill_value = in_attributes.get("_FillValue")
+        
+        # 3 - Replace NaN values by _FillValue
+        # TODO: remove when input variables corrected (no NaN values anymore)
+        nan_flag = np.isnan(out_data)
+        nb_nan = np.count_nonzero(nan_flag)
+        if nb_nan > 0:
+            if fill_value is not None:
+                logger.warning("{} NaN values remaining in {} variable => replaced by {}".format(nb_nan, in_name, fill_value))
+                out_data[nan_flag] = fill_value
+            else:
+                logger.warning("{} NaN values remaining in {} variable => replaced by {} (_FillValue unknown)".format(nb_nan, in_name, my_var.FV_NETCDF[out_type]))
+                out_data[nan_flag] = my_var.FV_NETCDF[out_type]
         # == END-TODO ==
         
-        # 2 - Get not _FillValue indices
-        fv_flag = False
-        try:
-            not_nan_idx = np.where(out_data < cur_content.variables[in_name]._FillValue)
-            if len(not_nan_idx) < len(out_data):
-                fv_flag = True
-        except:
-            pass
-                
-        # 3 - Multiplication by the scale factor where not NaN
-        try:
-            if fv_flag:
-                out_data[not_nan_idx] *= cur_content.variables[in_name].scale_factor
+        # 4 - Multiplication by the scale factor, in place, where not _FillValue
+        scale_factor = in_attributes.get("scale_factor")
+        if scale_factor is not None:
+            if fill_value is not None:
+                # _FillValue converted to the output type, to be compared with the converted data
+                np.multiply(out_data, scale_factor, out=out_data, where=(out_data < out_data.dtype.type(fill_value)))
             else:
-                out_data *= cur_content.variables[in_name].scale_factor
-        except:
-            pass
+                np.multiply(out_data, scale_factor, out=out_data)
             
         return out_data
     
@@ -265,6 +343,85 @@ class myNcReader(object):
             
         return out_data
     
+    def getVarValueAtIndex(self, in_name, in_index, in_group=None, in_dtype=None, out_buffer=None):
+        """
+        Get the data associated to the 1D variable in_name, only for records in_index
+        Records are read by hyperslabs covering at most NC_READ_BLOCK_SIZE records and starting at a wanted record,
+        so that the whole variable is never loaded in memory; data is decoded as in getVarValue, 
+        but only on the wanted records
+        
+        :param in_name: name of the variable
+        :type in_name: string
+        :param in_index: indices of the wanted records (in any order, possibly repeated)
+        :type in_index: 1D-array of int
+        :param in_group: group containing the variable in_name
+        :type in_group: netCDF4.Group
+        :param in_dtype: type of the output data (ex: np.float32 to save memory); default = type of the variable
+        :type in_dtype: numpy dtype
+        :param out_buffer: array in which the data is decoded (must be of size in_index); default = new array
+        :type out_buffer: numpy array
+        
+        :return: out_data = formatted data, in the order of in_index
+        :rtype: [depend on the input variable]
+        """
+
+        # 0 - Select the group to study
+        if in_group is None:
+            cur_content = self.content
+        else:
+            cur_content = in_group
+        cur_var = cur_content.variables[in_name]
+        
+        # 1 - Sort wanted records, to read each block of the file only once
+        index = np.asarray(in_index, dtype=np.int64).ravel()
+        order = np.argsort(index, kind="mergesort")
+        sorted_index = index[order]
+        
+        # 2 - Read wanted records, block by block, directly in the output array
+        out_data = out_buffer
+        ind_start = 0
+        while ind_start < sorted_index.size:
+            first_record = sorted_index[ind_start]
+            ind_end = np.searchsorted(sorted_index, first_record + NC_READ_BLOCK_SIZE, side="left")
+            block = np.ma.getdata(cur_var[first_record:sorted_index[ind_end-1]+1])
+            if out_data is None:
+                out_data = np.empty(index.size, dtype=(block.dtype if in_dtype is None else in_dtype))
+            out_data[order[ind_start:ind_end]] = block[sorted_index[ind_start:ind_end] - first_record]
+            ind_start = ind_end
+        if out_data is None:  # No wanted record
+            out_data = np.ma.getdata(cur_var[0:0])
+            if in_dtype is not None:
+                out_data = out_data.astype(in_dtype)
+        
+        # 3 - Decode data in place
+        return self.decodeVarValue(in_name, cur_var.__dict__, out_data, out_buffer=out_data)
+    
+    def getVarValueAtIndex_orEmpty(self, in_name, in_index, in_group=None):
+        """
+        Get the data associated to the 1D variable in_name, only for records in_index, if it exists
+        If not, return an array of int with _FillValue
+        
+        :param in_name: name of the variable
+        :type in_name: string
+        :param in_index: indices of the wanted records
+        :type in_index: 1D-array of int
+        :param in_group: group containing the variable in_name
+        :type in_group: netCDF4.Group
+        
+        :return: out_data = formatted data or array of _FillValue
+        :rtype: [depend on the input variable]
+        """
+        logger = logging.getLogger(self.__class__.__name__)
+        
+        if in_name in self.getListVar(in_group=in_group):
+            out_data = self.getVarValueAtIndex(in_name, in_index, in_group)
+        else:
+            logger.info("Variable %s doesn't exit => return empty array" % in_name)
+            # Make empty array of int with _FillValue
+            out_data = np.zeros(np.size(in_index), dtype=np.int32) + 2147483647
+            
+        return out_data
+    
     def getVarUnit(self, in_name, in_group=None):
         """
         Get the unit of variable named in_name
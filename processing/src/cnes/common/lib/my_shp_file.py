@@ -16,11 +16,21 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import os
 import logging
+import numpy as np
 from osgeo import ogr, osr
 
 import cnes.common.service_error as service_error
 
 
+# OGR driver associated to each vector file extension
+VECTOR_DRIVERS = {".shp": "ESRI Shapefile",
+                  ".gpkg": "GPKG",
+                  ".fgb": "FlatGeobuf"}
+
+# Number of features written per transaction
+NB_FEATURES_PER_TRANSACTION = 100000
+
+
 def merge_mem_layer_with_shp(in_list_shp, in_layer):
     """
     This function merges shapefiles listed in in_list_shp with the layer in_layer (typically LakeTile shp with LakeSP memory layer).
@@ -141,3 +151,87 @@ def write_mem_layer_as_shp(in_mem_layer, in_shp_filename):
     
     # 4 - Close output file
     data_source.Destroy()
+
+
+def write_points_file(in_filename, in_lon, in_lat, in_fields, in_layer_name=None):
+    """
+    Write a point layer from 1D-arrays, in a vector file whose format depends on the extension of in_filename
+    (.shp = ESRI Shapefile, .gpkg = GeoPackage, .fgb = FlatGeobuf).
+    Values are converted from numpy in a single pass per field, and features are written in transactions,
+    reusing the same feature and geometry objects.
+    
+    :param in_filename: output full path (deleted first if it already exists)
+    :type in_filename: string
+    :param in_lon: longitude of the points
+    :type in_lon: 1D-array of float
+    :param in_lat: latitude of the points
+    :type in_lat: 1D-array of float
+    :param in_fields: fields of the layer, as (name, OGR type, width, precision, values) tuples;
+                        width and precision are set only if not None
+    :type in_fields: list of tuple
+    :param in_layer_name: name of the layer (default = basename of in_filename without extension)
+    :type in_layer_name: string
+    """
+    logger = logging.getLogger("my_shp_file")
+    
+    # 1 - Init output file
+    # 1.1 - Driver
+    extension = os.path.splitext(in_filename)[1].lower()
+    if extension not in VECTOR_DRIVERS:
+        message = "ERROR = unknown vector file extension %s (must be in %s)" % (extension, ", ".join(sorted(VECTOR_DRIVERS)))
+        raise service_error.ProcessingError(message, logger)
+    driver = ogr.GetDriverByName(str(VECTOR_DRIVERS[extension]))
+    if driver is None:
+        message = "ERROR = OGR driver %s not available" % VECTOR_DRIVERS[extension]
+        raise service_error.ProcessingError(message, logger)
+    # 1.2 - Create file
+    if os.path.exists(in_filename):
+        driver.DeleteDataSource(in_filename)
+    data_source = driver.CreateDataSource(in_filename)
+    # 1.3 - Create layer
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)  # WGS84
+    if in_layer_name is None:
+        in_layer_name = os.path.splitext(os.path.basename(in_filename))[0]
+    layer = data_source.CreateLayer(str(in_layer_name), srs, geom_type=ogr.wkbPoint)
+    # 1.4 - Create fields
+    for name, field_type, width, precision, values in in_fields:
+        field_defn = ogr.FieldDefn(str(name), field_type)
+        if width is not None:
+            field_defn.SetWidth(width)
+        if precision is not None:
+            field_defn.SetPrecision(precision)
+        layer.CreateField(field_defn)
+    layer_defn = layer.GetLayerDefn()
+    
+    # 2 - Convert values to Python lists once (much faster than per-element conversion of numpy scalars)
+    lon_list = np.asarray(in_lon, dtype=np.float64).tolist()
+    lat_list = np.asarray(in_lat, dtype=np.float64).tolist()
+    field_lists = []
+    for name, field_type, width, precision, values in in_fields:
+        if field_type == ogr.OFTInteger:
+            field_lists.append(np.asarray(values).astype(np.int64).tolist())
+        elif field_type == ogr.OFTReal:
+            field_lists.append(np.asarray(values, dtype=np.float64).tolist())
+        else:
+            field_lists.append([str(val) for val in values])
+    ind_fields = range(len(field_lists))
+    
+    # 3 - Write features, reusing the same objects, in transactions
+    feature = ogr.Feature(layer_defn)
+    point = ogr.Geometry(ogr.wkbPoint)
+    layer.StartTransaction()
+    for indp in range(len(lon_list)):
+        point.SetPoint_2D(0, lon_list[indp], lat_list[indp])
+        feature.SetGeometry(point)
+        for indf in ind_fields:
+            feature.SetField(indf, field_lists[indf][indp])
+        feature.SetFID(-1)
+        layer.CreateFeature(feature)
+        if (indp+1) % NB_FEATURES_PER_TRANSACTION == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+    layer.CommitTransaction()
+    
+    # 4 - Close file
+    data_source.Destroy()
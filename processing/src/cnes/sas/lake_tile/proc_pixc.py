@@ -19,17 +19,29 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import logging
 import numpy as np
 import os
-from osgeo import ogr, osr
+from osgeo import ogr
 from scipy import interpolate
 
 import cnes.common.lib.my_basins as my_basins
 import cnes.common.lib.my_netcdf_file as my_nc
+import cnes.common.lib.my_shp_file as my_shp
 import cnes.common.lib.my_tools as my_tools
 import cnes.common.lib.my_variables as my_var2
 import cnes.common.lib_lake.locnes_products_netcdf as nc_file
 import cnes.common.lib_lake.locnes_variables as my_var
 
 
+# Variables of the pixel_cloud group only needed in the LakeTile_edge file: they are not used by the LakeTile processing,
+# so they are read only for the edge pixels, when writing this file
+PIXC_EDGE_VARIABLES = ["water_frac_uncert", "false_detection_rate", "missed_detection_rate", "prior_water_prob", "bright_land_flag", 
+                       "layover_impact", "num_rare_looks", "inc", "dheight_dphase", "dheight_droll", "dheight_dbaseline", 
+                       "dheight_drange", "darea_dheight", "num_med_looks", "phase_unwrapping_region", "instrument_range_cor", 
+                       "instrument_phase_cor", "instrument_baseline_cor", "instrument_attitude_cor", "surface_type_flag", "pixc_qual"]
+# Variables of the tvp group only needed in the LakeTile_edge file (key = name in the LakeTile_edge file, value = name in the tvp group)
+TVP_EDGE_VARIABLES = {"nadir_sc_event_flag": "sc_event_flag", 
+                      "nadir_tvp_qual": "tvp_qual"}
+
+
 class PixelCloud(object):
 
     def __init__(self):
@@ -80,6 +92,7 @@ class PixelCloud(object):
             solid_earth_tide / 1D array of float: solid earth tide
             geoid / 1D array of float: geoid
             surface_type_flag / 1D array of byte: surface type flag
+            NB: variables listed in PIXC_EDGE_VARIABLES are not kept in memory; they are read only for edge pixels, by write_edge_file
             
         - From tvp group in L2_HR_PIXC file
             nadir_time[_tai] / 1D-array of float: observation UTC [TAI] time of each nadir pixel (= variable named time[tai] in L2_HR_PIXC file)
@@ -89,8 +102,11 @@ class PixelCloud(object):
             nadir_[vx|vy|vz] / 1D-array of float: velocity vector of each nadir pixel in cartesian coordinates (= variables named velocity_unit_[x|y|z] in L2_HR_PIXC file)
             nadir_sc_event_flag / 1D array of byte: spacecraft event flag
             nadir_tvp_qual / 1D array of byte: quality flag
+            NB: variables listed in TVP_EDGE_VARIABLES are not kept in memory; they are read only for edge pixels, by write_edge_file
             
         - From processing
+            pixc_file / string: full path of L2_HR_PIXC file (to read variables only needed for edge pixels)
+            nadir_index / 1D-array of int: index of the nadir pixel associated to each selected pixel
             tile_poly / ogr.Polygon: polygon of the PixC tile
             continent / string: continent covered by the tile (if global var CONTINENT_FILE exists)
             inundated_area / 1D-array of int: area of pixels covered by water
@@ -195,6 +211,8 @@ class PixelCloud(object):
         self.pixc_metadata["near_range"] = -9999.0
 
         # Variables specific to processing
+        self.pixc_file = None  # Full path of L2_HR_PIXC file
+        self.nadir_index = None  # Index of the nadir pixel associated to each selected pixel
         self.nb_pix_range = 0  # Number of pixels in range dimension
         self.nb_pix_azimuth = 0  # Number of pixels in azimuth dimension
         self.tile_poly = None  # Polygon representing the PIXC tile
@@ -237,6 +255,7 @@ class PixelCloud(object):
         logger.info(TMP_print)
         
         # 1 - Open pixel cloud file in reading mode
+        self.pixc_file = in_pixc_file
         pixc_reader = my_nc.myNcReader(in_pixc_file)
         pixc_group = pixc_reader.content.groups['pixel_cloud']
         sensor_group = pixc_reader.content.groups['tvp']
@@ -351,115 +370,74 @@ class PixelCloud(object):
             # Range indices of water pixels
             self.azimuth_index = self.origin_azimuth_index[self.selected_index]
             
+            # Variables used by the LakeTile processing are read only for selected pixels
+            # (variables only needed for edge pixels are read by write_edge_file, cf. PIXC_EDGE_VARIABLES)
             # Water fraction
-            self.water_frac = pixc_reader.getVarValue_orEmpty("water_frac", in_group=pixc_group)[self.selected_index]
-            # Water fraction uncertainty
-            self.water_frac_uncert = pixc_reader.getVarValue_orEmpty("water_frac_uncert", in_group=pixc_group)[self.selected_index]
-            # False detection rate
-            self.false_detection_rate = pixc_reader.getVarValue_orEmpty("false_detection_rate", in_group=pixc_group)[self.selected_index]
-            # Missed detection rate
-            self.missed_detection_rate = pixc_reader.getVarValue_orEmpty("missed_detection_rate", in_group=pixc_group)[self.selected_index]
-            # Prior water probability
-            self.prior_water_prob = pixc_reader.getVarValue_orEmpty("prior_water_prob", in_group=pixc_group)[self.selected_index]
-            # Bright land flag
-            self.bright_land_flag = pixc_reader.getVarValue_orEmpty("bright_land_flag", in_group=pixc_group)[self.selected_index]
-            # Layover impact
-            self.layover_impact = pixc_reader.getVarValue_orEmpty("layover_impact", in_group=pixc_group)[self.selected_index]
-            # Number of rare looks
-            self.num_rare_looks = pixc_reader.getVarValue_orEmpty("num_rare_looks", in_group=pixc_group)[self.selected_index]
+            self.water_frac = pixc_reader.getVarValueAtIndex_orEmpty("water_frac", self.selected_index, in_group=pixc_group)
             # Latitude
             self.latitude = origin_latitude[self.selected_index]
             # Longitude
             self.longitude = origin_longitude[self.selected_index]
             # Height
-            self.height = pixc_reader.getVarValue("height", in_group=pixc_group)[self.selected_index]
+            self.height = pixc_reader.getVarValueAtIndex("height", self.selected_index, in_group=pixc_group)
             # Cross-track distance
-            self.cross_track = pixc_reader.getVarValue("cross_track", in_group=pixc_group)[self.selected_index]
+            self.cross_track = pixc_reader.getVarValueAtIndex("cross_track", self.selected_index, in_group=pixc_group)
             # Pixel area
-            self.pixel_area = pixc_reader.getVarValue("pixel_area", in_group=pixc_group)[self.selected_index]
+            self.pixel_area = pixc_reader.getVarValueAtIndex("pixel_area", self.selected_index, in_group=pixc_group)
             # Inundated area
             self.inundated_area = np.copy(self.pixel_area)
             ind_ok = np.where(self.water_frac < my_var2.FV_FLOAT)
             if len(ind_ok) > 0:
                 self.inundated_area[ind_ok] = self.pixel_area[ind_ok] * self.water_frac[ind_ok]
-            # Incidence angle
-            self.inc = pixc_reader.getVarValue_orEmpty("inc", in_group=pixc_group)[self.selected_index]
-            # Sensitivity of height estimate to interferogram phase
-            self.dheight_dphase = pixc_reader.getVarValue_orEmpty("dheight_dphase", in_group=pixc_group)[self.selected_index]
-            # Sensitivity of height estimate to spacecraft roll
-            self.dheight_droll = pixc_reader.getVarValue_orEmpty("dheight_droll", in_group=pixc_group)[self.selected_index]
-            # Sensitivity of height estimate to interferometric baseline
-            self.dheight_dbaseline = pixc_reader.getVarValue_orEmpty("dheight_dbaseline", in_group=pixc_group)[self.selected_index]
-            # Sensitivity of height estimate to range
-            self.dheight_drange = pixc_reader.getVarValue_orEmpty("dheight_drange", in_group=pixc_group)[self.selected_index]
-            # Sensitivity of pixel area to reference height
-            self.darea_dheight = pixc_reader.getVarValue_orEmpty("darea_dheight", in_group=pixc_group)[self.selected_index]
             # Time of illumination of each pixel
-            illumination_time = pixc_reader.getVarValue("illumination_time", in_group=pixc_group)[self.selected_index]
-            # Number of medium looks
-            self.num_med_looks = pixc_reader.getVarValue_orEmpty("num_med_looks", in_group=pixc_group)[self.selected_index]
+            illumination_time = pixc_reader.getVarValueAtIndex("illumination_time", self.selected_index, in_group=pixc_group)
             # sigma0
-            self.sig0 = pixc_reader.getVarValue_orEmpty("sig0", in_group=pixc_group)[self.selected_index]
-            # Phase unwrapping region index
-            self.phase_unwrapping_region = pixc_reader.getVarValue_orEmpty("phase_unwrapping_region", in_group=pixc_group)[self.selected_index]
-            # Instrument range correction
-            self.instrument_range_cor = pixc_reader.getVarValue_orEmpty("instrument_range_cor", in_group=pixc_group)[self.selected_index]
-            # Instrument phase correction
-            self.instrument_phase_cor = pixc_reader.getVarValue_orEmpty("instrument_phase_cor", in_group=pixc_group)[self.selected_index]
-            # Instrument baseline correction
-            self.instrument_baseline_cor = pixc_reader.getVarValue_orEmpty("instrument_baseline_cor", in_group=pixc_group)[self.selected_index]
-            # Instrument attitude correction
-            self.instrument_attitude_cor = pixc_reader.getVarValue_orEmpty("instrument_attitude_cor", in_group=pixc_group)[self.selected_index]
+            self.sig0 = pixc_reader.getVarValueAtIndex_orEmpty("sig0", self.selected_index, in_group=pixc_group)
             # Dry troposphere vertical correction
-            self.model_dry_tropo_cor = pixc_reader.getVarValue_orEmpty("model_dry_tropo_cor", in_group=pixc_group)[self.selected_index]
+            self.model_dry_tropo_cor = pixc_reader.getVarValueAtIndex_orEmpty("model_dry_tropo_cor", self.selected_index, in_group=pixc_group)
             # Wet troposphere vertical correction
-            self.model_wet_tropo_cor = pixc_reader.getVarValue_orEmpty("model_wet_tropo_cor", in_group=pixc_group)[self.selected_index]
+            self.model_wet_tropo_cor = pixc_reader.getVarValueAtIndex_orEmpty("model_wet_tropo_cor", self.selected_index, in_group=pixc_group)
             # Ionosphere vertical correction
-            self.iono_cor_gim_ka = pixc_reader.getVarValue_orEmpty("iono_cor_gim_ka", in_group=pixc_group)[self.selected_index]
+            self.iono_cor_gim_ka = pixc_reader.getVarValueAtIndex_orEmpty("iono_cor_gim_ka", self.selected_index, in_group=pixc_group)
             # Crossover calibration height correction
-            self.xover_height_cor = pixc_reader.getVarValue_orEmpty("xover_height_cor", in_group=pixc_group)[self.selected_index]
+            self.xover_height_cor = pixc_reader.getVarValueAtIndex_orEmpty("xover_height_cor", self.selected_index, in_group=pixc_group)
             # Load tide height (GOT4.10)
-            self.load_tide_sol1 = pixc_reader.getVarValue_orEmpty("load_tide_sol1", in_group=pixc_group)[self.selected_index]
+            self.load_tide_sol1 = pixc_reader.getVarValueAtIndex_orEmpty("load_tide_sol1", self.selected_index, in_group=pixc_group)
             # Load tide height (FES2014)
-            self.load_tide_sol2 = pixc_reader.getVarValue_orEmpty("load_tide_sol2", in_group=pixc_group)[self.selected_index]
+            self.load_tide_sol2 = pixc_reader.getVarValueAtIndex_orEmpty("load_tide_sol2", self.selected_index, in_group=pixc_group)
             # Pole tide height
-            self.pole_tide = pixc_reader.getVarValue_orEmpty("pole_tide", in_group=pixc_group)[self.selected_index]
+            self.pole_tide = pixc_reader.getVarValueAtIndex_orEmpty("pole_tide", self.selected_index, in_group=pixc_group)
             # Solid earth tide
-            self.solid_earth_tide = pixc_reader.getVarValue_orEmpty("solid_earth_tide", in_group=pixc_group)[self.selected_index]
+            self.solid_earth_tide = pixc_reader.getVarValueAtIndex_orEmpty("solid_earth_tide", self.selected_index, in_group=pixc_group)
             # Geoid
-            self.geoid = pixc_reader.getVarValue_orEmpty("geoid", in_group=pixc_group)[self.selected_index]
-            # Surface type flag
-            self.surface_type_flag = pixc_reader.getVarValue_orEmpty("surface_type_flag", in_group=pixc_group)[self.selected_index]
-            # Quality flag
-            self.pixc_qual = pixc_reader.getVarValue_orEmpty("pixc_qual", in_group=pixc_group)[self.selected_index]
+            self.geoid = pixc_reader.getVarValueAtIndex_orEmpty("geoid", self.selected_index, in_group=pixc_group)
 
             # 6.2 - In TVP group
             
             # Interpolate nadir_time wrt illumination time
             TMP_nadir_time = pixc_reader.getVarValue("time", in_group=sensor_group)  # Read nadir_time values
             f = interpolate.interp1d(TMP_nadir_time, range(len(TMP_nadir_time)))  # Interpolator
-            nadir_index = (np.rint(f(illumination_time))).astype(int)  # Link between PixC and nadir pixels
+            self.nadir_index = (np.rint(f(illumination_time))).astype(int)  # Link between PixC and nadir pixels
+            nadir_index = self.nadir_index
             
             # Nadir time
             self.nadir_time = TMP_nadir_time[nadir_index]
+            # Other TVP variables, read at once
+            tvp_values = pixc_reader.getVarValues(["time_tai", "longitude", "latitude", "x", "y", "z", "vx", "vy", "vz"], in_group=sensor_group)
             # Nadir time TAI
-            self.nadir_time_tai = pixc_reader.getVarValue("time_tai", in_group=sensor_group)[nadir_index]
+            self.nadir_time_tai = tvp_values["time_tai"][nadir_index]
             # Nadir longitude
-            self.nadir_longitude = pixc_reader.getVarValue("longitude", in_group=sensor_group)[nadir_index]
+            self.nadir_longitude = tvp_values["longitude"][nadir_index]
             # Nadir latitude
-            self.nadir_latitude = pixc_reader.getVarValue("latitude", in_group=sensor_group)[nadir_index]
+            self.nadir_latitude = tvp_values["latitude"][nadir_index]
             # Nadir cartesian coordinates
-            self.nadir_x = pixc_reader.getVarValue("x", in_group=sensor_group)[nadir_index]
-            self.nadir_y = pixc_reader.getVarValue("y", in_group=sensor_group)[nadir_index]
-            self.nadir_z = pixc_reader.getVarValue("z", in_group=sensor_group)[nadir_index]
+            self.nadir_x = tvp_values["x"][nadir_index]
+            self.nadir_y = tvp_values["y"][nadir_index]
+            self.nadir_z = tvp_values["z"][nadir_index]
             # Nadir velocity in cartesian coordinates
-            self.nadir_vx = pixc_reader.getVarValue("vx", in_group=sensor_group)[nadir_index]
-            self.nadir_vy = pixc_reader.getVarValue("vy", in_group=sensor_group)[nadir_index]
-            self.nadir_vz = pixc_reader.getVarValue("vz", in_group=sensor_group)[nadir_index]
-            # Spacecraft event flag
-            self.nadir_sc_event_flag = pixc_reader.getVarValue("sc_event_flag", in_group=sensor_group)[nadir_index]
-            # Quality flag
-            self.nadir_tvp_qual = pixc_reader.getVarValue("tvp_qual", in_group=sensor_group)[nadir_index]
+            self.nadir_vx = tvp_values["vx"][nadir_index]
+            self.nadir_vy = tvp_values["vy"][nadir_index]
+            self.nadir_vz = tvp_values["vz"][nadir_index]
                     
         # 4.8 - Close file
         pixc_reader.close()
@@ -643,6 +621,7 @@ class PixelCloud(object):
                                                  in_proc_metadata=in_proc_metadata)
 
         # 2 - Form dictionary with variables to write
+        edge_variables = self.read_edge_variables()  # Variables only needed for edge pixels, read from the L2_HR_PIXC file
         vars_to_write = {}
         vars_to_write["edge_index"] = self.selected_index[self.edge_index]
         vars_to_write["edge_label"] = self.edge_label
@@ -651,31 +630,31 @@ class PixelCloud(object):
         vars_to_write["range_index"] = self.range_index[self.edge_index]
         vars_to_write["azimuth_index"] = self.azimuth_index[self.edge_index]
         vars_to_write["water_frac"] = self.water_frac[self.edge_index]
-        vars_to_write["water_frac_uncert"] = self.water_frac_uncert[self.edge_index]
-        vars_to_write["false_detection_rate"] = self.false_detection_rate[self.edge_index]
-        vars_to_write["missed_detection_rate"] = self.missed_detection_rate[self.edge_index]
-        vars_to_write["prior_water_prob"] = self.prior_water_prob[self.edge_index]
-        vars_to_write["bright_land_flag"] = self.bright_land_flag[self.edge_index]
-        vars_to_write["layover_impact"] = self.layover_impact[self.edge_index]
-        vars_to_write["num_rare_looks"] = self.num_rare_looks[self.edge_index]
+        vars_to_write["water_frac_uncert"] = edge_variables["water_frac_uncert"]
+        vars_to_write["false_detection_rate"] = edge_variables["false_detection_rate"]
+        vars_to_write["missed_detection_rate"] = edge_variables["missed_detection_rate"]
+        vars_to_write["prior_water_prob"] = edge_variables["prior_water_prob"]
+        vars_to_write["bright_land_flag"] = edge_variables["bright_land_flag"]
+        vars_to_write["layover_impact"] = edge_variables["layover_impact"]
+        vars_to_write["num_rare_looks"] = edge_variables["num_rare_looks"]
         vars_to_write["latitude"] = self.latitude[self.edge_index]
         vars_to_write["longitude"] = self.longitude[self.edge_index]
         vars_to_write["height"] = self.height[self.edge_index]
         vars_to_write["cross_track"] = self.cross_track[self.edge_index]
         vars_to_write["pixel_area"] = self.pixel_area[self.edge_index]
-        vars_to_write["inc"] = self.inc[self.edge_index]
-        vars_to_write["dheight_dphase"] = self.dheight_dphase[self.edge_index]
-        vars_to_write["dheight_droll"] = self.dheight_droll[self.edge_index]
-        vars_to_write["dheight_dbaseline"] = self.dheight_dbaseline[self.edge_index]
-        vars_to_write["dheight_drange"] = self.dheight_drange[self.edge_index]
-        vars_to_write["darea_dheight"] = self.darea_dheight[self.edge_index]
-        vars_to_write["num_med_looks"] = self.num_med_looks[self.edge_index]
+        vars_to_write["inc"] = edge_variables["inc"]
+        vars_to_write["dheight_dphase"] = edge_variables["dheight_dphase"]
+        vars_to_write["dheight_droll"] = edge_variables["dheight_droll"]
+        vars_to_write["dheight_dbaseline"] = edge_variables["dheight_dbaseline"]
+        vars_to_write["dheight_drange"] = edge_variables["dheight_drange"]
+        vars_to_write["darea_dheight"] = edge_variables["darea_dheight"]
+        vars_to_write["num_med_looks"] = edge_variables["num_med_looks"]
         vars_to_write["sig0"] = self.sig0[self.edge_index]
-        vars_to_write["phase_unwrapping_region"] = self.phase_unwrapping_region[self.edge_index]
-        vars_to_write["instrument_range_cor"] = self.instrument_range_cor[self.edge_index]
-        vars_to_write["instrument_phase_cor"] = self.instrument_phase_cor[self.edge_index]
-        vars_to_write["instrument_baseline_cor"] = self.instrument_baseline_cor[self.edge_index]
-        vars_to_write["instrument_attitude_cor"] = self.instrument_attitude_cor[self.edge_index]
+        vars_to_write["phase_unwrapping_region"] = edge_variables["phase_unwrapping_region"]
+        vars_to_write["instrument_range_cor"] = edge_variables["instrument_range_cor"]
+        vars_to_write["instrument_phase_cor"] = edge_variables["instrument_phase_cor"]
+        vars_to_write["instrument_baseline_cor"] = edge_variables["instrument_baseline_cor"]
+        vars_to_write["instrument_attitude_cor"] = edge_variables["instrument_attitude_cor"]
         vars_to_write["model_dry_tropo_cor"] = self.model_dry_tropo_cor[self.edge_index]
         vars_to_write["model_wet_tropo_cor"] = self.model_wet_tropo_cor[self.edge_index]
         vars_to_write["iono_cor_gim_ka"] = self.iono_cor_gim_ka[self.edge_index]
@@ -685,8 +664,8 @@ class PixelCloud(object):
         vars_to_write["pole_tide"] = self.pole_tide[self.edge_index]
         vars_to_write["solid_earth_tide"] = self.solid_earth_tide[self.edge_index]
         vars_to_write["geoid"] = self.geoid[self.edge_index]
-        vars_to_write["surface_type_flag"] = self.surface_type_flag[self.edge_index]
-        vars_to_write["pixc_qual"] = self.pixc_qual[self.edge_index]
+        vars_to_write["surface_type_flag"] = edge_variables["surface_type_flag"]
+        vars_to_write["pixc_qual"] = edge_variables["pixc_qual"]
         vars_to_write["nadir_time"] = self.nadir_time[self.edge_index]
         vars_to_write["nadir_time_tai"] = self.nadir_time_tai[self.edge_index]
         vars_to_write["nadir_longitude"] = self.nadir_longitude[self.edge_index]
@@ -697,12 +676,54 @@ class PixelCloud(object):
         vars_to_write["nadir_vx"] = self.nadir_vx[self.edge_index]
         vars_to_write["nadir_vy"] = self.nadir_vy[self.edge_index]
         vars_to_write["nadir_vz"] = self.nadir_vz[self.edge_index]
-        vars_to_write["nadir_sc_event_flag"] = self.nadir_sc_event_flag[self.edge_index]
-        vars_to_write["nadir_tvp_qual"] = self.nadir_tvp_qual[self.edge_index]
+        vars_to_write["nadir_sc_event_flag"] = edge_variables["nadir_sc_event_flag"]
+        vars_to_write["nadir_tvp_qual"] = edge_variables["nadir_tvp_qual"]
             
         # 3 - Write file
         edge_file.write_product(in_filename, self.nb_edge_pix, vars_to_write)
 
+    def read_edge_variables(self):
+        """
+        Read variables of L2_HR_PIXC file only needed in the LakeTile_edge file (cf. PIXC_EDGE_VARIABLES 
+        and TVP_EDGE_VARIABLES), only for edge pixels
+        
+        :return: dictionary with key=variable name in the LakeTile_edge file and value=variable value for edge pixels
+        :rtype: dict
+        """
+        logger = logging.getLogger(self.__class__.__name__)
+        logger.info("- start -")
+        
+        out_variables = {}
+        
+        # 0 - Nothing to read if no edge pixel
+        if self.nb_edge_pix == 0:
+            for name in PIXC_EDGE_VARIABLES:
+                out_variables[name] = np.zeros(0)
+            for name in TVP_EDGE_VARIABLES:
+                out_variables[name] = np.zeros(0)
+            return out_variables
+        
+        # 1 - Open pixel cloud file in reading mode
+        pixc_reader = my_nc.myNcReader(self.pixc_file)
+        pixc_group = pixc_reader.content.groups['pixel_cloud']
+        sensor_group = pixc_reader.content.groups['tvp']
+        
+        # 2 - Read variables of pixel_cloud group for edge pixels
+        edge_pixc_index = self.selected_index[self.edge_index]  # Indices of edge pixels in L2_HR_PIXC file
+        for name in PIXC_EDGE_VARIABLES:
+            out_variables[name] = pixc_reader.getVarValueAtIndex_orEmpty(name, edge_pixc_index, in_group=pixc_group)
+            
+        # 3 - Read variables of tvp group for nadir pixels associated to edge pixels
+        edge_nadir_index = self.nadir_index[self.edge_index]
+        tvp_values = pixc_reader.getVarValues(list(TVP_EDGE_VARIABLES.values()), in_group=sensor_group)
+        for name, tvp_name in TVP_EDGE_VARIABLES.items():
+            out_variables[name] = tvp_values[tvp_name][edge_nadir_index]
+            
+        # 4 - Close file
+        pixc_reader.close()
+        
+        return out_variables
+
     def write_edge_file_asShp(self, in_filename):
         """
         Write PixC subset related to edge (top/bottom) objects as a shapefile
@@ -713,78 +734,19 @@ class PixelCloud(object):
         logger = logging.getLogger(self.__class__.__name__)
         logger.info("Output L2_HR_LakeTile_edge shapefile = %s" % in_filename)
 
-        # 1 - Initialisation du fichier de sortie
-        # 1.1 - Driver
-        shpDriver = ogr.GetDriverByName(str("ESRI Shapefile"))
-        # 1.2 - Create file
-        if os.path.exists(in_filename):
-            shpDriver.DeleteDataSource(in_filename)
-        outDataSource = shpDriver.CreateDataSource(in_filename)
-        # 1.3 - Create layer
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)  # WGS84
-        outLayer = outDataSource.CreateLayer(str(str(os.path.basename(in_filename)).replace('.shp', '')), srs, geom_type=ogr.wkbPoint)
-        # 1.4 - Create attributes
-        outLayer.CreateField(ogr.FieldDefn(str('edge_index'), ogr.OFTInteger))
-        outLayer.CreateField(ogr.FieldDefn(str('edge_label'), ogr.OFTInteger))
-        outLayer.CreateField(ogr.FieldDefn(str('edge_loc'), ogr.OFTInteger))
-        outLayer.CreateField(ogr.FieldDefn(str('az_index'), ogr.OFTInteger))
-        outLayer.CreateField(ogr.FieldDefn(str('r_index'), ogr.OFTInteger))
-        outLayer.CreateField(ogr.FieldDefn(str('classif'), ogr.OFTInteger))
-        tmpField = ogr.FieldDefn(str('water_frac'), ogr.OFTReal)
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('crosstrack'), ogr.OFTReal)
-        tmpField.SetWidth(12)
-        tmpField.SetPrecision(4)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('pixel_area'), ogr.OFTReal)
-        tmpField.SetWidth(12)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('height'), ogr.OFTReal)
-        tmpField.SetWidth(12)
-        tmpField.SetPrecision(4)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('nadir_t'), ogr.OFTReal)
-        tmpField.SetWidth(13)
-        tmpField.SetPrecision(3)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('nadir_long'), ogr.OFTReal)
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('nadir_lat'), ogr.OFTReal)
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        outLayerDefn = outLayer.GetLayerDefn()
-
-        # 2 - On traite point par point
-        for indp in range(self.nb_edge_pix):
-            tmp_index = self.edge_index[indp]
-            # 2.1 - On cree l'objet dans le format de la couche de sortie
-            outFeature = ogr.Feature(outLayerDefn)
-            # 2.2 - On lui assigne le point
-            point = ogr.Geometry(ogr.wkbPoint)
-            point.AddPoint(self.longitude[tmp_index], self.latitude[tmp_index])
-            outFeature.SetGeometry(point)
-            # 2.3 - On lui assigne les attributs
-            outFeature.SetField(str('edge_index'), int(self.selected_index[tmp_index]))
-            outFeature.SetField(str('edge_label'), int(self.edge_label[indp]))
-            outFeature.SetField(str('edge_loc'), int(self.edge_loc[indp]))
-            outFeature.SetField(str('az_index'), int(self.azimuth_index[tmp_index]))
-            outFeature.SetField(str('classif'), int(self.classif[tmp_index]))
-            outFeature.SetField(str('water_frac'), float(self.water_frac[tmp_index]))
-            outFeature.SetField(str('crosstrack'), float(self.cross_track[tmp_index]))
-            outFeature.SetField(str('pixel_area'), float(self.pixel_area[tmp_index]))
-            outFeature.SetField(str('height'), float(self.height[tmp_index]))
-            outFeature.SetField(str('nadir_t'), float(self.nadir_time[tmp_index]))
-            outFeature.SetField(str('nadir_long'), float(self.nadir_longitude[tmp_index]))
-            outFeature.SetField(str('nadir_lat'), float(self.nadir_latitude[tmp_index]))
-            # 2.4 - On ajoute l'objet dans la couche de sortie
-            outLayer.CreateFeature(outFeature)
-
-        # 3 - Destroy the data sources to free resources
-        outDataSource.Destroy()
+        edge_pix = self.edge_index
+        my_shp.write_points_file(in_filename, self.longitude[edge_pix], self.latitude[edge_pix],
+                                 [('edge_index', ogr.OFTInteger, None, None, self.selected_index[edge_pix]),
+                                  ('edge_label', ogr.OFTInteger, None, None, self.edge_label),
+                                  ('edge_loc', ogr.OFTInteger, None, None, self.edge_loc),
+                                  ('az_index', ogr.OFTInteger, None, None, self.azimuth_index[edge_pix]),
+                                  ('r_index', ogr.OFTInteger, None, None, self.range_index[edge_pix]),
+                                  ('classif', ogr.OFTInteger, None, None, self.classif[edge_pix]),
+                                  ('water_frac', ogr.OFTReal, 10, 6, self.water_frac[edge_pix]),
+                                  ('crosstrack', ogr.OFTReal, 12, 4, self.cross_track[edge_pix]),
+                                  ('pixel_area', ogr.OFTReal, 12, 6, self.pixel_area[edge_pix]),
+                                  ('height', ogr.OFTReal, 12, 4, self.height[edge_pix]),
+                                  ('nadir_t', ogr.OFTReal, 13, 3, self.nadir_time[edge_pix]),
+                                  ('nadir_long', ogr.OFTReal, 10, 6, self.nadir_longitude[edge_pix]),
+                                  ('nadir_lat', ogr.OFTReal, 10, 6, self.nadir_latitude[edge_pix])],
+                                 in_layer_name=str(os.path.basename(in_filename)).replace('.shp', ''))
@@ -12,12 +12,12 @@ import lib.height_model as height_model
 import lib.my_api as my_api
 
 
-def dark_water_simulation(dlat, latmin, latmax, dlon, lonmin, lonmax, pourcent_dw, seedvalue):
+def dark_water_simulation(dlat, latmin, latmax, dlon, lonmin, lonmax, pourcent_dw, seedvalue, rng=None):
     
     # Create a 2D gaussian profile
     #if seedvalue is not None:
     #    np.random.seed(int(seedvalue))
-    profile_2d = height_model.generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, 1, plot = False, lcorr = 50, seed = seedvalue)
+    profile_2d = height_model.generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, 1, plot = False, lcorr = 50, seed = seedvalue, rng = rng)
     
     ### Create Dark water mask
     # Define the threshold value to keep the desired % of dark water
@@ -56,39 +56,29 @@ def dark_water_randomerase(mask_dw, water_pixmatrix, taille_2D, seedvalue=None):
     return mask_dw, water_pixmatrix
 
 
-def dark_water_non_detected_simulation(mask_dw, dlat, latmin, latmax, dlon, lonmin, lonmax,percent_detected_dw,seedvalue):
+def dark_water_non_detected_simulation(mask_dw, dlat, latmin, latmax, dlon, lonmin, lonmax,percent_detected_dw,seedvalue, rng=None):
     # label dark water regions
-    mask_regions=label(mask_dw)
-    region_list=[i for i in range(1,np.max(mask_regions+1))]
+    mask_regions, nb_regions = label(mask_dw, return_num=True)
 
-    #initialize the array of non detected dark water mask
-    non_detected_dw_mask=np.zeros(mask_dw.shape)
-    #set the value to a number different from the generated 2D profile value
-    non_detected_dw_mask.fill(-999)
-    
     # test if at least one region is present
-    if len(region_list)>0 :
-        for i in region_list :
-            #Locate the pixels corresponding to the region i
-            region_ind = np.where(mask_regions==i)
-            # Get the bounding lines and columns of the region
-            minx, maxx, miny, maxy = min(region_ind[0]),max(region_ind[0]),min(region_ind[1]),max(region_ind[1])
-            size_y = maxy-miny+1
-            size_x=maxx-minx+1
-
-            #Simulate non detected dark water
-            profile_2d = height_model.generate_2d_profile_gaussian(1, minx, maxx+1, 1, miny, maxy+1,1, plot = False, lcorr = 50, seed = seedvalue)
-            
-            profile_2d[np.where(mask_regions[minx:maxx+1,miny:maxy+1]!=i)]=-999
-            non_detected_dw_mask[minx:maxx+1,miny:maxy+1]=profile_2d
+    if nb_regions > 0 :
+        # Simulate non detected dark water with a single 2D profile over the whole mask
+        profile_2d = height_model.generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, 1, plot = False, lcorr = 50, seed = seedvalue, rng = rng)
+        in_region = mask_regions > 0
         # Define the threshold value to keep the percentage of non_detected dark water inside detected dark_water regions
-        threshold_value=np.percentile(non_detected_dw_mask[np.where(non_detected_dw_mask>-999)],percent_detected_dw)
-        ind_inf_threshold=np.where(non_detected_dw_mask<=threshold_value)
-        non_detected_dw_mask[np.where(non_detected_dw_mask>threshold_value)]=1
-        non_detected_dw_mask[ind_inf_threshold]=0
-        mask_dw=mask_dw+non_detected_dw_mask
+        threshold_value = np.percentile(profile_2d[in_region], percent_detected_dw)
+        non_detected_dw_mask = np.logical_and(in_region, profile_2d > threshold_value)
+        
+        # Statistics per region
+        nb_pix_per_region = np.bincount(mask_regions.ravel(), minlength=nb_regions+1)[1:]
+        nb_non_detected_per_region = np.bincount(mask_regions[non_detected_dw_mask], minlength=nb_regions+1)[1:]
+        my_api.printDebug("Dark water regions : %d ; fully non detected : %d ; partially non detected : %d" % (nb_regions, \
+                          np.count_nonzero(nb_non_detected_per_region == nb_pix_per_region), \
+                          np.count_nonzero(np.logical_and(nb_non_detected_per_region > 0, nb_non_detected_per_region < nb_pix_per_region))))
+        
+        mask_dw = mask_dw + non_detected_dw_mask
         non_detected_dw_mask = None 
-        mask_regions= None
+        mask_regions = None
 
     return mask_dw
 
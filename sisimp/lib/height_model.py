@@ -33,7 +33,8 @@ def generate_1d_profile(taille_1D, hmean, hdev, l, plot=False):
         plt.plot(hh)
         plt.show()
 
-def generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, height_model_stdv, plot=False, lcorr = 500, seed = None):
+def generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, height_model_stdv, plot=False, lcorr = 500, seed = None, rng = None):
+    # rng = random generator (cf. lib.my_rng); if None, the global numpy generator is used, seeded by seed if set
 
     
     Nx = int((latmax-latmin)/dlat)
@@ -49,13 +50,15 @@ def generate_2d_profile_gaussian(dlat, latmin, latmax, dlon, lonmin, lonmax, hei
     if Ny < ly+10:
         Ny = ly+10      
         
-    if seed is not None:
-        np.random.seed(int(seed))
+    if rng is None:
+        if seed is not None:
+            np.random.seed(int(seed))
+        rng = np.random
     kx = np.fft.fftfreq(Nx, d=dlat)
     ky = np.fft.rfftfreq(Ny, d=dlon)
     
-    hij_real = np.random.normal(0., height_model_stdv/np.sqrt(2), (len(kx),len(ky)))
-    hij_imag = np.random.normal(0., height_model_stdv/np.sqrt(2), (len(kx),len(ky)))
+    hij_real = rng.normal(0., height_model_stdv/np.sqrt(2), (len(kx),len(ky)))
+    hij_imag = rng.normal(0., height_model_stdv/np.sqrt(2), (len(kx),len(ky)))
 
     hij = hij_real + 1j*hij_imag
     
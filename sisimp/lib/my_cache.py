@@ -0,0 +1,113 @@
+# -*- coding: utf8 -*-
+'''
+.. module my_cache.py
+    :synopsis: Binary cache of arrays computed from input files (text tables, orbits, ...)
+    Cached arrays are stored as .npz files, whose name contains a key built from the cache version
+    and the hash of the inputs; a modified input file thus gives a new cache file.
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+import lib.my_api as my_api
+
+
+CACHE_VERSION = 1  # To increment each time the content of a cached structure changes
+
+
+def compute_file_hash(IN_file):
+    '''
+    Compute the SHA-1 hash of the content of a file
+
+    :param IN_file: full path of the file
+    :type IN_file: string
+
+    :return: hexadecimal hash
+    :rtype: string
+    '''
+    sha = hashlib.sha1()
+    with open(IN_file, "rb") as file_in:
+        for block in iter(lambda: file_in.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def compute_key(*IN_items):
+    '''
+    Compute a cache key from a list of items (strings, numbers or numpy arrays)
+
+    :param IN_items: items identifying the cached content
+    :type IN_items: list
+
+    :return: hexadecimal key
+    :rtype: string
+    '''
+    sha = hashlib.sha1(str(CACHE_VERSION).encode())
+    for item in IN_items:
+        if isinstance(item, np.ndarray):
+            sha.update(str(item.dtype).encode())
+            sha.update(str(item.shape).encode())
+            sha.update(np.ascontiguousarray(item).tobytes())
+        else:
+            sha.update(repr(item).encode())
+        sha.update(b"|")
+    return sha.hexdigest()
+
+
+def get_cached_arrays(IN_cache_dir, IN_name, IN_key, IN_compute_function):
+    '''
+    Get arrays from the cache; compute and store them if they are not in the cache yet
+
+    :param IN_cache_dir: cache directory (if None, no cache is used)
+    :type IN_cache_dir: string
+    :param IN_name: name of the cached structure (prefix of the cache file)
+    :type IN_name: string
+    :param IN_key: key of the cached content (cf. compute_key)
+    :type IN_key: string
+    :param IN_compute_function: function without argument computing the arrays if not in cache
+    :type IN_compute_function: function returning a dict of numpy arrays
+
+    :return: arrays
+    :rtype: dict of numpy arrays
+    '''
+    if IN_cache_dir is None:
+        return IN_compute_function()
+
+    cache_file = os.path.join(IN_cache_dir, "%s_%s.npz" % (IN_name, IN_key[:20]))
+
+    # 1 - Read arrays from cache if available
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as data:
+                OUT_arrays = {name: data[name] for name in data.files}
+            my_api.printDebug("[my_cache] %s read from cache %s" % (IN_name, cache_file))
+            return OUT_arrays
+        except (IOError, ValueError, KeyError) as exc:
+            my_api.printInfo("[my_cache] Unable to read cache file %s (%s); recompute it" % (cache_file, str(exc)))
+
+    # 2 - Compute arrays
+    OUT_arrays = IN_compute_function()
+
+    # 3 - Store them in cache (written in a temporary file first, so that concurrent processes never read a partial file)
+    try:
+        os.makedirs(IN_cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(suffix=".npz", dir=IN_cache_dir)
+        with os.fdopen(fd, "wb") as file_out:
+            np.savez(file_out, **OUT_arrays)
+        os.replace(tmp_file, cache_file)
+        my_api.printDebug("[my_cache] %s stored in cache %s" % (IN_name, cache_file))
+    except (IOError, OSError) as exc:
+        my_api.printInfo("[my_cache] Unable to write cache file %s (%s)" % (cache_file, str(exc)))
+
+    return OUT_arrays
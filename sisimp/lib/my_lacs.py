@@ -3,24 +3,24 @@ import numpy as np
 import lib.my_api as my_api
 import lib.height_model as height_model
 import lib.true_height_model as true_height_model
+import lib.my_proj as my_proj
 import scipy
-import time
-import pyproj
-import utm
 
-from lib.my_variables import COEFF_X2, COEFF_Y2, COEFF_X, COEFF_Y, COEFF_XY, COEFF_CST, FACT_ECHELLE
+from lib.my_variables import COEFF_X2, COEFF_Y2, COEFF_X, COEFF_Y, COEFF_XY, COEFF_CST, FACT_ECHELLE, \
+        HEIGHT_MODEL_LCORR, HEIGHT_MODEL_MIN_CELLS_LCORR
 
 
 class Lac:
 
-    def __init__(self, num):
+    def __init__(self, num, rng=None):
         
         self.num = num
-        self.seed = int(str(time.time()).split('.')[1])
+        # Random generator of the water body (cf. lib.my_rng)
+        self.rng = rng
+        if self.rng is None:
+            self.rng = np.random
         self.hmean = None
         
-    def compute_pixels_in_given_lac(self, OUT_ind_lac_data):
-        self.pixels = np.where(OUT_ind_lac_data == self.num)        
     def set_hmean(self, hmean):
         self.hmean = hmean
         
@@ -69,8 +69,8 @@ class Reference_height_Lac(Lac):
         
 class Gaussian_Lac(Lac):
     
-    def __init__(self, num, IN_attributes, lat, lon, IN_cycle_number):
-        Lac.__init__(self, num)
+    def __init__(self, num, IN_attributes, lat, lon, IN_cycle_number, rng=None):
+        Lac.__init__(self, num, rng)
         self.height_model_a = IN_attributes.height_model_a
         self.lat_init = IN_attributes.lat_init[1:-1]
         self.cycle_number = IN_cycle_number
@@ -92,7 +92,30 @@ class Gaussian_Lac(Lac):
 
         taille_lon, taille_lat = np.int((lonmax-lonmin)/self.dlon), np.int((latmax-latmin)/self.dlat)
         
-        self.height = height_model.generate_2d_profile_gaussian(self.dlat, latmin, latmax, self.dlon, lonmin, lonmax, self.height_model_stdv, seed = self.seed)
+        # The height field is band-limited (no wavelength shorter than the correlation length), so for big lakes
+        # it is generated on a coarser grid, with the same statistics, to keep the grid under height_model_max_cells
+        fact_grid = 1
+        max_cells = IN_attributes.height_model_max_cells
+        if taille_lon * taille_lat > max_cells:
+            # Each dimension keeps at least 4 cells (for the spline), the grid being enlarged if needed:
+            # the coarsening factor is computed from the size of the coarse grid over both dimensions
+            fact_grid = int(max(np.ceil(np.sqrt(taille_lon * taille_lat / max_cells)), np.ceil(4. * taille_lon / max_cells), np.ceil(4. * taille_lat / max_cells)))
+            while max(taille_lon//fact_grid, 4) * max(taille_lat//fact_grid, 4) > max_cells:
+                fact_grid += 1
+            if HEIGHT_MODEL_LCORR / fact_grid < HEIGHT_MODEL_MIN_CELLS_LCORR:
+                my_api.printInfo("[my_lacs] WARNING: gaussian height field of lake %d has only %.1f cells per correlation length" % (self.num, HEIGHT_MODEL_LCORR / fact_grid))
+            self.dlon *= fact_grid
+            self.dlat *= fact_grid
+            taille_lon, taille_lat = int((lonmax-lonmin)/self.dlon), int((latmax-latmin)/self.dlat)
+            if taille_lon < 4:
+                lonmax = lonmin + 4.5*self.dlon
+                taille_lon = 4
+            if taille_lat < 4:
+                latmax = latmin + 4.5*self.dlat
+                taille_lat = 4
+            my_api.printInfo("[my_lacs] Gaussian height field of lake %d generated on a %d x %d grid (step = %.1e rad)" % (self.num, taille_lat, taille_lon, self.dlat))
+        
+        self.height = height_model.generate_2d_profile_gaussian(self.dlat, latmin, latmax, self.dlon, lonmin, lonmax, self.height_model_stdv, lcorr = HEIGHT_MODEL_LCORR/fact_grid, rng = self.rng)
         print("gaussian min height",np.min(self.height))
         print("gaussian max height",np.max(self.height))
         
@@ -112,8 +135,8 @@ class Gaussian_Lac(Lac):
                 
 class Polynomial_Lac(Lac):
     
-    def __init__(self, num, IN_attributes, lat, lon, IN_cycle_number):
-        Lac.__init__(self, num)
+    def __init__(self, num, IN_attributes, lat, lon, IN_cycle_number, rng=None):
+        Lac.__init__(self, num, rng)
         self.height_model_a = IN_attributes.height_model_a
         self.lat_init = IN_attributes.lat_init[1:-1]
         self.cycle_number = IN_cycle_number
@@ -125,19 +148,17 @@ class Polynomial_Lac(Lac):
         self.time = math_fct.linear_extrap(lat, self.lat_init, IN_attributes.orbit_time)
         self.mode = 'orbit_time'
     
-        x_c, y_c, zone_number, zone_letter = utm.from_latlon(lat[0], lon[0])
-        # Convert pixel cloud to UTM (zone of the centroid)
-        self.latlon = pyproj.Proj(init="epsg:4326")
-        self.utm_proj = pyproj.Proj("+proj=utm +zone={}{} +ellps=WGS84 +datum=WGS84 +units=m +no_defs".format(zone_number, zone_letter))
-        X, Y = pyproj.transform(self.latlon, self.utm_proj, lon, lat)                    
-        k0 = np.random.randint(len(lat))
+        # Convert pixel cloud to UTM (zone of the 1st point)
+        self.zone_number = my_proj.get_utm_zone(lon[0], lat[0])
+        X, Y = my_proj.lonlat_to_utm(lon, lat, self.zone_number)
+        k0 = int(self.rng.uniform(0, len(lat)))
         self.X0, self.Y0 = X[k0], Y[k0]
-        self.COEFF_X2 = np.random.random(1)[0] * COEFF_X2
-        self.COEFF_Y2 = np.random.random(1)[0] * COEFF_Y2
-        self.COEFF_X = np.random.random(1)[0] * COEFF_X
-        self.COEFF_Y = np.random.random(1)[0] * COEFF_Y       
-        self.COEFF_XY = np.random.random(1)[0] * COEFF_XY
-        self.COEFF_CST = np.random.random(1)[0] * COEFF_CST      
+        self.COEFF_X2 = self.rng.random(1)[0] * COEFF_X2
+        self.COEFF_Y2 = self.rng.random(1)[0] * COEFF_Y2
+        self.COEFF_X = self.rng.random(1)[0] * COEFF_X
+        self.COEFF_Y = self.rng.random(1)[0] * COEFF_Y       
+        self.COEFF_XY = self.rng.random(1)[0] * COEFF_XY
+        self.COEFF_CST = self.rng.random(1)[0] * COEFF_CST      
         
     def compute_h(self, lat, lon):
     
@@ -149,7 +170,7 @@ class Polynomial_Lac(Lac):
             self.mode = 'az' 
                         
         h0 = np.mean(self.height_model_a * np.sin(2*np.pi * (self.time + self.cycle_number * self.cycle_duration) - self.height_model_t0) / self.height_model_period)
-        X, Y = pyproj.transform(self.latlon, self.utm_proj, lon, lat)
+        X, Y = my_proj.lonlat_to_utm(lon, lat, self.zone_number)
         height_water = height_model.generate_2d_profile_2nd_order_list(self.X0, self.Y0, X, Y, self.COEFF_X2, self.COEFF_Y2, self.COEFF_X, self.COEFF_Y, self.COEFF_XY, self.COEFF_CST)
 
         return h0 + height_water
@@ -307,7 +307,7 @@ class myNcWriter():
             
     #----------------------------------------          
         
-    def add_variable(self, IN_name, IN_datatype, IN_dimensions, IN_fill_value = None, IN_compress = True, group = None):
+    def add_variable(self, IN_name, IN_datatype, IN_dimensions, IN_fill_value = None, IN_compress = True, group = None, IN_chunksizes = None):
         '''
         Add the data content of the variable
         
@@ -321,11 +321,13 @@ class myNcWriter():
         :type IN_fill_value: int or float
         :param IN_compress: true to compress the content of the variable (save disk space), else false
         :type IN_compress: boolean
+        :param IN_chunksizes: size of the chunks of the variable along each dimension (default = chosen by the NetCDF library)
+        :type IN_chunksizes: tuple of int
         '''
         if group == None:
-            self.content.createVariable(IN_name, IN_datatype, IN_dimensions, IN_compress, 4, fill_value = IN_fill_value)
+            self.content.createVariable(IN_name, IN_datatype, IN_dimensions, zlib = IN_compress, complevel = 4, fill_value = IN_fill_value, chunksizes = IN_chunksizes)
         else:
-            group.createVariable(IN_name, IN_datatype, IN_dimensions, IN_compress, 4, fill_value = IN_fill_value)
+            group.createVariable(IN_name, IN_datatype, IN_dimensions, zlib = IN_compress, complevel = 4, fill_value = IN_fill_value, chunksizes = IN_chunksizes)
         
     def add_variable_attribute(self, IN_varname, IN_attname, IN_value, group = None):
         '''
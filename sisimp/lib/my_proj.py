@@ -0,0 +1,111 @@
+# -*- coding: utf8 -*-
+'''
+.. module my_proj.py
+    :synopsis: Coordinate transformations with cached pyproj objects
+    Building pyproj objects is expensive (projection database lookups), so each transformation
+    is built once per process and reused for all the polygons and water bodies.
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import functools
+import numpy as np
+import pyproj
+import utm
+
+
+LATLON_CRS = "epsg:4326"  # WGS84 lon-lat
+
+
+@functools.lru_cache(maxsize=None)
+def get_transform_function(IN_src_crs, IN_dst_crs):
+    '''
+    Get the function transforming coordinates from IN_src_crs to IN_dst_crs (built at the first call, then cached)
+
+    :param IN_src_crs: source CRS (PROJ string or "epsg:<code>")
+    :type IN_src_crs: string
+    :param IN_dst_crs: destination CRS (PROJ string or "epsg:<code>")
+    :type IN_dst_crs: string
+
+    :return: function (x, y) -> (x, y), x being the longitude for geographic CRS
+    :rtype: function
+    '''
+    if hasattr(pyproj, "Transformer"):  # pyproj >= 2.1
+        return pyproj.Transformer.from_crs(IN_src_crs, IN_dst_crs, always_xy=True).transform
+
+    def build_proj(IN_crs):
+        if IN_crs.lower().startswith("epsg:"):
+            return pyproj.Proj(init=IN_crs)
+        return pyproj.Proj(IN_crs)
+    return functools.partial(pyproj.transform, build_proj(IN_src_crs), build_proj(IN_dst_crs))
+
+
+def get_utm_crs(IN_zone_number):
+    '''
+    Get the PROJ string of a UTM zone (northern hemisphere convention, as the former "+zone=<number><letter>"
+    strings, whose letter was ignored by PROJ 4 and is rejected by recent PROJ versions)
+
+    :param IN_zone_number: UTM zone number
+    :type IN_zone_number: int
+
+    :return: PROJ string
+    :rtype: string
+    '''
+    return "+proj=utm +zone={} +ellps=WGS84 +datum=WGS84 +units=m +no_defs".format(IN_zone_number)
+
+
+def get_utm_zone(IN_lon, IN_lat):
+    '''
+    Get the UTM zone of a point
+
+    :param IN_lon: longitude of the point (in degrees)
+    :type IN_lon: float
+    :param IN_lat: latitude of the point (in degrees)
+    :type IN_lat: float
+
+    :return: zone number
+    :rtype: int
+    '''
+    x_c, y_c, zone_number, zone_letter = utm.from_latlon(IN_lat, IN_lon)
+    return zone_number
+
+
+def lonlat_to_utm(IN_lon, IN_lat, IN_zone_number):
+    '''
+    Convert lon-lat coordinates to UTM coordinates in a given zone, in a single call for all the points
+
+    :param IN_lon: longitudes (in degrees)
+    :type IN_lon: 1D-array of float
+    :param IN_lat: latitudes (in degrees)
+    :type IN_lat: 1D-array of float
+    :param IN_zone_number: UTM zone number
+    :type IN_zone_number: int
+
+    :return: UTM easting and northing (in meters)
+    :rtype: tuple of 1D-array of float
+    '''
+    transform = get_transform_function(LATLON_CRS, get_utm_crs(IN_zone_number))
+    OUT_x, OUT_y = transform(np.asarray(IN_lon, dtype=np.float64), np.asarray(IN_lat, dtype=np.float64))
+    return OUT_x, OUT_y
+
+
+def compute_ring_area(IN_x, IN_y):
+    '''
+    Compute the area of a ring with the shoelace formula
+
+    :param IN_x: X coordinates of the vertices
+    :type IN_x: 1D-array of float
+    :param IN_y: Y coordinates of the vertices
+    :type IN_y: 1D-array of float
+
+    :return: area (in squared units of the coordinates)
+    :rtype: float
+    '''
+    return 0.5 * np.abs(np.dot(IN_x, np.roll(IN_y, -1)) - np.dot(IN_y, np.roll(IN_x, -1)))
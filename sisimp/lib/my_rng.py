@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+'''
+.. module my_rng.py
+    :synopsis: Independent streams of random numbers for the simulation
+    Each stream is identified by the main seed of the simulation, the (cycle, pass, swath) unit, the purpose
+    of the random values and an index (water body number, tile number, ...).
+    Any part of a simulation can thus be recomputed alone, in any order or process, with the same random values.
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+
+# Code of each purpose of random values (never change an existing code, it would change the simulations)
+PURPOSES = {"orbit_jitter": 1,  # Orbit jitter, per pass
+            "lake_height": 2,  # Height model of a water body (gaussian, polynomial), per water body
+            "dark_water": 3,  # Dark water mask, per tile
+            "dark_water_non_detected": 4,  # Non-detected dark water mask, per tile
+            "height_noise": 5,  # Height noise of each pixel, per tile
+            "height_bias": 6}  # Height bias, per swath (shared by all the along-track chunks)
+
+# Code of each swath (0 = whole pass)
+SWATHS = {None: 0, "left": 1, "right": 2}
+
+
+def draw_main_seed():
+    '''
+    Draw a main seed from the system entropy, for simulations without user-defined seed
+
+    :return: main seed
+    :rtype: int
+    '''
+    return int(np.random.SeedSequence().generate_state(1)[0] >> 1)
+
+
+def get_seed_sequence(IN_random_seed, IN_cycle_number, IN_orbit_number, IN_swath, IN_purpose, IN_index=0):
+    '''
+    Get the seed sequence of a stream of random numbers
+
+    :param IN_random_seed: main seed of the simulation (if None, the stream is not reproducible)
+    :type IN_random_seed: int
+    :param IN_cycle_number: cycle number
+    :type IN_cycle_number: int
+    :param IN_orbit_number: orbit number
+    :type IN_orbit_number: int
+    :param IN_swath: Left or Right swath; None for values shared by both swaths of the pass
+    :type IN_swath: string
+    :param IN_purpose: purpose of the random values (key of PURPOSES)
+    :type IN_purpose: string
+    :param IN_index: index of the stream for this purpose (water body number, tile number, ...)
+    :type IN_index: int
+
+    :return: seed sequence
+    :rtype: numpy.random.SeedSequence
+    '''
+    swath_code = SWATHS[None if IN_swath is None else IN_swath.lower()]
+    spawn_key = (int(IN_cycle_number), int(IN_orbit_number), swath_code, PURPOSES[IN_purpose], int(IN_index))
+    entropy = None if IN_random_seed is None else int(IN_random_seed)
+    return np.random.SeedSequence(entropy=entropy, spawn_key=spawn_key)
+
+
+def get_generator(IN_random_seed, IN_cycle_number, IN_orbit_number, IN_swath, IN_purpose, IN_index=0):
+    '''
+    Get the generator of a stream of random numbers (cf. get_seed_sequence for the parameters)
+
+    :return: random generator
+    :rtype: numpy.random.Generator
+    '''
+    return np.random.Generator(np.random.PCG64(get_seed_sequence(IN_random_seed, IN_cycle_number, IN_orbit_number, IN_swath, IN_purpose, IN_index)))
@@ -0,0 +1,208 @@
+# -*- coding: utf8 -*-
+'''
+.. module my_shp_file.py
+    :synopsis: Deals with vector files (shapefile, GeoPackage, FlatGeobuf)
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import os
+from osgeo import ogr, osr
+
+
+# OGR driver associated to each vector file extension
+VECTOR_DRIVERS = {".shp": "ESRI Shapefile",
+                  ".gpkg": "GPKG",
+                  ".fgb": "FlatGeobuf"}
+
+# Number of features written per transaction
+NB_FEATURES_PER_TRANSACTION = 100000
+
+
+def write_points_file(IN_output_file, IN_lon, IN_lat, IN_fields, IN_layer_name=None):
+    '''
+    Write a point layer from 1D-arrays, in a vector file whose format depends on the extension of IN_output_file
+    (.shp = ESRI Shapefile, .gpkg = GeoPackage, .fgb = FlatGeobuf)
+
+    Values are converted from numpy in a single pass per field, and features are written in transactions,
+    reusing the same feature and geometry objects.
+
+    :param IN_output_file: output full path (deleted first if it already exists)
+    :type IN_output_file: string
+    :param IN_lon: longitude of the points
+    :type IN_lon: 1D-array of float
+    :param IN_lat: latitude of the points
+    :type IN_lat: 1D-array of float
+    :param IN_fields: fields of the layer, as (name, OGR type, width, precision, values) tuples;
+                        width and precision are set only if not None
+    :type IN_fields: list of tuple
+    :param IN_layer_name: name of the layer (default = basename of IN_output_file without extension)
+    :type IN_layer_name: string
+    '''
+
+    # 1 - Init output file
+    # 1.1 - Driver
+    extension = os.path.splitext(IN_output_file)[1].lower()
+    if extension not in VECTOR_DRIVERS:
+        raise ValueError("write_points_file: unknown vector file extension %s (must be in %s)" % (extension, ", ".join(sorted(VECTOR_DRIVERS))))
+    driver = ogr.GetDriverByName(str(VECTOR_DRIVERS[extension]))
+    if driver is None:
+        raise RuntimeError("write_points_file: OGR driver %s not available" % VECTOR_DRIVERS[extension])
+    # 1.2 - Create file
+    if os.path.exists(IN_output_file):
+        driver.DeleteDataSource(IN_output_file)
+    data_source = driver.CreateDataSource(IN_output_file)
+    # 1.3 - Create layer
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)  # WGS84
+    if IN_layer_name is None:
+        IN_layer_name = os.path.basename(IN_output_file).split('.')[0]
+    layer = data_source.CreateLayer(str(IN_layer_name), srs, geom_type=ogr.wkbPoint)
+    # 1.4 - Create fields
+    for name, field_type, width, precision, values in IN_fields:
+        field_defn = ogr.FieldDefn(str(name), field_type)
+        if width is not None:
+            field_defn.SetWidth(width)
+        if precision is not None:
+            field_defn.SetPrecision(precision)
+        layer.CreateField(field_defn)
+    layer_defn = layer.GetLayerDefn()
+
+    # 2 - Convert values to Python lists once (much faster than per-element conversion of numpy scalars)
+    lon_list = np.asarray(IN_lon, dtype=np.float64).tolist()
+    lat_list = np.asarray(IN_lat, dtype=np.float64).tolist()
+    field_lists = []
+    for name, field_type, width, precision, values in IN_fields:
+        if field_type == ogr.OFTInteger:
+            field_lists.append(np.asarray(values).astype(np.int64).tolist())
+        elif field_type == ogr.OFTReal:
+            field_lists.append(np.asarray(values, dtype=np.float64).tolist())
+        else:
+            field_lists.append([str(val) for val in values])
+    ind_fields = range(len(field_lists))
+
+    # 3 - Write features, reusing the same objects, in transactions
+    feature = ogr.Feature(layer_defn)
+    point = ogr.Geometry(ogr.wkbPoint)
+    layer.StartTransaction()
+    for indp in range(len(lon_list)):
+        point.SetPoint_2D(0, lon_list[indp], lat_list[indp])
+        feature.SetGeometry(point)
+        for indf in ind_fields:
+            feature.SetField(indf, field_lists[indf][indp])
+        feature.SetFID(-1)
+        layer.CreateFeature(feature)
+        if (indp+1) % NB_FEATURES_PER_TRANSACTION == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+    layer.CommitTransaction()
+
+    # 4 - Close file
+    data_source.Destroy()
+
+
+def make_polygon(IN_lon, IN_lat):
+    '''
+    Make a single-ring polygon from the 1D-arrays of its vertices; the ring is closed if needed
+
+    :param IN_lon: longitude of the vertices
+    :type IN_lon: 1D-array of float
+    :param IN_lat: latitude of the vertices
+    :type IN_lat: 1D-array of float
+
+    :return: polygon
+    :rtype: OGR geometry
+    '''
+    return make_polygon_from_rings([(IN_lon, IN_lat)])
+
+
+def make_polygon_from_rings(IN_rings):
+    '''
+    Make a polygon from the 1D-arrays of the vertices of its rings; each ring is closed if needed
+
+    The WKB representation of the polygon is built directly from the arrays, instead of adding the points one by one.
+
+    :param IN_rings: (X, Y) coordinates of the vertices of each ring
+    :type IN_rings: list of tuple of 1D-array of float
+
+    :return: polygon
+    :rtype: OGR geometry
+    '''
+    # WKB = little endian flag, geometry type (3 = polygon), number of rings, 
+    # then for each ring: number of points and (x, y) doubles
+    wkb = [b"\x01", np.array([3, len(IN_rings)], dtype="<u4").tobytes()]
+    for ring_x, ring_y in IN_rings:
+        ring = np.column_stack((ring_x, ring_y)).astype("<f8")
+        if ring.shape[0] != 0 and not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack((ring, ring[:1]))
+        wkb.append(np.array([ring.shape[0]], dtype="<u4").tobytes())
+        wkb.append(ring.tobytes())
+    return ogr.CreateGeometryFromWkb(b"".join(wkb))
+
+
+def get_polygon_rings(IN_geom):
+    '''
+    Get the vertices of all the rings of a polygon or multipolygon, parsed from its WKB representation
+    (other geometry types have no ring)
+
+    :param IN_geom: polygon or multipolygon
+    :type IN_geom: OGR geometry
+
+    :return: (X, Y) coordinates of the vertices of each ring
+    :rtype: list of 2D-array of float (nb_points, 2)
+    '''
+    OUT_rings = []
+    if IN_geom is not None:
+        parse_wkb_rings(bytes(IN_geom.ExportToWkb(ogr.wkbNDR)), 0, OUT_rings)
+    return OUT_rings
+
+
+def parse_wkb_rings(IN_wkb, IN_offset, OUT_rings):
+    '''
+    Parse the rings of the (multi)polygon starting at IN_offset in a WKB buffer
+
+    :param IN_wkb: WKB buffer
+    :type IN_wkb: bytes
+    :param IN_offset: offset of the geometry in the buffer
+    :type IN_offset: int
+    :param OUT_rings: list to which the (nb_points, 2) arrays of the rings are appended
+    :type OUT_rings: list
+
+    :return: offset of the end of the geometry in the buffer (None for unsupported geometry types)
+    :rtype: int
+    '''
+    dtype_uint = "<u4" if IN_wkb[IN_offset] == 1 else ">u4"
+    dtype_float = "<f8" if IN_wkb[IN_offset] == 1 else ">f8"
+    wkb_type = int(np.frombuffer(IN_wkb, dtype=dtype_uint, count=1, offset=IN_offset+1)[0])
+    offset = IN_offset + 5
+    # Geometry type and dimension (Z flag of OGC 2.5D variant, or ISO 1000/2000/3000 codes for Z/M/ZM)
+    base_type = (wkb_type & 0x0FFFFFFF) % 1000
+    nb_dim = 2 + [0, 1, 1, 2][((wkb_type & 0x0FFFFFFF) // 1000) % 4] + int(bool(wkb_type & 0x80000000))
+    
+    if base_type == 3:  # Polygon
+        nb_rings = int(np.frombuffer(IN_wkb, dtype=dtype_uint, count=1, offset=offset)[0])
+        offset += 4
+        for ind_ring in range(nb_rings):
+            nb_points = int(np.frombuffer(IN_wkb, dtype=dtype_uint, count=1, offset=offset)[0])
+            offset += 4
+            coords = np.frombuffer(IN_wkb, dtype=dtype_float, count=nb_points*nb_dim, offset=offset).reshape(nb_points, nb_dim)
+            OUT_rings.append(coords[:, :2].astype(np.float64))
+            offset += 8 * nb_points * nb_dim
+        return offset
+    
+    if base_type == 6:  # MultiPolygon
+        nb_geoms = int(np.frombuffer(IN_wkb, dtype=dtype_uint, count=1, offset=offset)[0])
+        offset += 4
+        for ind_geom in range(nb_geoms):
+            offset = parse_wkb_rings(IN_wkb, offset, OUT_rings)
+        return offset
+    
+    return None
@@ -142,9 +142,8 @@ def computeBinMat(IN_sizeX, IN_sizeY, IN_X, IN_Y):
     OUT_binIm = np.zeros((IN_sizeY, IN_sizeX))
     my_api.printDebug("> Binary matrix size = (X=%d , Y=%d)" % ( IN_sizeX , IN_sizeY ))
         
-    # 2 - Put 1 for every pixels defined by the input vectors
-    for ind in range(nb_pts): 
-        OUT_binIm[IN_Y[ind], IN_X[ind]] = 1
+    # 2 - Put 1 for every pixels defined by the input vectors (in a single fancy-indexing assignment)
+    OUT_binIm[IN_Y, IN_X] = 1
     
     return OUT_binIm
         
@@ -187,18 +186,42 @@ def convert2dMatIn1dVec(IN_X, IN_Y, IN_mat):
     '''
     my_api.printDebug("[my_tools] == convert2dMatIn1dVec ==")
     
-    # Number of pixels in IN_X
-    nb_pix = IN_X.size
-    # Init output vector (same size of input IN_X and IN_Y)   
-    OUT_vector = np.zeros(nb_pix)
-    # Fill the output vector
-    for indp in range(nb_pix):
-        OUT_vector[indp] = IN_mat[IN_Y[indp], IN_X[indp]]
+    # Read all the values in a single fancy-indexing operation (output vector as float, same size of input IN_X and IN_Y)
+    OUT_vector = np.asarray(IN_mat[IN_Y, IN_X], dtype=np.float64)
     
     return OUT_vector
     
 #######################################
 
+def computeGroupIndex(IN_vGroup, IN_nb_groups=0):
+    '''
+    Groups the elements of a 1D vector of group labels, in a single pass
+    i.e. indices of elements with label k are OUT_vInd[OUT_vOffset[k]:OUT_vOffset[k+1]]
+
+    :param IN_vGroup: group label of each element (>= 0)
+    :type IN_vGroup: 1D vector of int
+    :param IN_nb_groups: minimum number of groups (default = max(IN_vGroup)+1)
+    :type IN_nb_groups: int
+
+    :return: indices of elements, sorted by group label (original order kept within a group)
+    :rtype: 1D vector of int
+    :return: offset of each group in OUT_vInd (size = number of groups + 1)
+    :rtype: 1D vector of int
+    '''
+    my_api.printDebug("[my_tools] == computeGroupIndex ==")
+
+    # 1 - Sort elements by group label
+    OUT_vInd = np.argsort(IN_vGroup, kind="mergesort")  # Stable sort
+
+    # 2 - Compute offset of each group from the number of elements per group
+    nb_per_group = np.bincount(IN_vGroup, minlength=IN_nb_groups)
+    OUT_vOffset = np.zeros(nb_per_group.size+1, dtype=np.int64)
+    np.cumsum(nb_per_group, out=OUT_vOffset[1:])
+
+    return OUT_vInd, OUT_vOffset
+
+#######################################
+
 def alpha_shape(IN_coords, IN_alpha):
     '''
     Compute the alpha shape (concave hull) of a set of points.
@@ -229,28 +252,29 @@ def alpha_shape(IN_coords, IN_alpha):
     # 1 - Compute Delaunay triangulation
     tri = Delaunay(IN_coords) # tri = specific object with attributes (cf. https://docs.scipy.org/doc/scipy-0.14.0/reference/generated/scipy.spatial.Delaunay.html)
     
-    # 2 - Loop over triangles
-    list_triangle = []
-    for ia, ib, ic in tri.vertices: # ia, ib, ic = indices of corner points of the triangle
-        pa = IN_coords[ia]
-        pb = IN_coords[ib]
-        pc = IN_coords[ic]
-        # Lengths of sides of triangle
-        a = math.sqrt((pa[0]-pb[0])**2 + (pa[1]-pb[1])**2)
-        b = math.sqrt((pb[0]-pc[0])**2 + (pb[1]-pc[1])**2)
-        c = math.sqrt((pc[0]-pa[0])**2 + (pc[1]-pa[1])**2)
-        # Semiperimeter of triangle
-        s = (a + b + c)/2.0
-        # Area of triangle by Heron's formula
-        area = math.sqrt(s*(s-a)*(s-b)*(s-c))
-        circum_r = 0
-        if ( area != 0 ):
-            circum_r = a*b*c/(4.0*area)
-        # Here's the radius filter
-        if circum_r < 1.0/IN_alpha:
-            gg = [(pa[0], pa[1]),(pb[0], pb[1]),(pc[0], pc[1])]
-            tt = geometry.Polygon(gg)
-            list_triangle.append(tt)    
+    # 2 - Filter triangles, all at once
+    # 2.1 - Coordinates of corner points of each triangle
+    pa = IN_coords[tri.simplices[:, 0]]
+    pb = IN_coords[tri.simplices[:, 1]]
+    pc = IN_coords[tri.simplices[:, 2]]
+    # 2.2 - Lengths of sides of triangles
+    a = np.sqrt((pa[:, 0]-pb[:, 0])**2 + (pa[:, 1]-pb[:, 1])**2)
+    b = np.sqrt((pb[:, 0]-pc[:, 0])**2 + (pb[:, 1]-pc[:, 1])**2)
+    c = np.sqrt((pc[:, 0]-pa[:, 0])**2 + (pc[:, 1]-pa[:, 1])**2)
+    # 2.3 - Semiperimeter of triangles
+    s = (a + b + c)/2.0
+    # 2.4 - Area of triangles by Heron's formula
+    # (for collinear points, rounding errors may give a slightly negative product: such triangles are flat)
+    area = np.sqrt(np.maximum(s*(s-a)*(s-b)*(s-c), 0.))
+    # 2.5 - Circumradius of triangles (0 for flat triangles)
+    circum_r = np.zeros(area.size)
+    ind_ok = np.where(area != 0)[0]
+    circum_r[ind_ok] = a[ind_ok]*b[ind_ok]*c[ind_ok]/(4.0*area[ind_ok])
+    # 2.6 - Here's the radius filter
+    ind_kept = np.where(circum_r < 1.0/IN_alpha)[0]
+    
+    # 3 - Build the kept triangles
+    list_triangle = [geometry.Polygon(corners) for corners in IN_coords[tri.simplices[ind_kept]].tolist()]
     
     return cascaded_union(list_triangle)
     
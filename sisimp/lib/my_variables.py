@@ -34,6 +34,15 @@ HEIGHT_BIAS_STD = 0.1  # Height bias std (m)
 ORBIT_JITTER = 1000  # Orbit jitter (m)
 MULTIPLE_ORBIT = 'yes'
 
+# Parallel processing
+NB_PROC = 1  # Number of processes used to simulate (cycle, pass, swath) units; 1 = sequential processing
+NB_WRITERS = 1  # Number of processes used to write the tile files of a swath; 1 = sequential writing
+AZ_CHUNK_SIZE = 0  # Max number of azimuth indices of a swath processed at once (chunks are aligned on tiles); 0 = whole swath
+
+# Lon-lat to azimuth-range conversion
+AZR_CHUNK_SIZE = 20000  # Max number of points converted at once by azr_from_lonlat (bounds memory use)
+REPROJ_BATCH_SIZE = 1000000  # Number of polygon vertices converted at once by reproject_shapefile
+
 # Height model
 HEIGHT_MODEL = None   # polynomial / gaussian (default)
 HEIGHT_MODEL_MIN_AREA = 100  # Optionnal argument to add complex 2D height model
@@ -63,6 +72,9 @@ DW_DETECTED_NOISE_FACTOR = 5
 # Gaussian parameter for gaussian model
 FACT_ECHELLE = 2.
 HEIGHT_MODEL_STDV = 0.1
+HEIGHT_MODEL_LCORR = 500  # Correlation length of the gaussian height field, in cells of 1e-6 rad
+HEIGHT_MODEL_MAX_CELLS = 4000000  # Max number of cells of the gaussian height field grid of a lake (bounds memory use)
+HEIGHT_MODEL_MIN_CELLS_LCORR = 8  # Number of grid cells per correlation length under which a coarsened grid is logged as too coarse
 
 ## Error models
 
@@ -7,11 +7,28 @@
 
 import netCDF4 as nc
 import numpy
+import os
 import scipy.interpolate
 
 
 deltat=0. # time lag to be applied if reference time or pass number is different from CNES reference. 
 
+# Roll files already read in this process (full path -> (modification time, Roll_module))
+ROLL_CACHE = {}
+
+
+def get_roll_module(In_filename):
+    """
+    Get the Roll_module of a roll file, read only once per process and reused for all passes and cycles
+    """
+    full_path = os.path.abspath(In_filename)
+    if not os.path.exists(full_path):
+        raise IOError("Roll file not found")
+    mtime = os.path.getmtime(full_path)
+    if (full_path not in ROLL_CACHE) or (ROLL_CACHE[full_path][0] != mtime):
+        ROLL_CACHE[full_path] = (mtime, Roll_module(full_path))
+    return ROLL_CACHE[full_path][1]
+
 
 class Roll_module(object):
 
@@ -19,8 +36,8 @@ class Roll_module(object):
         
         try:
             fid = nc.Dataset(In_filename, 'r')
-        except:
-            raise Exception("Roll file not found")
+        except IOError:
+            raise IOError("Roll file not found")
             
         self.time=numpy.array(fid.variables['time'])+deltat
         self.lon_nadir=numpy.array(fid.variables['lon_nadir'])
@@ -31,6 +48,12 @@ class Roll_module(object):
         self.roll2_cor=numpy.array(fid.variables['roll2_cor'])
         
         fid.close()
+        
+        # Residual roll errors, and their last interpolation on a sensor time grid (cf. get_roll_error_on_sensor_grid)
+        self.roll1_err_minus_cor = self.roll1_err - self.roll1_cor
+        self.roll2_err_minus_cor = self.roll2_err - self.roll2_cor
+        self.sensor_key = None
+        self.roll_err_sens = None
 
     def interpolate_roll_on_sensor_grid(self, sensor_time):
 
@@ -56,3 +79,27 @@ class Roll_module(object):
         self.roll1_cor_cloud=f(cloud_time)
         f=scipy.interpolate.interp1d(sensor_time,self.roll2_cor_sens,kind='linear')
         self.roll2_cor_cloud=f(cloud_time)        
+
+    def get_roll_error_on_sensor_grid(self, sensor_time, swath):
+        
+        # Residual roll error (roll error - roll correction) of the swath, interpolated on sensor time grid
+        # NB: as the interpolation is linear, the difference is interpolated instead of both terms
+        key = (sensor_time.size, sensor_time[0], sensor_time[-1], swath.lower())
+        if key != self.sensor_key:
+            ind_start = numpy.searchsorted(self.time, sensor_time[0]-2., side='left')
+            ind_end = numpy.searchsorted(self.time, sensor_time[-1]+2., side='right')
+            if (ind_end - ind_start < 2) or (sensor_time.min() < self.time[ind_start]) or (sensor_time.max() > self.time[ind_end-1]):
+                raise ValueError("Sensor time out of the time range of the roll file")
+            if swath.lower() == 'right':
+                roll_err = self.roll2_err_minus_cor
+            else:
+                roll_err = self.roll1_err_minus_cor
+            self.roll_err_sens = numpy.interp(sensor_time, self.time[ind_start:ind_end], roll_err[ind_start:ind_end])
+            self.sensor_key = key
+        return self.roll_err_sens
+    
+    def compute_height_error(self, sensor_time, swath, az, y):
+        
+        # Height error due to the residual roll, for each pixel (of azimuth index az and cross-track distance y)
+        # NB: pixel times are sensor times, so the interpolation on the pixel cloud is a simple lookup
+        return self.get_roll_error_on_sensor_grid(sensor_time, swath)[az] * y * 1e-6
@@ -9,13 +9,40 @@ import netCDF4 as nc
 import numpy as np
 import os
 from scipy.interpolate import LinearNDInterpolator
-from scipy.spatial.distance import cdist
+from scipy.spatial import cKDTree
 
 __author__ = """Kevin Larnier """ \
              """<kevin.larnier@c-s.fr>"""
 __version__ = """0.1"""
 
 
+# Process-wide cache of parsed true height files
+# key = (absolute path, lon varname, lat varname, height varname)
+# value = dict with the mtime of the file, the true height values, and the interpolators built on them
+TRUEHEIGHT_CACHE = {}
+
+
+def get_trueheight_cache_entry(filename, lon_varname, lat_varname, height_varname):
+    """ Get the cache entry of a true height file, reset if the file has been modified since it was cached
+    
+        Arguments:
+            filename(str) : path to the true height file
+            lon_varname(str) : variable name for the longitude
+            lat_varname(str) : variable name for the latitude
+            height_varname(str) : variable name for the height
+            
+        Returns:
+            dict : cache entry (empty if the file has not been read yet)
+    """
+    key = (os.path.abspath(filename), lon_varname, lat_varname, height_varname)
+    mtime = os.path.getmtime(filename)
+    entry = TRUEHEIGHT_CACHE.get(key)
+    if entry is None or entry['mtime'] != mtime:
+        entry = {'mtime': mtime}
+        TRUEHEIGHT_CACHE[key] = entry
+    return entry
+
+
 class TrueHeightModel():
     """ Class for application of true height to a sisimp pointcloud
     """
@@ -37,6 +64,7 @@ class TrueHeightModel():
         self.pt_lon = pt_lon
         self.pt_lat = pt_lat
         self.pt_height = np.zeros(len(self.pt_lon))
+        self.th_cache = {}  # Cache entry of the true height file (cf. TRUEHEIGHT_CACHE)
 
         self.verbose = False
         
@@ -72,6 +100,15 @@ class TrueHeightModel():
                 height_varname(str) : variable name for the height
         """
       
+        self.th_cache = get_trueheight_cache_entry(filename, lon_varname, lat_varname, height_varname)
+        if 'height' in self.th_cache:
+            if self.verbose:
+                print(" - True height already read from NetCDF file: %s" % filename)
+            self.th_lat = self.th_cache['lat']
+            self.th_lon = self.th_cache['lon']
+            self.th_height = self.th_cache['height']
+            return
+      
         if self.verbose:
           print(" - Read true height from NetCDF file: %s" % filename)
 
@@ -84,6 +121,12 @@ class TrueHeightModel():
         self.th_lat = dataset.variables[lat_varname][:]
         self.th_lon = dataset.variables[lon_varname][:]
         self.th_height = dataset.variables[height_varname][:]
+        dataset.close()
+        
+        # Store them in cache
+        self.th_cache['lat'] = self.th_lat
+        self.th_cache['lon'] = self.th_lon
+        self.th_cache['height'] = self.th_height
         
     def apply_trueheight(self):
         """ Compute final heights
@@ -94,9 +137,11 @@ class TrueHeightModel():
             
         fillvalue = -9999.
         
-        # Vector of theoretical points
-        th_points = np.stack((self.th_lon, self.th_lat), axis=1)
-        interpolator = LinearNDInterpolator(th_points, self.th_height, fill_value=fillvalue)
+        # Vector of theoretical points and interpolator (triangulation), built once per true height file
+        if 'interpolator' not in self.th_cache:
+            self.th_cache['points'] = np.stack((self.th_lon, self.th_lat), axis=1)
+            self.th_cache['interpolator'] = LinearNDInterpolator(self.th_cache['points'], self.th_height, fill_value=fillvalue)
+        interpolator = self.th_cache['interpolator']
         
         # Vector of simulated points
         pt_points = np.stack((self.pt_lon, self.pt_lat), axis=1)
@@ -105,10 +150,11 @@ class TrueHeightModel():
         # Specific processing when interpolation doesn't work => get height from nearest point
         ind_pb = np.where(interpolated_height == fillvalue)[0]  # Get indices of problematic points
         if len(ind_pb) != 0:
-            # Compute distance between problematic points and theoretical points
-            distances = cdist(th_points, pt_points[ind_pb], 'euclidean')
+            # KD-tree of theoretical points, built once per true height file
+            if 'kdtree' not in self.th_cache:
+                self.th_cache['kdtree'] = cKDTree(self.th_cache['points'])
             # Get indices of nearest theoratical points for each pb point
-            ind_min = np.argmin(distances, 0)  
+            ind_min = self.th_cache['kdtree'].query(pt_points[ind_pb])[1]
             # Replace non-interpolated heights by nearest heights 
             interpolated_height[ind_pb] = self.th_height[ind_min]
         
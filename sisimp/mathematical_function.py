@@ -23,7 +23,7 @@ import lib.my_api as my_api
 
 from lib.my_variables import RAD2DEG, DEG2RAD, GEN_APPROX_RAD_EARTH
 
-def calc_delta_h(IN_angles, IN_noise_height, IN_height_bias_std, seed = None):
+def calc_delta_h(IN_angles, IN_noise_height, IN_height_bias_std, rng = None, IN_height_bias = None):
     """
     Calculate the delta h values and add noise
 
@@ -36,29 +36,40 @@ def calc_delta_h(IN_angles, IN_noise_height, IN_height_bias_std, seed = None):
     :param IN_height_bias_std :
     :type IN_height_bias_std :
 
+    :param rng: random generator (cf. lib.my_rng); if None, the global numpy generator is used
+    :type rng: numpy.random.Generator
+
+    :param IN_height_bias: height bias, drawn once per swath by the caller; if None, it is drawn from rng with IN_height_bias_std
+    :type IN_height_bias: float
+
     :return OUT_noisy_h: the noisy height values
     :rtype OUT_noisy_h: 1D-array of float
     """
     
-    np.random.seed(seed)
+    if rng is None:
+        rng = np.random
 
     if (IN_angles.size != 0) and (np.max(IN_angles*RAD2DEG) > np.max(IN_noise_height[:, 0])):
         my_api.printInfo("One or more incidence angles are greater than the max value defined in the noise file ! Values higher than {0} degrees will be set to      the maximum value defined in the file.".format(np.max(IN_noise_height[:, 0])))
 
     OUT_noisy_h = 0
     if (IN_noise_height[:, 1] < 1.e-5).any() and not IN_height_bias_std < 1.e-5:  # Case noise file as one or more zeros
-        OUT_noisy_h = np.random.normal(0, IN_height_bias_std) + np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:, 1])
+        if IN_height_bias is None:
+            IN_height_bias = rng.normal(0, IN_height_bias_std)
+        OUT_noisy_h = IN_height_bias + np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:, 1])
     elif not (IN_noise_height[:, 1] < 1.e-5).any() and IN_height_bias_std < 1.e-5:  # Case height bias equals zero
-        OUT_noisy_h = np.random.normal(0, np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:, 1]))
+        OUT_noisy_h = rng.normal(0, np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:, 1]))
     elif (IN_noise_height[:, 1] < 1.e-5).any() and IN_height_bias_std < 1.e-5:  # Case both are equals to zero
         OUT_noisy_h = np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:, 1])
     else:  # Case none are equals to zero
-        OUT_noisy_h = np.random.normal(0, IN_height_bias_std) + np.random.normal(0, np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:,1]))
+        if IN_height_bias is None:
+            IN_height_bias = rng.normal(0, IN_height_bias_std)
+        OUT_noisy_h = IN_height_bias + rng.normal(0, np.interp(IN_angles*RAD2DEG, IN_noise_height[:, 0], IN_noise_height[:,1]))
 
     return OUT_noisy_h
 
 
-def calc_delta_jitter(IN_orbit_heading, IN_lat, IN_orbit_jitter):
+def calc_delta_jitter(IN_orbit_heading, IN_lat, IN_orbit_jitter, rng = None):
     """
     Calculate the jitter
 
@@ -71,12 +82,18 @@ def calc_delta_jitter(IN_orbit_heading, IN_lat, IN_orbit_jitter):
     :param IN_orbit_jitter :
     :type IN_orbit_jitter :
 
+    :param rng: random generator (cf. lib.my_rng); if None, the global numpy generator is used
+    :type rng: numpy.random.Generator
+
     :return: the values of delta jitter
     :rtype: 1D-array of float
     """
 
+    if rng is None:
+        rng = np.random
+
     # Random jitter of +/- random_jitter
-    orbit_jitter = [0, int(np.random.normal(0, IN_orbit_jitter))][IN_orbit_jitter != 0]
+    orbit_jitter = [0, int(rng.normal(0, IN_orbit_jitter))][IN_orbit_jitter != 0]
     if orbit_jitter > IN_orbit_jitter:
         orbit_jitter = IN_orbit_jitter
     elif orbit_jitter < -IN_orbit_jitter:
@@ -87,6 +104,29 @@ def calc_delta_jitter(IN_orbit_heading, IN_lat, IN_orbit_jitter):
     return (np.cos(IN_orbit_heading) * orbit_jitter) / (GEN_APPROX_RAD_EARTH * np.cos(np.mean(IN_lat)*DEG2RAD))
 
 
+def calc_velocity(IN_x, IN_y, IN_z, IN_time):
+    """
+    Calculate the velocity along a track by finite differences
+    (centered differences inside the track, one-sided differences at its ends)
+
+    :param IN_x|y|z: cartesian coordinates of the track points
+    :type IN_x|y|z: 1D-array of float
+    :param IN_time: time of the track points
+    :type IN_time: 1D-array of float
+
+    :return: the vx|vy|vz cartesian velocity values
+    :rtype: 3 1D-arrays of float
+    """
+    OUT_velocity = []
+    for coord in (IN_x, IN_y, IN_z):
+        velocity = np.empty(coord.size)
+        velocity[1:-1] = (coord[2:] - coord[:-2]) / (IN_time[2:] - IN_time[:-2])
+        velocity[0] = (coord[1] - coord[0]) / (IN_time[1] - IN_time[0])
+        velocity[-1] = (coord[-1] - coord[-2]) / (IN_time[-1] - IN_time[-2])
+        OUT_velocity.append(velocity)
+    return OUT_velocity
+
+
 def calc_delta_sensor(IN_delta_h, IN_orbit_altitudes, IN_y):
     """
     Calculate the noise of the sensor.
@@ -104,85 +144,73 @@ def calc_delta_sensor(IN_delta_h, IN_orbit_altitudes, IN_y):
     return IN_delta_h * IN_orbit_altitudes / IN_y
 
 
-def lonlat_from_azy(IN_az, IN_ri, IN_attributes, IN_swath, h=0, IN_unit="rad"):
+def lonlat_from_azy(IN_az, IN_ri, IN_attributes, IN_swath, h=0, IN_unit="rad", IN_dtype=np.float64, OUT_lon=None, OUT_lat=None):
     """
-    Convert coordinates from azimuth-y to lon-lat for a given track
+    Convert coordinates from azimuth-range to lon-lat for a given track
+    
+    The point is obtained by rotating the nadir direction by the angle mu (at the Earth center, between nadir and 
+    the point) in the plane orthogonal to the track; longitude and latitude are then derived in closed form from 
+    its direction cosines (arctan2 and arcsin).
 
     :param IN_az: azimuth coordinate of given points
-    :type IN_az: 1D-array of float
-    :param IN_y: crosstrack distance of given points
-    :type IN_y: 1D-array of float
-    :param IN_unit: "rad" (default) ou "deg" to output coordinates in radians or degrees
+    :type IN_az: 1D-array of int
+    :param IN_ri: range of given points
+    :type IN_ri: 1D-array of float
+    :param IN_swath: the name of the swath 
+    :type IN_swath: string ("Left" or "Right")
+    :param h: height of given points
+    :type h: float or 1D-array of float
+    :param IN_unit: not used, coordinates are always output in radians
     :type IN_unit: string
+    :param IN_dtype: floating point type of the computation and output (np.float32 halves memory use, 
+                    but the geolocation error is then a few meters, up to tens of meters)
+    :type IN_dtype: numpy dtype
+    :param OUT_lon: if set, array of IN_dtype where longitudes are written
+    :type OUT_lon: 1D-array of float
+    :param OUT_lat: if set, array of IN_dtype where latitudes are written
+    :type OUT_lat: 1D-array of float
 
     :return: OUT_lon = longitude of points
     :rtype: OUT_lon = 1D-array of float
     :return: OUT_lat = latitude of points
     :rtype: OUT_lat = 1D-array of float
     """
-
-    lat0 = IN_attributes.lat[IN_az]
-    phi0 = IN_attributes.lon[IN_az]
-    psi0 = IN_attributes.heading_init[IN_az]
-    IN_Alt = IN_attributes.alt[IN_az]
-    theta0 = np.pi/2 - lat0
-    
-    costheta_0 = IN_attributes.costheta_init[IN_az]
-    sintheta_0 = IN_attributes.sintheta_init[IN_az]
-    cosphi_0 = IN_attributes.cosphi_init[IN_az]
-    sinphi_0 = IN_attributes.sinphi_init[IN_az]
-    cospsi_0 = IN_attributes.cospsi_init[IN_az]
-    sinpsi_0 = IN_attributes.sinpsi_init[IN_az]
+    dtype = np.dtype(IN_dtype)
     
+    # 1 - Angle mu from the triangle (Earth center, sensor, point), written in a way which avoids cancellations:
+    # 1 - cos(mu) = (ri^2 - (R_alt - R_h)^2) / (2 R_h R_alt)
+    r_h = GEN_APPROX_RAD_EARTH + np.asarray(h, dtype=dtype)
+    r_alt = GEN_APPROX_RAD_EARTH + IN_attributes.alt[IN_az].astype(dtype)
+    ri = np.asarray(IN_ri, dtype=dtype)
+    one_minus_cosmu = r_alt - r_h
+    one_minus_cosmu = (ri - one_minus_cosmu) * (ri + one_minus_cosmu) / (2 * r_h * r_alt)
+    cosmu = 1 - one_minus_cosmu
+    sinmu = np.sqrt(one_minus_cosmu * (2 - one_minus_cosmu))
     if IN_swath == 'Left':
-        sign = -1
-    else:
-        sign=1.
-        
-    mu = sign*np.arccos((IN_ri**2-((GEN_APPROX_RAD_EARTH+h)**2+(GEN_APPROX_RAD_EARTH+IN_Alt)**2))/(-2*(GEN_APPROX_RAD_EARTH +h)*(GEN_APPROX_RAD_EARTH+IN_Alt)))
-
-    Cx = (np.cos(mu)*sintheta_0*cosphi_0 + np.sin(mu)*(sinpsi_0*costheta_0*cosphi_0-cospsi_0*sinphi_0))
-    Cy = (np.cos(mu)*sintheta_0*sinphi_0 + np.sin(mu)*(sinpsi_0*costheta_0*sinphi_0+cospsi_0*cosphi_0))
-    Cz = (np.cos(mu)*costheta_0 - np.sin(mu)*sinpsi_0*sintheta_0)
+        np.negative(sinmu, out=sinmu)
     
-    xp_yp_zp = np.where(np.logical_and(Cx > 0, np.logical_and(Cy > 0, Cz > 0)))
-    xp_yp_zm = np.where(np.logical_and(Cx > 0, np.logical_and( Cy > 0, Cz < 0)))
-    xp_ym_zp = np.where(np.logical_and(Cx > 0, np.logical_and( Cy < 0, Cz > 0)))
-    xm_yp_zp = np.where(np.logical_and(Cx < 0, np.logical_and( Cy > 0, Cz > 0)))
-    xp_ym_zm = np.where(np.logical_and(Cx > 0, np.logical_and( Cy < 0, Cz < 0)))
-    xm_ym_zp = np.where(np.logical_and(Cx < 0, np.logical_and( Cy < 0, Cz > 0)))
-    xm_yp_zm = np.where(np.logical_and(Cx < 0, np.logical_and( Cy > 0, Cz < 0)))
-    xm_ym_zm = np.where(np.logical_and(Cx < 0, np.logical_and( Cy < 0, Cz < 0)))
-
-    OUT_lat = np.zeros(len(mu), float)
-    OUT_lon = np.zeros(len(mu), float)
-     
-    OUT_lat[xp_yp_zp] = np.pi/2. - np.arccos(Cz[xp_yp_zp])
-    OUT_lon[xp_yp_zp] = np.arctan(Cy[xp_yp_zp]/Cx[xp_yp_zp])
-
-    OUT_lat[xp_yp_zm] = np.pi/2. - np.arccos(Cz[xp_yp_zm])
-    OUT_lon[xp_yp_zm] = np.arctan(Cy[xp_yp_zm]/Cx[xp_yp_zm]) 
+    # 2 - Direction cosines of the point
+    costheta_0 = IN_attributes.costheta_init[IN_az].astype(dtype)
+    sintheta_0 = IN_attributes.sintheta_init[IN_az].astype(dtype)
+    cosphi_0 = IN_attributes.cosphi_init[IN_az].astype(dtype)
+    sinphi_0 = IN_attributes.sinphi_init[IN_az].astype(dtype)
+    cospsi_0 = IN_attributes.cospsi_init[IN_az].astype(dtype)
+    sinpsi_0 = IN_attributes.sinpsi_init[IN_az].astype(dtype)
     
-    OUT_lat[xp_ym_zp] = np.pi/2. - np.arccos(Cz[xp_ym_zp])
-    OUT_lon[xp_ym_zp] = np.arctan(Cy[xp_ym_zp]/Cx[xp_ym_zp])
+    cosmu_sintheta = cosmu * sintheta_0
+    sinmu_sinpsi_costheta = sinmu * sinpsi_0 * costheta_0
+    sinmu_cospsi = sinmu * cospsi_0
+    Cx = (cosmu_sintheta + sinmu_sinpsi_costheta) * cosphi_0 - sinmu_cospsi * sinphi_0
+    Cy = (cosmu_sintheta + sinmu_sinpsi_costheta) * sinphi_0 + sinmu_cospsi * cosphi_0
+    Cz = cosmu * costheta_0 - sinmu * sinpsi_0 * sintheta_0
     
-    OUT_lat[xm_yp_zp] = np.pi/2. - np.arccos(Cz[xm_yp_zp])
-    OUT_lon[xm_yp_zp] = np.arctan(Cy[xm_yp_zp]/Cx[xm_yp_zp]) + np.pi
-    
-    OUT_lat[xp_ym_zm] = np.pi/2. - np.arccos(Cz[xp_ym_zm])
-    OUT_lon[xp_ym_zm] = np.arctan(Cy[xp_ym_zm]/Cx[xp_ym_zm])
-    
-    OUT_lat[xm_ym_zp] = np.pi/2. - np.arccos(Cz[xm_ym_zp])
-    OUT_lon[xm_ym_zp] = np.arctan(Cy[xm_ym_zp]/Cx[xm_ym_zp]) - np.pi
-    
-    OUT_lat[xm_yp_zm] = np.pi/2. - np.arccos(Cz[xm_yp_zm])
-    OUT_lon[xm_yp_zm] = np.arctan(Cy[xm_yp_zm]/Cx[xm_yp_zm]) + np.pi
-    
-    OUT_lat[xm_ym_zm] = np.pi/2. - np.arccos(Cz[xm_ym_zm])
-    OUT_lon[xm_ym_zm] = np.arctan(Cy[xm_ym_zm]/Cx[xm_ym_zm]) -np.pi/2.   
+    # 3 - Spherical coordinates
+    OUT_lon = np.arctan2(Cy, Cx, out=OUT_lon)
+    OUT_lat = np.arcsin(Cz, out=OUT_lat)
 
     return OUT_lon, OUT_lat  # Output in radians
 
+
 def lonlat_from_azy_old(IN_az, IN_y, IN_lat_init, IN_lon_init, IN_heading_init, IN_unit="rad"):
     """
     Convert coordinates from azimuth-y to lon-lat for a given track
@@ -17,10 +17,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import numpy as np
 import os
-from osgeo import ogr, osr
+from osgeo import ogr
 
 import lib.my_api as my_api
 import lib.my_netcdf_file as my_nc
+import lib.my_shp_file as my_shp
 
 
 def fill_vector_param(variable, variable_name, ref_size, data_param, group=None):
@@ -44,6 +45,22 @@ def fill_vector_param(variable, variable_name, ref_size, data_param, group=None)
         else:
             data_param.fill_variable(variable_name, variable, group=group)
             
+
+def compute_illumination_time(IN_nadir_time, IN_sensor_s):
+    """
+    Compute the illumination time of each pixel, i.e. the time of the nadir point of its sensor azimuth position
+    
+    :param IN_nadir_time: time of each nadir point
+    :type IN_nadir_time: 1D-array of float
+    :param IN_sensor_s: sensor azimuth position (=index in IN_nadir_time) of each pixel
+    :type IN_sensor_s: 1D-array of int
+    
+    :return: OUT_illumination_time = illumination time of each pixel
+    :rtype: OUT_illumination_time = 1D-array of float
+    """
+    OUT_illumination_time = np.take(np.asarray(IN_nadir_time, dtype=np.float64), IN_sensor_s)
+    return OUT_illumination_time
+            
             
 #################################################
 
@@ -131,12 +148,7 @@ class l2_hr_pixc(object):
         self.sensor_s = IN_azimuth_index
         self.nadir_time = IN_nadir_time
         
-        self.illumination_time = np.zeros(len(IN_azimuth_index))
-        
-        for i in range(self.illumination_time.size):
-            self.illumination_time[i] = self.nadir_time[self.sensor_s[i]]
-
-        #self.illumination_time = [self.nadir_time[self.sensor_s[i]] for i in range((self.illumination_time).size)]
+        self.illumination_time = compute_illumination_time(self.nadir_time, self.sensor_s)
             
         self.nadir_latitude = IN_nadir_latitude
         self.nadir_longitude = IN_nadir_longitude
@@ -473,139 +485,40 @@ class l2_hr_pixc(object):
 
     def write_pixc_asShp(self, IN_output_file):
         """
-        Write some of the pixel cloud attributes in a shapefile
+        Write some of the pixel cloud attributes in a vector file (format given by the extension: .shp, .gpkg or .fgb)
 
         :param IN_output_file: output full path
         :type IN_output_file: string
         """
         my_api.printInfo("[proc_real_pixc] == write_pixc_asShp : %s ==" % IN_output_file) 
         
-        # 1 - Initialisation du fichier de sortie
-        # 1.1 - Driver
-        shpDriver = ogr.GetDriverByName(str("ESRI Shapefile"))
-        # 1.2 - Creation du fichier
-        if os.path.exists(IN_output_file):
-            shpDriver.DeleteDataSource(IN_output_file)
-        outDataSource = shpDriver.CreateDataSource(IN_output_file)
-        # 1.3 - Creation de la couche
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)  # WGS84
-        outLayer = outDataSource.CreateLayer(str(os.path.basename(IN_output_file).split('.')[0]+"_pixc"), srs, geom_type=ogr.wkbPoint)
-        # 1.4 - Creation des attributs
-        outLayer.CreateField(ogr.FieldDefn(str('AZ_INDEX'), ogr.OFTInteger))  # Azimuth index
-        outLayer.CreateField(ogr.FieldDefn(str('R_INDEX'), ogr.OFTInteger))  # Range index
-        outLayer.CreateField(ogr.FieldDefn(str('CLASSIF'), ogr.OFTInteger))  # Classification
-        tmpField = ogr.FieldDefn(str('PIX_AREA'), ogr.OFTReal)  # Pixel area
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(5)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('LAT'), ogr.OFTReal)  # Latitude
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('LONG'), ogr.OFTReal)  # Longitude
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('HEIGHT'), ogr.OFTReal)  # Hauteur
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('CR_TRACK'), ogr.OFTReal) # Distance dans la fauchee
-        tmpField.SetWidth(15)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        # 1.5 - On recupere la definition de la couche
-        outLayerDefn = outLayer.GetLayerDefn()
-        
-        # 2 - On traite point par point
-        for az_ind, range_index, classif, pixel_area, lat, lng, height, crosstrack in zip(self.azimuth_index, self.range_index, self.classification, self.pixel_area, self.latitude, self.longitude, self.height, self.crosstrack):
-            # 2.1 - On cree l'objet dans le format de la couche de sortie
-            outFeature = ogr.Feature(outLayerDefn)
-            # 2.2 - On lui assigne le point
-            point = ogr.Geometry(ogr.wkbPoint)
-            point.AddPoint(lng, lat)
-            outFeature.SetGeometry(point)
-            # 2.3 - On lui assigne les attributs
-            outFeature.SetField(str('AZ_INDEX'), float(az_ind))
-            outFeature.SetField(str('R_INDEX'), float(range_index))
-            outFeature.SetField(str('CLASSIF'), float(classif))
-            outFeature.SetField(str('PIX_AREA'), float(pixel_area))
-            outFeature.SetField(str('LAT'), float(lat))
-            outFeature.SetField(str('LONG'), float(lng))
-            outFeature.SetField(str('HEIGHT'), float(height))
-            outFeature.SetField(str('CR_TRACK'), float(crosstrack))
-            # 2.4 - On ajoute l'objet dans la couche de sortie
-            outLayer.CreateFeature(outFeature)
-            
-        # 3 - Destroy the data sources to free resources
-        outDataSource.Destroy()
+        my_shp.write_points_file(IN_output_file, self.longitude, self.latitude, 
+                                 [('AZ_INDEX', ogr.OFTInteger, None, None, self.azimuth_index),  # Azimuth index
+                                  ('R_INDEX', ogr.OFTInteger, None, None, self.range_index),  # Range index
+                                  ('CLASSIF', ogr.OFTInteger, None, None, self.classification),  # Classification
+                                  ('PIX_AREA', ogr.OFTReal, 10, 5, self.pixel_area),  # Pixel area
+                                  ('LAT', ogr.OFTReal, 10, 6, self.latitude),  # Latitude
+                                  ('LONG', ogr.OFTReal, 10, 6, self.longitude),  # Longitude
+                                  ('HEIGHT', ogr.OFTReal, 10, 6, self.height),  # Hauteur
+                                  ('CR_TRACK', ogr.OFTReal, 15, 6, self.crosstrack)],  # Distance dans la fauchee
+                                 IN_layer_name=os.path.basename(IN_output_file).split('.')[0]+"_pixc")
         
     def write_tvp_asShp(self, IN_output_file):
         """
-        Write some of the TVP attributes in a shapefile
+        Write some of the TVP attributes in a vector file (format given by the extension: .shp, .gpkg or .fgb)
 
         :param IN_output_file: output full path
         :type IN_output_file: string
         """
         my_api.printInfo("[proc_real_pixc] == write_tvp_asShp : %s ==" % IN_output_file) 
     
-        # 1 - Initialisation du fichier de sortie
-        # 1.1 - Driver
-        shpDriver = ogr.GetDriverByName(str("ESRI Shapefile"))
-        # 1.2 - Creation du fichier
-        if os.path.exists(IN_output_file):
-            shpDriver.DeleteDataSource(IN_output_file)
-        outDataSource = shpDriver.CreateDataSource(IN_output_file)
-        # 1.3 - Creation de la couche
-        #print '> Creating layer pixel_cloud'
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)  # WGS84
-        outLayer = outDataSource.CreateLayer(str(os.path.basename(IN_output_file).split('.')[0]+"_tvp"), srs, geom_type=ogr.wkbPoint)
-        # 1.4 - Creation des attributs
-        tmpField = ogr.FieldDefn(str('TIME'), ogr.OFTReal)  # Time
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(2)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('LAT'), ogr.OFTReal) # Latitude
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('LONG'), ogr.OFTReal)   # Longitude
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('ALTITUDE'), ogr.OFTReal)  # Altitude
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(3)
-        outLayer.CreateField(tmpField)
-        tmpField = ogr.FieldDefn(str('HEADING'), ogr.OFTReal)  # Heading
-        tmpField.SetWidth(10)
-        tmpField.SetPrecision(6)
-        outLayer.CreateField(tmpField)
-        # 1.5 - On recupere la definition de la couche
-        outLayerDefn = outLayer.GetLayerDefn()
-        
-        # 2 - On traite point par point
-        for lng, lat, t, heading, alt in zip(self.nadir_longitude, self.nadir_latitude, self.nadir_time, self.nadir_heading, self.nadir_altitude):
-            # 2.1 - On cree l'objet dans le format de la couche de sortie
-
-            outFeature = ogr.Feature(outLayerDefn)
-            # 2.2 - On lui assigne le point
-            point = ogr.Geometry(ogr.wkbPoint)
-            point.AddPoint(lng, lat)
-            outFeature.SetGeometry(point)
-            # 2.3 - On lui assigne les attributs
-            outFeature.SetField(str('TIME'), float(t)) 
-            outFeature.SetField(str('LAT'), float(lat)) 
-            outFeature.SetField(str('LONG'), float(lng)) 
-            outFeature.SetField(str('ALTITUDE'), float(alt)) 
-            outFeature.SetField(str('HEADING'), float(heading))
-            # 2.4 - On ajoute l'objet dans la couche de sortie
-            outLayer.CreateFeature(outFeature)
-            
-        # 3 - Destroy the data sources to free resources
-        outDataSource.Destroy()
+        my_shp.write_points_file(IN_output_file, self.nadir_longitude, self.nadir_latitude, 
+                                 [('TIME', ogr.OFTReal, 10, 2, self.nadir_time),  # Time
+                                  ('LAT', ogr.OFTReal, 10, 6, self.nadir_latitude),  # Latitude
+                                  ('LONG', ogr.OFTReal, 10, 6, self.nadir_longitude),  # Longitude
+                                  ('ALTITUDE', ogr.OFTReal, 10, 3, self.nadir_altitude),  # Altitude
+                                  ('HEADING', ogr.OFTReal, 10, 6, self.nadir_heading)],  # Heading
+                                 IN_layer_name=os.path.basename(IN_output_file).split('.')[0]+"_tvp")
 
 
 ##########################
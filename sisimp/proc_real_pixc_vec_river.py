@@ -19,33 +19,15 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import numpy as np
 import os
-from osgeo import ogr, osr
+from osgeo import ogr
 
 import lib.my_api as my_api
 import lib.my_netcdf_file as my_nc
+import lib.my_shp_file as my_shp
 
 
-def fill_vector_param(IN_variable, IN_variable_name, IN_ref_size, IN_data_param):
-    """
-    Fill variable data field
-    
-    :param IN_variable: input data
-    :type IN_variable: array
-    :param IN_variable_name: name for the variable in the NetCDF file
-    :type IN_variable_name: string
-    :param IN_ref_size: number of elements associated to the variable in the NetCDF file
-    :type IN_ref_size: int
-    :param IN_data_param: pointer to the NetCDF writer (=NcWrite(OUT_file))
-    :type IN_data_param: -
-    """
-    
-    if IN_variable is not None:
-        xsize = len(IN_variable)
-        if xsize != IN_ref_size:
-            exc = '[proc_real_pixc_vec_river/fill_vector_param] ERROR = There is a problem with the size of ' + IN_variable_name
-            exit(exc)
-        else:
-            IN_data_param.fill_variable(IN_variable_name, IN_variable)
+# Number of records per chunk of the NetCDF variables (sized for sequential reads of whole tiles by downstream processing)
+NC_CHUNK_SIZE = 65536
 
 
 #----------------------------------------
@@ -81,7 +63,6 @@ class l2_hr_pixc_vec_river(object):
         + latitude_vectorproc(1D-array) : improved latitude values
         + longitude_vectorproc(1D-array) : improved longitude values
         + height_vectorproc(1D-array) : improved height values
-        + river_tag(1D-array): reach ID associated to each pixel
         + pattern(str): filename pattern
         """
         my_api.printInfo("[l2_hr_pixc_vec_river] == INIT ==") 
@@ -92,7 +73,6 @@ class l2_hr_pixc_vec_river(object):
         self.latitude_vectorproc = None
         self.longitude_vectorproc = None
         self.height_vectorproc = None
-        self.river_tag = None
         
         self.mission_start_time = IN_mission_start_time
         self.cycle_duration = IN_cycle_duration
@@ -104,6 +84,8 @@ class l2_hr_pixc_vec_river(object):
         
         self.nb_pix_river = 0  # Number of PixC associated to river
         self.pixc_river_idx = None  # Indices of pixels in the L2_HR_PIXC product associated to a river
+        self.river_only = False  # True if vectorproc values are given for river pixels only (cf. set_river_pixels)
+        self.river_columns = None  # Values of the river pixels to write, computed once for all output files
 
     def write_file(self, IN_output_file, noval, compress=False):
         """
@@ -126,9 +108,8 @@ class l2_hr_pixc_vec_river(object):
         # 1 - Open NetCDF file in writing mode
         data = my_nc.myNcWriter(IN_output_file)
         
-        # 2 - Get river pixels indices
-        self.pixc_river_idx = np.where(self.river_tag != "")[0]  # Indices of river pixels in the L2_HR_PIXC product
-        self.nb_pix_river = len(self.pixc_river_idx)  # Number of river pixels
+        # 2 - Get river pixels values
+        columns = self.get_river_columns()
         
         # 3 - Write file depending on the number of river pixels
         if self.nb_pix_river == 0:
@@ -139,36 +120,30 @@ class l2_hr_pixc_vec_river(object):
         else:
 
             data.add_dimension('record', self.nb_pix_river)
-    
-            data.add_variable('pixc_index', np.int32, 'record', np.int(noval), compress)
-            fill_vector_param(self.pixc_river_idx, 'pixc_index', self.nb_pix_river, data)
-            data.add_variable('azimuth_index', np.int32, 'record', np.int(noval), compress)
-            fill_vector_param(self.azimuth_index[self.pixc_river_idx], 'azimuth_index', self.nb_pix_river, data)
-            data.add_variable('range_index', np.int32, 'record', np.int(noval), compress)
-            fill_vector_param(self.range_index[self.pixc_river_idx], 'range_index', self.nb_pix_river, data)
-        
-            data.add_variable('latitude_vectorproc', np.double, 'record', noval, compress)
-            data.add_variable_attribute('latitude_vectorproc', 'units', 'degrees_north')
-            fill_vector_param(self.latitude_vectorproc[self.pixc_river_idx], 'latitude_vectorproc', self.nb_pix_river, data)
-            data.add_variable('longitude_vectorproc', np.double, 'record', noval, compress)
-            data.add_variable_attribute('longitude_vectorproc', 'units', 'degrees_east')
-            fill_vector_param(self.longitude_vectorproc[self.pixc_river_idx], 'longitude_vectorproc', self.nb_pix_river, data)
-            data.add_variable('height_vectorproc', np.float32, 'record', np.float(noval), compress)
-            data.add_variable_attribute('height_vectorproc', 'units', 'm')
-            fill_vector_param(self.height_vectorproc[self.pixc_river_idx], 'height_vectorproc', self.nb_pix_river, data)
-        
-            data.add_variable('river_tag', str, 'record', "", compress)
-            fill_vector_param(self.river_tag[self.pixc_river_idx], 'river_tag', self.nb_pix_river, data)
+            chunksizes = (min(NC_CHUNK_SIZE, self.nb_pix_river),)
+            
+            # Variables are written directly from the river columns (sizes are consistent by construction)
+            for name, datatype, fill_value, units in (('pixc_index', np.int32, int(noval), None),
+                                                      ('azimuth_index', np.int32, int(noval), None),
+                                                      ('range_index', np.int32, int(noval), None),
+                                                      ('latitude_vectorproc', np.double, noval, 'degrees_north'),
+                                                      ('longitude_vectorproc', np.double, noval, 'degrees_east'),
+                                                      ('height_vectorproc', np.float32, float(noval), 'm'),
+                                                      ('river_tag', str, "", None)):
+                data.add_variable(name, datatype, 'record', fill_value, compress, IN_chunksizes=chunksizes)
+                if units is not None:
+                    data.add_variable_attribute(name, 'units', units)
+                data.fill_variable(name, columns[name])
         
         # Write global attributes even if empty
         data.add_global_attribute('description', 'L2_HR_PIXCVecRiver product obtained by CNES/LEGOS Large Scale Simulator')
         data.add_global_attribute('mission_start_time', self.mission_start_time)
         data.add_global_attribute('repeat_cycle_period', self.cycle_duration)
         data.add_global_attribute('cycle_number', self.cycle_num)
-        data.add_global_attribute('pass_number', np.int(self.pass_num))
+        data.add_global_attribute('pass_number', int(self.pass_num))
         data.add_global_attribute('tile_number', int(self.tile_ref[0:-1]))
         data.add_global_attribute('swath_side', self.tile_ref[-1])
-        data.add_global_attribute('tile_name', "%03d_%03d%s" % (np.int(self.pass_num), int(self.tile_ref[0:-1]), self.tile_ref[-1]))
+        data.add_global_attribute('tile_name', "%03d_%03d%s" % (int(self.pass_num), int(self.tile_ref[0:-1]), self.tile_ref[-1]))
         data.add_global_attribute('interferogram_size_range', self.nb_pix_range)    
         data.add_global_attribute('interferogram_size_azimuth', self.nb_pix_azimuth)   
         
@@ -183,6 +158,8 @@ class l2_hr_pixc_vec_river(object):
         :type IN_output_file: string
         """
         
+        columns = self.get_river_columns()
+        
         if self.nb_pix_river == 0:
             my_api.printInfo("[l2_hr_pixc_vec_river] == write_file_asShp ==") 
             my_api.printInfo("NO river pixels => NO PIXCVecRiver shapefile generated")
@@ -191,58 +168,83 @@ class l2_hr_pixc_vec_river(object):
             
             my_api.printInfo("[l2_hr_pixc_vec_river] == write_file_asShp : %s ==" % IN_output_file)
             
-            # 1 - Initialisation du fichier de sortie
-            # 1.1 - Driver
-            shpDriver = ogr.GetDriverByName(str("ESRI Shapefile"))
-            # 1.2 - Creation du fichier
-            if os.path.exists(IN_output_file):
-                shpDriver.DeleteDataSource(IN_output_file)
-            outDataSource = shpDriver.CreateDataSource(IN_output_file)
-            # 1.3 - Creation de la couche
-            srs = osr.SpatialReference()
-            srs.ImportFromEPSG(4326)  # WGS84
-            outLayer = outDataSource.CreateLayer(str(os.path.basename(IN_output_file).split(".")[0]), srs, geom_type=ogr.wkbPoint)
-            # 1.4 - Creation des attributs
-            outLayer.CreateField(ogr.FieldDefn(str('AZ_INDEX'), ogr.OFTInteger))
-            outLayer.CreateField(ogr.FieldDefn(str('R_INDEX'), ogr.OFTInteger))
-            tmpField = ogr.FieldDefn(str('LAT2'), ogr.OFTReal)
-            tmpField.SetWidth(10)
-            tmpField.SetPrecision(6)
-            outLayer.CreateField(tmpField)
-            tmpField = ogr.FieldDefn(str('LONG2'), ogr.OFTReal)
-            tmpField.SetWidth(10)
-            tmpField.SetPrecision(6)
-            outLayer.CreateField(tmpField)
-            tmpField = ogr.FieldDefn(str('HEIGHT2'), ogr.OFTReal)
-            tmpField.SetWidth(10)
-            tmpField.SetPrecision(6)
-            outLayer.CreateField(tmpField)
-            outLayer.CreateField(ogr.FieldDefn(str('TAG'), ogr.OFTString))
-            outLayerDefn = outLayer.GetLayerDefn()
+            my_shp.write_points_file(IN_output_file, columns['longitude_vectorproc'], columns['latitude_vectorproc'], 
+                                     [('AZ_INDEX', ogr.OFTInteger, None, None, columns['azimuth_index']),
+                                      ('R_INDEX', ogr.OFTInteger, None, None, columns['range_index']),
+                                      ('LAT2', ogr.OFTReal, 10, 6, columns['latitude_vectorproc']),
+                                      ('LONG2', ogr.OFTReal, 10, 6, columns['longitude_vectorproc']),
+                                      ('HEIGHT2', ogr.OFTReal, 10, 6, columns['height_vectorproc']),
+                                      ('TAG', ogr.OFTString, None, None, columns['river_tag'])])
+    
+    #----------------------------------
+    
+    def get_river_columns(self):
+        """
+        Get the values of the river pixels, as written in the output files
+        They are computed at the first call, then shared by all the output files
+        
+        :return: values of each variable of the product, for river pixels only
+        :rtype: dict of 1D-array
+        """
+        
+        if self.river_columns is None:
+            
+            if self.pixc_river_idx is None:
+                self.pixc_river_idx = np.zeros(0, dtype=np.int32)
+            self.nb_pix_river = self.pixc_river_idx.size
             
-            # 2 - On traite point par point
-            for indp in self.pixc_river_idx:
-                # 2.1 - On cree l'objet dans le format de la couche de sortie
-                outFeature = ogr.Feature(outLayerDefn)
-                # 2.2 - On lui assigne le point
-                point = ogr.Geometry(ogr.wkbPoint)
-                point.AddPoint(self.longitude_vectorproc[indp], self.latitude_vectorproc[indp])
-                outFeature.SetGeometry(point)
-                # 2.3 - On lui assigne les attributs
-                outFeature.SetField(str('AZ_INDEX'), int(self.azimuth_index[indp]))
-                outFeature.SetField(str('R_INDEX'), int(self.range_index[indp]))
-                outFeature.SetField(str('LAT2'), float(self.latitude_vectorproc[indp]))
-                outFeature.SetField(str('LONG2'), float(self.longitude_vectorproc[indp]))
-                outFeature.SetField(str('HEIGHT2'), float(self.height_vectorproc[indp]))
-                outFeature.SetField(str('TAG'), str(self.river_tag[indp]))
-                # 2.4 - On ajoute l'objet dans la couche de sortie
-                outLayer.CreateFeature(outFeature)
+            # Improved geoloc of river pixels
+            if self.river_only:
+                latitude = self.latitude_vectorproc
+                longitude = self.longitude_vectorproc
+                height = self.height_vectorproc
+            else:
+                latitude = self.latitude_vectorproc[self.pixc_river_idx]
+                longitude = self.longitude_vectorproc[self.pixc_river_idx]
+                height = self.height_vectorproc[self.pixc_river_idx]
             
-            # 3 - Destroy the data sources to free resources
-            outDataSource.Destroy()
+            # River tag = specific prefix for all river pixels
+            river_tag = np.empty(self.nb_pix_river, dtype=object)
+            river_tag[:] = "1_"
+            
+            self.river_columns = {'pixc_index': self.pixc_river_idx,
+                                  'azimuth_index': self.azimuth_index[self.pixc_river_idx],
+                                  'range_index': self.range_index[self.pixc_river_idx],
+                                  'latitude_vectorproc': latitude,
+                                  'longitude_vectorproc': longitude,
+                                  'height_vectorproc': height,
+                                  'river_tag': river_tag}
+            
+        return self.river_columns
     
     #----------------------------------
     
+    def set_river_pixels(self, IN_pixc_river_idx, IN_latitude_vectorproc, IN_longitude_vectorproc, IN_height_vectorproc):
+        """
+        Set river pixels indices and their latitude / longitude / height vectorproc values, in a single call;
+        values are given for river pixels only, so that only them are extracted from the simulated arrays
+        
+        :param IN_pixc_river_idx: indices of river pixels within self.azimuth_index et al. (i.e. within the L2_HR_PIXC product)
+        :type IN_pixc_river_idx: 1D-array of int
+        :param IN_latitude_vectorproc: improved latitude values of river pixels (same size and same order as IN_pixc_river_idx)
+        :type IN_latitude_vectorproc: 1D-array of float
+        :param IN_longitude_vectorproc: improved longitude values of river pixels (same size and same order as IN_pixc_river_idx)
+        :type IN_longitude_vectorproc: 1D-array of float
+        :param IN_height_vectorproc: improved height values of river pixels (same size and same order as IN_pixc_river_idx)
+        :type IN_height_vectorproc: 1D-array of float
+        """
+        
+        for variable, name in ((IN_latitude_vectorproc, 'latitude_vectorproc'), (IN_longitude_vectorproc, 'longitude_vectorproc'), (IN_height_vectorproc, 'height_vectorproc')):
+            if len(variable) != len(IN_pixc_river_idx):
+                exit('[proc_real_pixc_vec_river/set_river_pixels] ERROR = There is a problem with the size of ' + name)
+        
+        self.pixc_river_idx = IN_pixc_river_idx
+        self.latitude_vectorproc = IN_latitude_vectorproc
+        self.longitude_vectorproc = IN_longitude_vectorproc
+        self.height_vectorproc = IN_height_vectorproc
+        self.river_only = True
+        self.river_columns = None
+    
     def set_vectorproc(self, IN_latitude_vectorproc, IN_longitude_vectorproc, IN_height_vectorproc):
         """
         Set latitude / longitude / height vectorproc values
@@ -258,6 +260,8 @@ class l2_hr_pixc_vec_river(object):
         self.latitude_vectorproc = IN_latitude_vectorproc
         self.longitude_vectorproc = IN_longitude_vectorproc
         self.height_vectorproc = IN_height_vectorproc
+        self.river_only = False
+        self.river_columns = None
 
     def set_river_lake_tag(self, IN_vFlag):
         """
@@ -267,15 +271,9 @@ class l2_hr_pixc_vec_river(object):
         :type IN_vFlag: 1D-array of int
         """
         
-        # Init as a 1D-array of string
-        self.river_tag = np.empty(len(IN_vFlag), dtype=object)
-        self.river_tag[:] = ""
-        
-        # Indices of river pixels
-        TMP_river_idx = np.where(IN_vFlag == 1)[0]
-        
-        # Set tag of river pixels to a specific prefix
-        self.river_tag[TMP_river_idx] = "1_"
+        # Indices of river pixels (their tag is set to a specific prefix in get_river_columns)
+        self.pixc_river_idx = np.where(IN_vFlag == 1)[0]
+        self.river_columns = None
                 
 
 #######################################
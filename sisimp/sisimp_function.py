@@ -14,6 +14,7 @@ This file is part of the SWOT Hydrology Toolbox
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 
+import multiprocessing
 import numpy as np
 import os
 from osgeo import osr, ogr 
@@ -24,10 +25,97 @@ import mathematical_function as math_fct
 import write_polygons as write_poly
 
 import lib.my_api as my_api
+import lib.my_cache as my_cache
+import lib.my_rng as my_rng
 from lib.my_variables import DEG2RAD, GEN_APPROX_RAD_EARTH
 
 
-def read_orbit(IN_filename, IN_cycle_number, IN_attributes):
+# Orbit arrays already read in this process (full path -> (modification time, arrays))
+ORBIT_CACHE = {}
+
+
+def read_orbit_file(IN_filename, IN_cache_dir=None):
+    """
+    Read the orbit from IN_filename, add the 2 margin points used by the extrapolators and 
+    precompute the trigonometric tables which do not depend on the orbit jitter
+    
+    As SWOT repeats the same ground tracks every cycle, these arrays are kept in memory for the next passes 
+    of the process, and stored in the binary cache (cf. my_cache) for the next simulations.
+    
+    :param IN_filename: full path of the orbit file
+    :type IN_filename: string
+    :param IN_cache_dir: cache directory (if None, only the in-memory cache is used)
+    :type IN_cache_dir: string
+    
+    :return: OUT_orbit = orbit arrays (do not modify them, they are shared between calls)
+    :rtype: OUT_orbit = dict of numpy arrays
+    """
+    full_path = os.path.abspath(IN_filename)
+    mtime = os.path.getmtime(full_path)
+    if (full_path in ORBIT_CACHE) and (ORBIT_CACHE[full_path][0] == mtime):
+        return ORBIT_CACHE[full_path][1]
+    
+    def compute_orbit_arrays():
+        OUT_arrays = {}
+        
+        ds = Dataset(IN_filename)
+        lon1 = ds.variables['longitude'][:] * DEG2RAD
+        lat1 = ds.variables['latitude'][:] * DEG2RAD
+        alt1 = ds.variables['altitude'][:]
+        heading1 = ds.variables['heading'][:] * DEG2RAD
+        
+        if "start_mission_time" in ds.ncattrs():
+            OUT_arrays["mission_start_time"] = np.array(ds.getncattr('start_mission_time'))  # Mission start time
+        elif "mission start time" in ds.ncattrs():
+            OUT_arrays["mission_start_time"] = np.array(ds.getncattr('mission start time'))  # Mission start time
+        OUT_arrays["cycle_duration"] = np.array(ds.getncattr('repeat_cycle_period'))
+        OUT_arrays["time"] = np.array(ds.variables['time'])
+        OUT_arrays["x"], OUT_arrays["y"], OUT_arrays["z"] = [np.array(ds.variables['x']), np.array(ds.variables['y']), np.array(ds.variables['z'])]
+        OUT_arrays["azimuth_spacing"] = np.array(ds.getncattr('azimuth_spacing'))
+        ds.close()
+        
+        # Add 2 points margin to avoid problems in azr_from_lonlat (interpolation)
+        n = len(lat1) + 2
+        lat = np.zeros(n)
+        lon = np.zeros(n)
+        alt = np.zeros(n)
+        heading = np.zeros(n)
+        lat[1:-1], lon[1:-1], alt[1:-1], heading[1:-1] = [lat1, lon1, alt1, heading1]
+        
+        sign = [-1,1][lat1[-1] < lat1[0]]
+        lat[0] = lat[1] + sign * 70000.0 / GEN_APPROX_RAD_EARTH*sin(heading1[0])
+        lat[-1] = lat[-2] - sign * 70000.0 / GEN_APPROX_RAD_EARTH*sin(heading1[-1])
+        
+        x = (lat[1] - lat[0]) / (lat[2] - lat[1])
+        lon[0] = lon[1] - x * (lon[2] - lon[1])
+        alt[0] = alt[1] - x * (alt[2] - alt[1])
+        heading[0] = heading[1] - x * (heading[2] - heading[1])
+        x = (lat[-2] - lat[-1]) / (lat[-3] - lat[-2])
+        lon[-1] = lon[-2] - x * (lon[-3] - lon[-2])
+        alt[-1] = alt[-2] - x * (alt[-3] - alt[-2])
+        heading[-1] = heading[-2] - x * (heading[-3] - heading[-2])
+        OUT_arrays["lon"], OUT_arrays["lat"], OUT_arrays["alt"], OUT_arrays["heading"] = [lon, lat, alt, heading]
+        
+        # Trigonometric tables independent of the orbit jitter (which only shifts longitudes)
+        OUT_arrays["costheta"] = np.cos(np.pi/2-lat)
+        OUT_arrays["sintheta"] = np.sin(np.pi/2-lat)
+        OUT_arrays["cospsi"] = np.cos(heading)
+        OUT_arrays["sinpsi"] = np.sin(heading)
+        
+        return OUT_arrays
+    
+    key = None
+    if IN_cache_dir is not None:
+        key = my_cache.compute_key(my_cache.compute_file_hash(full_path))
+    OUT_orbit = my_cache.get_cached_arrays(IN_cache_dir, "orbit", key, compute_orbit_arrays)
+    for array in OUT_orbit.values():
+        array.setflags(write=False)
+    ORBIT_CACHE[full_path] = (mtime, OUT_orbit)
+    
+    return OUT_orbit
+
+
+def read_orbit(IN_filename, IN_cycle_number, IN_attributes, IN_orbit_number):
     """
     Read the orbit from IN_filename. Store lon,lat,alt,heading + few data
     
@@ -37,7 +125,9 @@ def read_orbit(IN_filename, IN_cycle_number, IN_attributes):
     :type IN_cycle_number = int
     :param IN_attributes
     :type IN_attributes
-
+    :param IN_orbit_number: orbit number
+    :type IN_orbit_number: int
+    
     :param OUT_attributes
     :type OUT_attributes
     """
@@ -46,68 +136,40 @@ def read_orbit(IN_filename, IN_cycle_number, IN_attributes):
 
     OUT_attributes = IN_attributes
 
-    # Read the orbit file
-    ds = Dataset(IN_filename)
-    lon1 = ds.variables['longitude'][:] * DEG2RAD
-    lat1 = ds.variables['latitude'][:] * DEG2RAD
-    alt1 = ds.variables['altitude'][:]
-    heading1 = ds.variables['heading'][:] * DEG2RAD
-    
-    if "start_mission_time" in ds.ncattrs():
-        OUT_attributes.mission_start_time = ds.getncattr('start_mission_time')  # Mission start time
-    elif "mission start time" in ds.ncattrs():
-        OUT_attributes.mission_start_time = ds.getncattr('mission start time')  # Mission start time
-    OUT_attributes.cycle_duration = ds.getncattr('repeat_cycle_period')
-    OUT_attributes.orbit_time = np.array(ds.variables['time']) + IN_cycle_number*OUT_attributes.cycle_duration
-    
-    OUT_attributes.x, OUT_attributes.y, OUT_attributes.z, OUT_attributes.azimuth_spacing = [np.array(ds.variables['x']), np.array(ds.variables['y']), np.array(ds.variables['z']), ds.getncattr('azimuth_spacing')]
+    # Read the orbit file (or get it from the cache)
+    orbit = read_orbit_file(IN_filename, IN_attributes.cache_dir)
+    
+    if "mission_start_time" in orbit:
+        OUT_attributes.mission_start_time = str(orbit["mission_start_time"])  # Mission start time
+    OUT_attributes.cycle_duration = float(orbit["cycle_duration"])
+    OUT_attributes.orbit_time = orbit["time"] + IN_cycle_number*OUT_attributes.cycle_duration
+    
+    OUT_attributes.x, OUT_attributes.y, OUT_attributes.z, OUT_attributes.azimuth_spacing = [orbit["x"], orbit["y"], orbit["z"], float(orbit["azimuth_spacing"])]
+    OUT_attributes.vx, OUT_attributes.vy, OUT_attributes.vz = math_fct.calc_velocity(OUT_attributes.x, OUT_attributes.y, OUT_attributes.z, OUT_attributes.orbit_time)
     my_api.printDebug(str("Nb points on nadir track = %d" % (len(OUT_attributes.orbit_time)))) 
-
-    # Add 2 points margin to avoid problems in azr_from_lonlat (interpolation)
-    n = len(lat1) + 2
-    lat = np.zeros(n)
-    lon = np.zeros(n)
-    alt = np.zeros(n)
-    heading = np.zeros(n)
-    lat[1:-1], lon[1:-1], alt[1:-1], heading[1:-1] = [lat1, lon1, alt1, heading1]
-
-    sign = [-1,1][lat1[-1] < lat1[0]]
-    lat[0] = lat[1] + sign * 70000.0 / GEN_APPROX_RAD_EARTH*sin(heading1[0])
-    lat[-1] = lat[-2] - sign * 70000.0 / GEN_APPROX_RAD_EARTH*sin(heading1[-1])
-
-    x = (lat[1] - lat[0]) / (lat[2] - lat[1])
-    lon[0] = lon[1] - x * (lon[2] - lon[1])
-    alt[0] = alt[1] - x * (alt[2] - alt[1])
-    heading[0] = heading[1] - x * (heading[2] - heading[1])
-    x = (lat[-2] - lat[-1]) / (lat[-3] - lat[-2])
-    lon[-1] = lon[-2] - x * (lon[-3] - lon[-2])
-    alt[-1] = alt[-2] - x * (alt[-3] - alt[-2])
-    heading[-1] = heading[-2] - x * (heading[-3] - heading[-2])
     
     # Add lon noise
+    lon = orbit["lon"]
     my_api.printDebug("lon[0] before orbit jitter = %.6f" % (lon[0]))
-    lon = lon + math_fct.calc_delta_jitter(heading, lat, IN_attributes.orbit_jitter)
+    # Same random stream for both swaths of the pass, so that they share the same orbit jitter
+    jitter_rng = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, None, "orbit_jitter")
+    lon = lon + math_fct.calc_delta_jitter(orbit["heading"], orbit["lat"], IN_attributes.orbit_jitter, rng=jitter_rng)
     my_api.printDebug("lon[0] after orbit jitter = %.6f" % (lon[0]))
     
     # !!! Do not forget that indices 0 and -1 correspond to fake values, just used for extrapolations
     # Variable name ended with _init will be use to linear_exptrap
     
-    
-    
     OUT_attributes.lon = OUT_attributes.lon_init = lon 
-    OUT_attributes.lat = OUT_attributes.lat_init = lat
-    OUT_attributes.alt = alt 
-    OUT_attributes.heading = OUT_attributes.heading_init =  heading
- 
+    OUT_attributes.lat = OUT_attributes.lat_init = orbit["lat"]
+    OUT_attributes.alt = orbit["alt"]
+    OUT_attributes.heading = OUT_attributes.heading_init = orbit["heading"]
  
     OUT_attributes.cosphi_init = np.cos(lon)
     OUT_attributes.sinphi_init = np.sin(lon)
-    OUT_attributes.costheta_init = np.cos(np.pi/2-lat)
-    OUT_attributes.sintheta_init = np.sin(np.pi/2-lat)
-    OUT_attributes.cospsi_init = np.cos(heading)
-    OUT_attributes.sinpsi_init = np.sin(heading)
-
-    OUT_attributes
+    OUT_attributes.costheta_init = orbit["costheta"]
+    OUT_attributes.sintheta_init = orbit["sintheta"]
+    OUT_attributes.cospsi_init = orbit["cospsi"]
+    OUT_attributes.sinpsi_init = orbit["sinpsi"]
     
     return OUT_attributes
 
@@ -136,29 +198,56 @@ def make_pixel_cloud(IN_side_name, IN_cycle_number, IN_orbit_number, IN_attribut
     # 1 - Reproject shapefile in radar coordinates
     fshp = IN_attributes.shapefile_path + ".shp"
     driver = ogr.GetDriverByName(str("ESRI Shapefile"))
-    fshp_reproj, IN_attributes = write_poly.reproject_shapefile(fshp, swath, driver, IN_attributes, IN_cycle_number)
+    reproj_datasource, IN_attributes = write_poly.reproject_shapefile(fshp, swath, driver, IN_attributes, IN_cycle_number, IN_orbit_number)
     
-    if fshp_reproj is None:  # No water body crossing the swath => stop process
+    if reproj_datasource is None:  # No water body crossing the swath => stop process
         my_api.printInfo("No output data file to write")
         return IN_attributes
     
-    # 2 - Compute the intersection between the radar grid and the water bodies
-    water_pixels, IN_attributes.height_model_a_tab,  IN_attributes.code, IN_attributes.ind_lac, IN_attributes = write_poly.compute_pixels_in_water(fshp_reproj, False, IN_attributes)
+    # 2 - Split the swath in along-track chunks, aligned on tiles, to bound the memory used by the radar grid
+    nb_az = len(IN_attributes.lon)
+    IN_attributes.tile_values = write_poly.compute_tile_values(IN_attributes, IN_orbit_number)
+    az_chunks = write_poly.compute_az_chunks(IN_attributes.tile_values, nb_az, IN_attributes.az_chunk_size)
+    if len(az_chunks) > 1:
+        my_api.printInfo("> Swath processed in %d along-track chunks" % len(az_chunks))
     
-    #~ if IN_attributes.create_pixc_vec_river:
-        #~ water_pixels_river, height_model_a_river_only, code_a_river_only, ind_lac_a_river_only, IN_attributes = write_poly.compute_pixels_in_water(fshp_reproj, True, IN_attributes)
-        #~ water_pixels = water_pixels + water_pixels_river  # Land=0 ; Lake and other=1 ; River=2
-    #~ my_api.printInfo("-> water_pixels : nb_lignes=%d nb_col=%d" % (water_pixels.shape[0], water_pixels.shape[1]))
+    # Pool of processes writing the tile files, shared by all the chunks of the swath
+    # (processes rather than threads, as the HDF5 library is not thread-safe)
+    writer_pool = None
+    nb_tiles = np.unique(IN_attributes.tile_values).size
+    if IN_attributes.nb_writers > 1 and nb_tiles > 1:
+        writer_pool = multiprocessing.Pool(processes=min(IN_attributes.nb_writers, nb_tiles))
+    try:
+        
+        for az_start, az_end in az_chunks:
+            
+            # 3 - Compute the intersection between the radar grid and the water bodies
+            water_pixels, IN_attributes.height_model_a_tab,  IN_attributes.code, IN_attributes.ind_lac, IN_attributes = write_poly.compute_pixels_in_water(reproj_datasource, False, IN_attributes, IN_az_range=(az_start, az_end))
+            
+            #~ if IN_attributes.create_pixc_vec_river:
+                #~ water_pixels_river, height_model_a_river_only, code_a_river_only, ind_lac_a_river_only, IN_attributes = write_poly.compute_pixels_in_water(reproj_datasource, True, IN_attributes)
+                #~ water_pixels = water_pixels + water_pixels_river  # Land=0 ; Lake and other=1 ; River=2
+            #~ my_api.printInfo("-> water_pixels : nb_lignes=%d nb_col=%d" % (water_pixels.shape[0], water_pixels.shape[1]))
+        
+            # 4 - Convert water pixels in lon-lat and output them
+            nb_water_pixels = np.count_nonzero(water_pixels) 
+            if nb_water_pixels == 0:
+                my_api.printInfo("Nb water pixels = 0 in azimuth [%d, %d[ -> No output data file to write" % (az_start, az_end))
+            else:
+                write_poly.write_water_pixels_realPixC(water_pixels, swath, IN_cycle_number, IN_orbit_number, IN_attributes, IN_az_offset=az_start, IN_writer_pool=writer_pool)
+            
+            # Free the radar grid of the chunk before processing the next one
+            water_pixels = None
+            IN_attributes.height_model_a_tab = IN_attributes.code = IN_attributes.ind_lac = None
+        
+    finally:
+        # All tile files are written (write_water_pixels_realPixC waits for them): stop the writers, also on error
+        if writer_pool is not None:
+            writer_pool.terminate()
+            writer_pool.join()
     
-    # 3 - Delete temporary file
-    driver.DeleteDataSource(fshp_reproj)
-
-    # 4 - Convert water pixels in lon-lat and output them
-    nb_water_pixels = np.count_nonzero(water_pixels) 
-    if nb_water_pixels == 0:
-        my_api.printInfo("Nb water pixels = 0 -> No output data file to write")
-    else:
-        write_poly.write_water_pixels_realPixC(water_pixels, swath, IN_cycle_number, IN_orbit_number, IN_attributes)
+    # 5 - Free in-memory datasource
+    reproj_datasource = None
     
     return IN_attributes
 
@@ -11,6 +11,8 @@ This file is part of the SWOT Hydrology Toolbox
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import copy
+import multiprocessing
 import numpy as np
 import os
 from osgeo import osr, ogr
@@ -18,9 +20,11 @@ import re
 import zipfile
 
 import lib.my_api as my_api
+import lib.my_cache as my_cache
 import lib.my_filenames as my_names
 import lib.my_passplan as my_plan
 import lib.my_rdf_file as my_rdf
+import lib.my_rng as my_rng
 import lib.my_tools as my_tools
 
 import sisimp_function as sisimp_fct
@@ -30,7 +34,8 @@ from lib.my_variables import SWATH_WIDTH, NR_CROSS_TRACK, SENSOR_WAVELENGTH, NB_
         HEIGHT_MODEL_t0, HEIGHT_MODEL_PERIOD, HEIGHT_MODEL_MIN_AREA, HEIGHT_BIAS_STD, NOISE_MULTIPLIER_FACTOR, RANGE_SAMPLING, \
         WATER_FLAG, MULTIPLE_ORBIT, COEFF_X2, COEFF_Y2, COEFF_X, COEFF_Y, COEFF_XY, COEFF_CST, GEOLOCATION_IMPROVEMENT, \
         FACT_ECHELLE, HEIGHT_MODEL, HEIGHT_MODEL_STDV, GEN_APPROX_RAD_EARTH, RAD2DEG, DEG2RAD, FACT_ECHELLE_DW, DW_PERCENT, DARKWATER_FLAG, \
-        SCALE_FACTOR_NON_DETECTED_DW, DW_DETECTED_PERCENT, DW_DETECTED_NOISE_FACTOR
+        SCALE_FACTOR_NON_DETECTED_DW, DW_DETECTED_PERCENT, DW_DETECTED_NOISE_FACTOR, NB_PROC, \
+        HEIGHT_MODEL_MAX_CELLS, NB_WRITERS, AZ_CHUNK_SIZE
 
 
 def read_parameter(IN_rdf_reader, IN_instrument_name, IN_instrument_default_value, read_type):
@@ -42,6 +47,82 @@ def read_parameter(IN_rdf_reader, IN_instrument_name, IN_instrument_default_valu
         my_api.printInfo("Default value for %s : %s" % (IN_instrument_name ,str(OUT_instrument_param)))
     return OUT_instrument_param
 
+
+def read_tile_database(IN_file):
+    """
+    Read the tile database (pass_number/tile_number/nadir_lat/nadir_lon/nadir_heading) from the tiles_full.txt file 
+    of the given zip archive, and sort it by pass number
+    
+    :param IN_file: full path of the zip archive
+    :type IN_file: string
+    
+    :return: OUT_tile_db = tile database, sorted by pass number
+    :rtype: OUT_tile_db = 2D-array of float
+    """
+    archive = zipfile.ZipFile(IN_file, "r")
+    imgfile = archive.open("tiles_full.txt")
+    OUT_tile_db = np.loadtxt(imgfile, skiprows=1)
+    archive.close()
+    # Stable sort, to keep the order of the tiles within a pass
+    OUT_tile_db = OUT_tile_db[np.argsort(OUT_tile_db[:, 0], kind="mergesort")]
+    return OUT_tile_db
+
+
+# Attributes shared by all the processes of the pool (set by init_worker)
+WORKER_ATTRIBUTES = None
+
+
+def init_worker(IN_attributes):
+    """
+    Initialize a process of the pool with the simulation attributes, sent once per process
+    
+    :param IN_attributes: attributes of the simulation, filled by Processing.run_preprocessing
+    :type IN_attributes: orbitAttributes
+    """
+    global WORKER_ATTRIBUTES
+    WORKER_ATTRIBUTES = IN_attributes
+
+
+def process_swath(IN_unit):
+    """
+    Simulate the pixel cloud of one swath of one pass; unit of work of the parallel processing
+    
+    :param IN_unit: (cycle number, orbit number, orbit file, swath name) to process
+    :type IN_unit: tuple
+    
+    :return: OUT_result = dict with the swath polygon (as WKT), the list of written PIXC files, 
+                and the orbit file attributes needed to write the footprint file
+    :rtype: OUT_result = dict
+    """
+    cycle_number, orbit_number, orbit_file, swath = IN_unit
+    
+    # 1 - Init attributes of the unit
+    attributes = copy.copy(WORKER_ATTRIBUTES)
+    attributes.swath_polygons = {}
+    attributes.pixc_files = []
+    attributes.nb_writers = 1  # Processes of the pool are daemonic and can't have a writer pool
+    
+    try:
+        
+        # 2 - Read orbit file
+        attributes = sisimp_fct.read_orbit(orbit_file, cycle_number, attributes, orbit_number)
+        attributes.sisimp_filenames = my_names.sisimpFilenames(attributes.out_dir, attributes.mission_start_time, attributes.cycle_duration, cycle_number, orbit_number)
+        
+        # 3 - Process swath
+        attributes = sisimp_fct.make_pixel_cloud(swath, cycle_number, orbit_number, attributes)
+        
+    except SystemExit as exc:
+        # my_api.exitWithError calls sys.exit, which would kill the process of the pool without notifying the parent
+        raise RuntimeError("Cycle %03d - Pass %03d - %s swath: %s" % (cycle_number, orbit_number, swath, str(exc)))
+        
+    OUT_result = {}
+    OUT_result["swath_polygon"] = attributes.swath_polygons[swath].ExportToWkt()
+    OUT_result["pixc_files"] = attributes.pixc_files
+    OUT_result["mission_start_time"] = attributes.mission_start_time
+    OUT_result["cycle_duration"] = attributes.cycle_duration
+    return OUT_result
+
+
 class Processing(object):
 
     def __init__(self):
@@ -128,6 +209,16 @@ class Processing(object):
             self.my_attributes.range_sampling = read_parameter(parameters, "Range sampling", RANGE_SAMPLING, float)
             self.my_attributes.nb_pix_range = read_parameter(parameters, "Number of pixels in range", NB_PIX_RANGE, int)
             self.my_attributes.orbit_jitter = read_parameter(parameters, "Orbit jitter", ORBIT_JITTER, float)
+            
+            # Parallel processing parameters
+            self.my_attributes.nb_proc = read_parameter(parameters, "Number of processes", NB_PROC, int)
+            self.my_attributes.random_seed = read_parameter(parameters, "Random seed", None, int)
+            if self.my_attributes.random_seed is None:
+                # Drawn main seed, printed so that the simulation can be reproduced
+                self.my_attributes.random_seed = my_rng.draw_main_seed()
+                my_api.printInfo("Random seed : %d (drawn)" % self.my_attributes.random_seed)
+            self.my_attributes.nb_writers = read_parameter(parameters, "Number of writers", NB_WRITERS, int)
+            self.my_attributes.az_chunk_size = read_parameter(parameters, "Along-track chunk size", AZ_CHUNK_SIZE, int)
 
             # Height model parameter
             self.my_attributes.height_model = read_parameter(parameters, "Height model", HEIGHT_MODEL, str)
@@ -189,6 +280,7 @@ class Processing(object):
                     # Only for gaussian model
                     if self.my_attributes.height_model == "gaussian":
                         self.my_attributes.height_model_stdv = read_parameter(parameters, "Height 2d model stdv", HEIGHT_MODEL_STDV, float)
+                        self.my_attributes.height_model_max_cells = read_parameter(parameters, "Height 2d model max grid size", HEIGHT_MODEL_MAX_CELLS, int)
                     
                 elif self.my_attributes.height_model == "reference_height":
                     self.my_attributes.height_name = read_parameter(parameters, "Height shp attribute name", "HEIGHT", str)
@@ -237,12 +329,21 @@ class Processing(object):
                 my_api.exitWithError("%s attribute not found in %s; reference_height model option can't be applied" % (self.my_attributes.height_name, self.my_attributes.shapefile_path+".shp"))
 
 
+        # Cache directory, for binary versions of the input tables (opt-in: no disk cache if not filled)
+        self.my_attributes.cache_dir = parameters.getValue("Cache directory")
+        if self.my_attributes.cache_dir is not None:
+            self.my_attributes.cache_dir = os.path.expandvars(self.my_attributes.cache_dir)
+        my_api.printInfo("Cache directory : %s" % str(self.my_attributes.cache_dir))
+
         # Load the noise tab
         noise_file_path = ""
         try:
-            self.my_attributes.noise_height = np.loadtxt(os.path.expandvars(parameters.getValue("Noise file path")), skiprows=1)
+            noise_file_path = os.path.expandvars(parameters.getValue("Noise file path"))
+            noise_height = my_cache.get_cached_arrays(self.my_attributes.cache_dir, "noise", my_cache.compute_key(my_cache.compute_file_hash(noise_file_path)), 
+                                                      lambda: {"noise_height": np.loadtxt(noise_file_path, skiprows=1)})["noise_height"]
+            self.my_attributes.noise_height = np.copy(noise_height)
             self.my_attributes.noise_height[:, 1] = self.my_attributes.noise_multiplier_factor * self.my_attributes.noise_height[:, 1]
-            self.my_attributes.dw_detected_noise_height = np.loadtxt(os.path.expandvars(parameters.getValue("Noise file path")), skiprows=1)
+            self.my_attributes.dw_detected_noise_height = np.copy(noise_height)
             self.my_attributes.dw_detected_noise_height[:,1]=self.my_attributes.dw_detected_noise_factor*self.my_attributes.noise_height[:,1]
             
         except IOError:
@@ -250,11 +351,11 @@ class Processing(object):
 
 
         # Load the tile database file
-        noise_file_path = ""
+        # NB: the database is sorted by pass number, so that the tiles of a pass are retrieved by dichotomy (cf. write_polygons.get_tile_db_orbit)
         try:
-            archive = zipfile.ZipFile(os.path.expandvars(parameters.getValue("Tile database path")), "r")
-            imgfile = archive.open("tiles_full.txt")
-            self.my_attributes.tile_database = np.loadtxt(imgfile, skiprows=1)
+            tile_db_path = os.path.expandvars(parameters.getValue("Tile database path"))
+            self.my_attributes.tile_database = my_cache.get_cached_arrays(self.my_attributes.cache_dir, "tile_database", my_cache.compute_key(my_cache.compute_file_hash(tile_db_path)), 
+                                                                          lambda: {"tile_database": read_tile_database(tile_db_path)})["tile_database"]
         except IOError:
             my_api.exitWithError("Tile database not found ")
             
@@ -310,6 +411,11 @@ class Processing(object):
         except Exception:
             self.my_attributes.create_shapefile = False
             my_api.printInfo("No Create shapefile parameter set, no shapefile will be created")
+        if self.my_attributes.create_shapefile:
+            vector_format = read_parameter(parameters, "Vector file format", "shp", str).lower()
+            if vector_format not in ["shp", "gpkg", "fgb"]:
+                my_api.exitWithError("Vector file format must be shp, gpkg or fgb (currently %s)" % vector_format)
+            self.my_attributes.vector_file_ext = "." + vector_format
 
         # Create dummy L2_HR_PIXCVecRiver product, associated to pixel cloud  
         try:
@@ -331,31 +437,81 @@ class Processing(object):
         my_api.printInfo("")
         my_api.printInfo("[sisimp_processing] PROCESSING...")
         my_api.printInfo("")
-
-        for elem in self.my_attributes.orbit_list:  # Process per element in orbit list = triplet (cycle_number, orbit_number, orbit_file)
-            
-            my_api.printInfo(">>> CYCLE %03d and ORBIT %03d <<<" % (elem[0], elem[1]))
-            my_api.printInfo("")
-            
-            # 1 - Read orbit file
-            self.my_attributes = sisimp_fct.read_orbit(elem[2], elem[0], self.my_attributes)
-            my_api.printInfo("")
-            
-            # 2 - Init SISIMP filenames object
-            self.my_attributes.sisimp_filenames = my_names.sisimpFilenames(self.my_attributes.out_dir, self.my_attributes.mission_start_time, self.my_attributes.cycle_duration, elem[0], elem[1])
+        
+        if self.my_attributes.nb_proc > 1:
+            self.run_processing_parallel()
             
-            # 3 - Process right swath
-            self.my_attributes = sisimp_fct.make_pixel_cloud("Right", elem[0], elem[1],self.my_attributes)
-            my_api.printInfo("")
+        else:
+
+            for elem in self.my_attributes.orbit_list:  # Process per element in orbit list = triplet (cycle_number, orbit_number, orbit_file)
+                
+                my_api.printInfo(">>> CYCLE %03d and ORBIT %03d <<<" % (elem[0], elem[1]))
+                my_api.printInfo("")
+                
+                # 1 - Read orbit file
+                self.my_attributes = sisimp_fct.read_orbit(elem[2], elem[0], self.my_attributes, elem[1])
+                my_api.printInfo("")
+                
+                # 2 - Init SISIMP filenames object
+                self.my_attributes.sisimp_filenames = my_names.sisimpFilenames(self.my_attributes.out_dir, self.my_attributes.mission_start_time, self.my_attributes.cycle_duration, elem[0], elem[1])
+                
+                # 3 - Process right swath
+                self.my_attributes = sisimp_fct.make_pixel_cloud("Right", elem[0], elem[1],self.my_attributes)
+                my_api.printInfo("")
+                
+                # 4 - Process left swath
+                self.my_attributes = sisimp_fct.make_pixel_cloud("Left", elem[0], elem[1], self.my_attributes)
+                my_api.printInfo("")
+                
+                # 5 - Write swath polygons shapefile
+                sisimp_fct.write_swath_polygons(self.my_attributes)
+                my_api.printInfo("")
+                my_api.printInfo("")
+        
+        # Summary of produced files
+        my_api.printInfo("List of PIXC files written =")
+        for pixc_file in self.my_attributes.pixc_files:
+            my_api.printInfo(pixc_file)
             
-            # 4 - Process left swath
-            self.my_attributes = sisimp_fct.make_pixel_cloud("Left", elem[0], elem[1], self.my_attributes)
-            my_api.printInfo("")
+    def run_processing_parallel(self):
+        """
+        Parallel version of the main process: each (cycle, pass, swath) unit is simulated 
+        by a process of a pool of self.my_attributes.nb_proc processes
+        """
+        my_api.printInfo("[sisimp_processing] Parallel processing with %d processes" % self.my_attributes.nb_proc)
+        
+        # 1 - List units to process; Right swath before Left swath, as in the sequential processing
+        list_units = []
+        for elem in self.my_attributes.orbit_list:
+            for swath in ["Right", "Left"]:
+                list_units.append((elem[0], elem[1], elem[2], swath))
+        
+        # 2 - Run units in the pool; results are retrieved in the order of list_units
+        pool = multiprocessing.Pool(processes=self.my_attributes.nb_proc, initializer=init_worker, initargs=(self.my_attributes,))
+        try:
             
-            # 5 - Write swath polygons shapefile
-            sisimp_fct.write_swath_polygons(self.my_attributes)
-            my_api.printInfo("")
-            my_api.printInfo("")
+            for ind, result in enumerate(pool.imap(process_swath, list_units)):
+                
+                cycle_number, orbit_number, orbit_file, swath = list_units[ind]
+                my_api.printInfo(">>> CYCLE %03d and ORBIT %03d - %s swath done (%d PIXC file(s)) <<<" % (cycle_number, orbit_number, swath, len(result["pixc_files"])))
+                
+                self.my_attributes.swath_polygons[swath] = ogr.CreateGeometryFromWkt(result["swath_polygon"])
+                self.my_attributes.pixc_files.extend(result["pixc_files"])
+                
+                # Write swath polygons shapefile when both swaths of the pass are done
+                if swath == "Left":
+                    self.my_attributes.sisimp_filenames = my_names.sisimpFilenames(self.my_attributes.out_dir, result["mission_start_time"], result["cycle_duration"], cycle_number, orbit_number)
+                    sisimp_fct.write_swath_polygons(self.my_attributes)
+                    self.my_attributes.swath_polygons = {}
+                    
+        except BaseException:
+            # Stop the remaining units instead of waiting for them
+            pool.terminate()
+            pool.join()
+            raise
+        pool.close()
+        pool.join()
+        my_api.printInfo("")
 
     def run_postprocessing(self):
         """
@@ -0,0 +1,17 @@
+# -*- coding: utf8 -*-
+'''
+.. module conftest.py
+    :synopsis: pytest configuration of SISIMP tests (SISIMP modules are imported as in sisimp/ directory)
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
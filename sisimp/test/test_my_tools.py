@@ -0,0 +1,129 @@
+# -*- coding: utf8 -*-
+'''
+.. module test_my_tools.py
+    :synopsis: Tests of lib.my_tools module, wrt the former loop implementations
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+import math
+import numpy as np
+import pytest
+
+pytest.importorskip("shapely")
+from shapely.ops import cascaded_union
+import shapely.geometry as geometry
+
+import lib.my_tools as my_tools
+
+
+#######################################
+# Former loop implementations, used as reference
+
+def computeBinMat_loop(IN_sizeX, IN_sizeY, IN_X, IN_Y):
+    OUT_binIm = np.zeros((IN_sizeY, IN_sizeX))
+    for ind in range(IN_X.size): 
+        OUT_binIm[IN_Y[ind], IN_X[ind]] = 1
+    return OUT_binIm
+
+
+def convert2dMatIn1dVec_loop(IN_X, IN_Y, IN_mat):
+    OUT_vector = np.zeros(IN_X.size)
+    for indp in range(IN_X.size):
+        OUT_vector[indp] = IN_mat[IN_Y[indp], IN_X[indp]]
+    return OUT_vector
+
+
+def alpha_shape_triangles_loop(IN_coords, IN_simplices, IN_alpha):
+    list_triangle = []
+    for ia, ib, ic in IN_simplices:
+        pa = IN_coords[ia]
+        pb = IN_coords[ib]
+        pc = IN_coords[ic]
+        a = math.sqrt((pa[0]-pb[0])**2 + (pa[1]-pb[1])**2)
+        b = math.sqrt((pb[0]-pc[0])**2 + (pb[1]-pc[1])**2)
+        c = math.sqrt((pc[0]-pa[0])**2 + (pc[1]-pa[1])**2)
+        s = (a + b + c)/2.0
+        area = math.sqrt(s*(s-a)*(s-b)*(s-c))
+        circum_r = 0
+        if ( area != 0 ):
+            circum_r = a*b*c/(4.0*area)
+        if circum_r < 1.0/IN_alpha:
+            list_triangle.append(geometry.Polygon([(pa[0], pa[1]),(pb[0], pb[1]),(pc[0], pc[1])]))
+    return list_triangle
+
+
+class FakeDelaunay(object):
+    '''
+    Triangulation with given triangles, to test degenerate ones
+    '''
+    simplices = None
+    
+    def __init__(self, IN_coords):
+        pass
+
+#######################################
+
+
+def test_computeBinMat():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 300, 20000)
+    y = rng.integers(0, 200, 20000)
+    x[:2] = [0, 299]
+    y[:2] = [0, 199]
+    bin_mat = my_tools.computeBinMat(300, 200, x, y)
+    reference = computeBinMat_loop(300, 200, x, y)
+    assert bin_mat.dtype == reference.dtype
+    np.testing.assert_array_equal(bin_mat, reference)
+
+
+def test_computeBinMat_errors():
+    with pytest.raises(ValueError):
+        my_tools.computeBinMat(10, 10, np.array([1, 2]), np.array([1]))
+    with pytest.raises(ValueError):
+        my_tools.computeBinMat(10, 10, np.array([10]), np.array([1]))
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32, np.int32])
+def test_convert2dMatIn1dVec(dtype):
+    rng = np.random.default_rng(1)
+    mat = (rng.random((200, 300)) * 100).astype(dtype)
+    x = rng.integers(0, 300, 20000)
+    y = rng.integers(0, 200, 20000)
+    vector = my_tools.convert2dMatIn1dVec(x, y, mat)
+    reference = convert2dMatIn1dVec_loop(x, y, mat)
+    assert vector.dtype == reference.dtype
+    np.testing.assert_array_equal(vector, reference)
+
+
+@pytest.mark.parametrize("alpha", [5., 20., 50.])
+def test_alpha_shape(alpha):
+    rng = np.random.default_rng(2)
+    coords = rng.random((2000, 2))
+    from scipy.spatial import Delaunay
+    reference = cascaded_union(alpha_shape_triangles_loop(coords, Delaunay(coords).simplices, alpha))
+    assert my_tools.alpha_shape(coords, alpha).equals(reference)
+
+
+def test_alpha_shape_degenerate_triangles(monkeypatch):
+    coords = np.array([[0., 0.], [0.1, 0.1], [0.5, 0.5], [1., 0.], [0., 1.], [0.8, 1.6], [0.9, 1.8]])
+    # Flat triangle with a null Heron product: kept by the loop implementation (circumradius set to 0)
+    flat = [0, 1, 2]
+    # Flat triangle with a slightly negative Heron product (rounding errors): the loop implementation failed on it
+    flat_negative = [0, 5, 6]
+    # Regular triangle
+    regular = [0, 3, 4]
+    monkeypatch.setattr(FakeDelaunay, "simplices", np.array([flat, regular, flat_negative]))
+    monkeypatch.setattr(my_tools, "Delaunay", FakeDelaunay)
+    
+    with pytest.raises(ValueError):
+        alpha_shape_triangles_loop(coords, [flat_negative], 1.)
+    
+    # All flat triangles are kept, as the triangles of null area in the loop implementation
+    reference = alpha_shape_triangles_loop(coords, [flat, regular], 1.) + [geometry.Polygon(coords[flat_negative].tolist())]
+    assert my_tools.alpha_shape(coords, 1.).equals(cascaded_union(reference))
@@ -0,0 +1,51 @@
+# -*- coding: utf8 -*-
+'''
+.. module test_proc_real_pixc.py
+    :synopsis: Tests of proc_real_pixc module
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+import proc_real_pixc
+
+
+def compute_illumination_time_loop(IN_nadir_time, IN_sensor_s):
+    '''
+    Former loop implementation of the illumination time, used as reference
+    '''
+    OUT_illumination_time = np.zeros(len(IN_sensor_s))
+    for i in range(OUT_illumination_time.size):
+        OUT_illumination_time[i] = IN_nadir_time[IN_sensor_s[i]]
+    return OUT_illumination_time
+
+
+@pytest.mark.parametrize("nb_pix", [0, 1, 1000])
+def test_compute_illumination_time(nb_pix):
+    rng = np.random.default_rng(nb_pix)
+    nadir_time = np.sort(rng.uniform(0., 1.e5, 500))
+    # Random azimuth indices, including the first and last nadir points
+    sensor_s = rng.integers(0, nadir_time.size, nb_pix)
+    if nb_pix > 1:
+        sensor_s[:2] = [0, nadir_time.size-1]
+    
+    illumination_time = proc_real_pixc.compute_illumination_time(nadir_time, sensor_s)
+    
+    reference = compute_illumination_time_loop(nadir_time, sensor_s)
+    assert illumination_time.dtype == reference.dtype
+    np.testing.assert_array_equal(illumination_time, reference)
+
+
+def test_compute_illumination_time_list_input():
+    nadir_time = [0., 0.5, 1.5, 3.]
+    sensor_s = np.array([3, 0, 2, 2, 1])
+    np.testing.assert_array_equal(proc_real_pixc.compute_illumination_time(nadir_time, sensor_s),
+                                  compute_illumination_time_loop(nadir_time, sensor_s))
@@ -0,0 +1,131 @@
+# -*- coding: utf8 -*-
+'''
+.. module test_write_polygons.py
+    :synopsis: Tests of write_polygons module
+
+.. module author: CNES DSO/SI/TR
+
+This file is part of the SWOT Hydrology Toolbox
+ Copyright (C) 2018 Centre National d’Etudes Spatiales
+ This software is released under open source license LGPL v.3 and is distributed WITHOUT ANY WARRANTY, read LICENSE.txt for further details.
+
+
+'''
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+pytest.importorskip("skimage")
+write_poly = pytest.importorskip("write_polygons")
+
+
+NB_AZ = 302  # Number of azimuth indices of the swath (1st and last ones only used for extrapolations)
+NB_PIX_RANGE = 60
+NB_AZ_PER_TILE = 50
+
+
+class FakeLac(object):
+    '''
+    Water body with a constant height
+    '''
+    num = 1
+    hmean = 10.
+
+    def compute_h(self, IN_lat, IN_lon):
+        return np.full(IN_lat.shape, self.hmean)
+
+
+class FakeFilenames(object):
+    '''
+    Filenames of the simulation, without any file written
+    '''
+    pixc_file = file_annot_file = pixc_vec_river_file = "pixc"
+
+    def updateWithTileRef(self, IN_tile_ref, IN_sec_in_cycle_start, IN_sec_in_cycle_end):
+        pass
+
+
+def make_attributes(IN_water_pixels):
+    '''
+    Attributes of a swath whose nadir points are split in tiles of NB_AZ_PER_TILE azimuth indices
+    '''
+    attributes = write_poly.orbitAttributes()
+    attributes.random_seed = 1234
+    attributes.dark_water = "yes"
+    attributes.dw_pourcent = 20.
+    attributes.dw_seed = None
+    attributes.dw_detected_percent = 50.
+    attributes.water_flag = 4
+    attributes.darkwater_flag = 24
+    attributes.noise_height = np.array([[0., 0.1], [90., 0.2]])
+    attributes.dw_detected_noise_height = np.array([[0., 0.5], [90., 1.]])
+    attributes.height_bias_std = 0.1
+    attributes.height_model = "polynomial"
+    attributes.height_model_a_tab = None
+    attributes.code = None
+    attributes.liste_lacs = [FakeLac()]
+    attributes.roll_file = None
+    attributes.tropo_model = None
+    attributes.nr_cross_track = 10000.
+    attributes.range_sampling = 0.75
+    attributes.azimuth_spacing = 21.875
+    attributes.near_range = 0.
+    attributes.nb_pix_range = NB_PIX_RANGE
+    attributes.alt = np.full(NB_AZ, 890000.)
+    attributes.lat = attributes.lon = attributes.heading = np.linspace(0., 0.01, NB_AZ)
+    attributes.x = attributes.y = attributes.z = np.zeros(NB_AZ)
+    attributes.vx = attributes.vy = attributes.vz = np.zeros(NB_AZ)
+    attributes.orbit_time = np.arange(NB_AZ, dtype=float)
+    attributes.mission_start_time = "2000-01-01"
+    attributes.cycle_duration = 1.
+    attributes.tile_values = 1 + np.arange(NB_AZ-2) // NB_AZ_PER_TILE
+    attributes.nb_writers = 1
+    attributes.create_pixc_vec_river = False
+    attributes.create_shapefile = False
+    attributes.sisimp_filenames = FakeFilenames()
+    attributes.pixc_files = []
+    attributes.full_ind_lac = IN_water_pixels.astype(np.int32)
+    return attributes
+
+
+def simulate_swath(monkeypatch, IN_water_pixels, IN_chunk_size):
+    '''
+    Run write_water_pixels_realPixC over the along-track chunks of the swath, as make_pixel_cloud does
+
+    :return: classification and height of each tile, by tile reference
+    :rtype: dict
+    '''
+    OUT_tiles = {}
+
+    def fake_l2_hr_pixc(*args):
+        OUT_tiles[args[24]] = (args[2].copy(), args[6].copy())
+
+    monkeypatch.setattr(write_poly.proc_real_pixc, "l2_hr_pixc", fake_l2_hr_pixc)
+    monkeypatch.setattr(write_poly, "write_tile_files", lambda *args: None)
+    monkeypatch.setattr(write_poly.math_fct, "lonlat_from_azy", lambda az, ri, *args, **kwargs: (az * 1.e-5, ri * 1.e-7))
+
+    attributes = make_attributes(IN_water_pixels)
+    for az_start, az_end in write_poly.compute_az_chunks(attributes.tile_values, NB_AZ, IN_chunk_size):
+        attributes.ind_lac = attributes.full_ind_lac[:, az_start:az_end]
+        water_pixels = IN_water_pixels[:, az_start:az_end].copy()
+        if np.count_nonzero(water_pixels) != 0:
+            write_poly.write_water_pixels_realPixC(water_pixels, "Left", 1, 10, attributes, IN_az_offset=az_start)
+
+    return OUT_tiles
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2*NB_AZ_PER_TILE, 3*NB_AZ_PER_TILE])
+def test_write_water_pixels_chunk_independent(monkeypatch, chunk_size):
+    rng = np.random.default_rng(0)
+    water_pixels = (rng.uniform(size=(NB_PIX_RANGE, NB_AZ)) < 0.6).astype(np.uint8)
+
+    ref_tiles = simulate_swath(monkeypatch, water_pixels, 0)
+    chunk_tiles = simulate_swath(monkeypatch, water_pixels, chunk_size)
+
+    assert sorted(chunk_tiles.keys()) == sorted(ref_tiles.keys())
+    assert len(ref_tiles) == (NB_AZ-2) // NB_AZ_PER_TILE
+    for tile_ref, (classification, height) in ref_tiles.items():
+        np.testing.assert_array_equal(chunk_tiles[tile_ref][0], classification)
+        np.testing.assert_array_equal(chunk_tiles[tile_ref][1], height)
+    # Dark water is simulated
+    assert any((classification == 24).any() for classification, height in ref_tiles.values())
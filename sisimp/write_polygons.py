@@ -13,22 +13,24 @@ This file is part of the SWOT Hydrology Toolbox
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from osgeo import gdal, ogr
-from osgeo.gdalconst import GDT_Float32
+from osgeo.gdalconst import GDT_Int32
 
+import collections
 import numpy as np
 import sys
 import os
-import utm 
-import pyproj
 from scipy.spatial import cKDTree
-import time
 
 
 import lib.my_api as my_api
+import lib.my_cache as my_cache
+import lib.my_proj as my_proj
+import lib.my_rng as my_rng
+import lib.my_shp_file as my_shp
 import lib.my_tools as my_tools
 from lib.my_lacs import Constant_Lac, Reference_height_Lac, Gaussian_Lac, Polynomial_Lac, Height_in_file_Lac
-from lib.my_variables import RAD2DEG, DEG2RAD, GEN_APPROX_RAD_EARTH
-from lib.roll_module import Roll_module
+from lib.my_variables import RAD2DEG, DEG2RAD, GEN_APPROX_RAD_EARTH, AZR_CHUNK_SIZE, REPROJ_BATCH_SIZE
+from lib.roll_module import get_roll_module
 from lib.tropo_module import Tropo_module
 import lib.dark_water_functions as dark_water
 import proc_real_pixc
@@ -74,6 +76,7 @@ class orbitAttributes:
         self.height_model_period = None  # Height model period
         # Gaussian parameter for gaussian model
         self.height_model_stdv = None  # Height model standard deviation (for gaussian model)
+        self.height_model_max_cells = None  # Max number of cells of the height field grid of a lake (for gaussian model)
         
         # Dark water
         self.dark_water = None
@@ -98,7 +101,11 @@ class orbitAttributes:
     
         # 2 - Attributes for computation configuration
         self.create_shapefile = None
+        self.vector_file_ext = ".shp"  # Extension of output vector files (.shp, .gpkg or .fgb)
         self.create_pixc_vec_river = None
+        self.nb_proc = None  # Number of processes for parallel processing
+        self.random_seed = None  # Main seed, from which the random streams of the simulation are derived (cf. lib.my_rng)
+        self.nb_writers = None  # Number of processes for writing tile files
     
         # 3 - Working variables init
         self.sisimp_filenames = None  # Filenames specific to SISIMP
@@ -107,6 +114,11 @@ class orbitAttributes:
         self.compute_pixc_vec_river = None  # Flag for PIXCVecRiver file computation
         self.near_range = None
         self.swath_polygons = {}  # Dictionnary for storing swath polygons
+        self.pixc_files = []  # List of PIXC files written
+        self.cache_dir = None  # Directory of cached binary versions of input tables
+        self.tile_database = None  # Tile database, sorted by pass number
+        self.tile_values = None  # Tile number of each nadir point of the current pass
+        self.az_chunk_size = None  # Max number of azimuth indices processed at once (0 = whole swath)
         
         self.dw_detected_noise_height = None # dw detected noise tab
 
@@ -123,6 +135,9 @@ class orbitAttributes:
         self.x = None
         self.y = None
         self.z = None
+        self.vx = None  # Velocity, computed from x/y/z (cf. read_orbit)
+        self.vy = None
+        self.vz = None
         self.cosphi_init = None
         self.sinphi_init = None
         self.costheta_init = None
@@ -133,95 +148,97 @@ class orbitAttributes:
         # 4 - List of each water body
         self.liste_lacs = None
 
-def compute_pixels_in_water(IN_fshp_reproj, IN_pixc_vec_only, IN_attributes):
+def compute_pixels_in_water(IN_reproj_datasource, IN_pixc_vec_only, IN_attributes, IN_az_range=None):
     """
     Compute the position of the radar pixels that are inside a water body
 
-    Method: use the GDAL rasterize function to mark the pixels that are
-    contained in some polygons. This is very fast. Then we extract the pixels
-    that are marked (value=1) and write them in an text file for check with qgis
+    Method: use the GDAL rasterize function to burn the IND_LAC attribute of the 
+    pixels that are contained in some polygons, in a single pass. This is very fast. 
+    The water mask and the other attributes (HEIGHT, CODE) are then derived 
+    from the IND_LAC raster by lookup.
 
     Important note: only polygons in one swath (left or right) must be in
-                    fshp_reproj
+                    IN_reproj_datasource
 
-    :param IN_fshp_reproj: full path of the shapefile with polygons in radar projection
-    :type IN_fshp_reproj: string
+    :param IN_reproj_datasource: in-memory datasource with polygons in radar projection
+    :type IN_reproj_datasource: OGR DataSource
     :param IN_pixc_vec_only: if set, deal only with polygons with field RIV_FLAG != 0
     :type IN_pixc_vec_only: boolean
+    :param IN_az_range: (first, last+1) azimuth indices of the along-track chunk to deal with (default = whole swath);
+                        the output arrays then only cover this chunk
+    :type IN_az_range: tuple of int
 
     :return OUT_burn_data: the radar pixels that are inside a water body
-    :rtype OUT_burn_data: 2D-array of int (0=land 1=water)
-    :rettun OUT_height_data : the height pixels that are inside a water body
-    :rtype OUT_height_data : 2D-array of int (height of each water body pixel)
+    :rtype OUT_burn_data: 2D-array of uint8 (0=land 1=water)
+    :rettun OUT_height_data : the height pixels that are inside a water body (only for reference_height model)
+    :rtype OUT_height_data : 2D-array of float32 (height of each water body pixel)
+    :return OUT_code_data: CODE attribute of each water body pixel (only for gaussian and polynomial models)
+    :rtype OUT_code_data: 2D-array of int32
+    :return OUT_ind_lac_data: IND_LAC attribute of each pixel (0=land)
+    :rtype OUT_ind_lac_data: 2D-array of int32
     """
     if IN_pixc_vec_only:
         my_api.printInfo("[write_polygons] == compute_pixels_in_water / river polygons only ==")
     else:
         my_api.printInfo("[write_polygons] == compute_pixels_in_water / all polygons ==")
 
-    # 1 - Read the reprojected shapefile
-    driver = ogr.GetDriverByName(str("ESRI Shapefile"))
-    da_shapefile = driver.Open(IN_fshp_reproj, 0)  # 0 = read only
-    layer = da_shapefile.GetLayer()
+    # 1 - Get the layer of reprojected polygons
+    layer = IN_reproj_datasource.GetLayer()
     if IN_pixc_vec_only:
         layer.SetAttributeFilter(str("RIV_FLAG != '0'"))
         my_api.printInfo("compute_pixels_in_water / river pixels only - %d features to deal with" % layer.GetFeatureCount())
 
-    # Create a GDAL raster in memory
-    nx = len(IN_attributes.lon)
+    # 2 - Burn the IND_LAC attribute of the polygons in a single rasterization pass
+    # NB: IND_LAC starts at 1, so land pixels keep the value 0 of the raster initialization
+    if IN_az_range is None:
+        IN_az_range = (0, len(IN_attributes.lon))
+    az_start, az_end = IN_az_range
+    nx = az_end - az_start
     ny = IN_attributes.nb_pix_range
+    ds = gdal.GetDriverByName(str('MEM')).Create('', nx, ny, 1, GDT_Int32)
+    ds.SetGeoTransform([az_start-0.5, 1, 0, -0.5, 0, 1])
+    # Only polygons crossing the chunk are needed
+    layer.SetSpatialFilterRect(az_start-0.5, -0.5, az_end-0.5, ny-0.5)
+    gdal.RasterizeLayer(ds, [1], layer, None, options=["ATTRIBUTE=IND_LAC"])
+    #                                        , options=['ALL_TOUCHED=TRUE'])
+    OUT_ind_lac_data = ds.GetRasterBand(1).ReadAsArray()
     
-    cover = np.zeros((ny, nx), dtype='float64')
-    cover_height = np.zeros((ny, nx), dtype='float64')
-    cover_code = np.zeros((ny, nx), dtype='float64')
-    cover_ind_lac = np.zeros((ny, nx), dtype='int')
+    # Close the raster
+    ds = None
     
-    # Create 2 raster band if heights value come from shapefile
-    #~ nb_rasterBand = [1, 2][IN_attributes.height_model == "reference_height" or IN_attributes.height_model == "gaussian" or IN_attributes.height_model == "polynomial"]
-    nb_rasterBand = 4
-
-    ds = gdal.GetDriverByName(str('MEM')).Create('', nx, ny, nb_rasterBand, GDT_Float32)
-    ds.SetGeoTransform([-0.5, 1, 0, -0.5, 0, 1])
-    ds.GetRasterBand(1).WriteArray(cover)
-
-    # Burn with a value 1 the pixels that are in a polygon
-    gdal.RasterizeLayer(ds, [1], layer, None, None, burn_values=[1])
-    #                                        , options=['ALL_TOUCHED=TRUE'])
-
-    # Convert the radar pixels touching water in lon-lat
-    OUT_burn_data = ds.GetRasterBand(1).ReadAsArray()
+    # 3 - Water pixels = pixels burnt with a water body
+    OUT_burn_data = (OUT_ind_lac_data > 0).astype(np.uint8)
     
-    # Analyse value in shapefile
+    # 4 - Derive the other attributes from IND_LAC, with lookup tables indexed by IND_LAC
     OUT_height_data = None
     OUT_code_data = None
-    OUT_ind_lac_data = None
-    
-    if IN_attributes.height_model == "reference_height":
-        ds.GetRasterBand(2).WriteArray(cover_height)
-        # Burn with height value pixels in the associated polygon
-        gdal.RasterizeLayer(ds, [2], layer, None, options=["ATTRIBUTE=HEIGHT"])
-        # Get height pixels in lon-lat
-        OUT_height_data = ds.GetRasterBand(2).ReadAsArray()
+    
+    if IN_attributes.height_model in ["reference_height", "gaussian", "polynomial"]:
         
-    if IN_attributes.height_model == "gaussian" or IN_attributes.height_model == "polynomial":
-        ds.GetRasterBand(3).WriteArray(cover_code)
-        # Burn with height value pixels in the associated polygon
-        gdal.RasterizeLayer(ds, [3], layer, None, options=["ATTRIBUTE=CODE"])
-        # Get height pixels in lon-lat
-        OUT_code_data = ds.GetRasterBand(3).ReadAsArray().astype(int)
- 
-    ds.GetRasterBand(4).WriteArray(cover_ind_lac)
-    gdal.RasterizeLayer(ds, [4], layer, None, options=["ATTRIBUTE=IND_LAC"])
-    OUT_ind_lac_data = ds.GetRasterBand(4).ReadAsArray().astype(int)
+        # 4.1 - Fill lookup tables with the attributes of each polygon
+        height_lut = np.zeros(OUT_ind_lac_data.max()+1, dtype=np.float32)
+        code_lut = np.zeros(OUT_ind_lac_data.max()+1, dtype=np.int32)
+        layer.ResetReading()
+        for feature in layer:
+            ind_lac = feature.GetField(str("IND_LAC"))
+            if ind_lac < height_lut.size:  # Polygons without any pixel are not in the raster
+                if feature.GetField(str("HEIGHT")) is not None:
+                    height_lut[ind_lac] = feature.GetField(str("HEIGHT"))
+                if feature.GetField(str("CODE")) is not None:
+                    code_lut[ind_lac] = feature.GetField(str("CODE"))
+        layer.ResetReading()
+        
+        # 4.2 - Get height and code of each pixel
+        if IN_attributes.height_model == "reference_height":
+            OUT_height_data = height_lut[OUT_ind_lac_data]
+        else:
+            OUT_code_data = code_lut[OUT_ind_lac_data]
     
-    # Close the raster
-    ds = None
+    layer.SetSpatialFilter(None)
  
-    for i in IN_attributes.liste_lacs:
-        i.compute_pixels_in_given_lac(OUT_ind_lac_data)
     return OUT_burn_data, OUT_height_data, OUT_code_data, OUT_ind_lac_data, IN_attributes
 
-def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_orbit_number, IN_attributes):
+def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_orbit_number, IN_attributes, IN_az_offset=0, IN_writer_pool=None):
     """
     Check what pixels are marked as water and write their position.
     Real PixC files (Version 08/2018) are produced.
@@ -235,6 +252,10 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
     :type IN_cycle_number: int
     :param IN_orbit_number: orbit number
     :type IN_orbit_number: int
+    :param IN_az_offset: azimuth index of the 1st column of IN_water_pixels (when processing an along-track chunk of the swath)
+    :type IN_az_offset: int
+    :param IN_writer_pool: pool of processes writing the tile files (if None, tile files are written by the current process)
+    :type IN_writer_pool: multiprocessing.Pool
     """
     my_api.printInfo("[write_polygons] == write_water_pixels_realPixC ==")  
     
@@ -251,58 +272,68 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
     r, az = [ind[0], ind[1]]  # Range index
     #az = ind[1]  # Azimuth index
     river_flag = IN_water_pixels[ind]  # 1=lake and 2=river
+    
+    # Tile number of each nadir point
+    tile_values = IN_attributes.tile_values
+    if tile_values is None:
+        tile_values = compute_tile_values(IN_attributes, IN_orbit_number)
+    # Tile of each water pixel: random values are drawn per tile, so that they don't depend on the along-track chunks
+    # NB: the last azimuth indices, only used for extrapolations (cf. read_orbit), are assigned to the last tile
+    pix_tile = tile_values[np.minimum(az + IN_az_offset, tile_values.size-1)]
+    
     # Dark Water
     
     ## check if dark water is simulated or not
     if IN_attributes.dark_water.lower() == "yes" :
         ### Simulate dark water if water pixel are present
-        ### to do integrer dans le if suivant après quand ça marche pour éviter les répétitions
         if size_of_tabs != 0.:
-            rmin, rmax, azmin, azmax = r.min(), r.max(), az.min(), az.max()
-            taille_r, taille_az = rmax-rmin+1, azmax-azmin+1
-
-            # Simulate dark_water
-            dw_mask=dark_water.dark_water_simulation(1,azmin ,azmax+1,1, rmin, rmax+1,IN_attributes.dw_pourcent , seedvalue=None)
-    
-            ## Get water extent
-            indice_r = np.array(ind[0]-rmin)
-            indice_az = np.array(ind[1]-azmin)
-            ## Randomly classify or erase dark water regions
-            ### Randomly erase DW regions in DW mask
-
-            dw_mask = dark_water.dark_water_non_detected_simulation(dw_mask,1,azmin ,azmax+1,1, rmin, rmax+1,IN_attributes.dw_detected_percent,IN_attributes.dw_seed)
-            #reshape dark_water to water extent
-
-
-            dw_mask=dw_mask[indice_az,indice_r]
+            
+            # Simulate dark_water, over the extent of the water pixels of each tile
+            dw_mask = np.zeros(size_of_tabs)
+            for tile_number in np.unique(pix_tile):
+                tile_idx = np.flatnonzero(pix_tile == tile_number)
+                tile_r, tile_az = r[tile_idx], az[tile_idx] + IN_az_offset
+                rmin, rmax, azmin, azmax = tile_r.min(), tile_r.max(), tile_az.min(), tile_az.max()
+                dw_rng = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, IN_swath, "dark_water", tile_number)
+                tile_dw_mask = dark_water.dark_water_simulation(1, azmin, azmax+1, 1, rmin, rmax+1, IN_attributes.dw_pourcent, seedvalue=None, rng=dw_rng)
+                ## Randomly classify or erase dark water regions
+                if IN_attributes.dw_seed is not None:  # User-defined seed for the non detected dark water
+                    dw_rng = np.random.default_rng([int(IN_attributes.dw_seed), int(tile_number)])
+                else:
+                    dw_rng = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, IN_swath, "dark_water_non_detected", tile_number)
+                tile_dw_mask = dark_water.dark_water_non_detected_simulation(tile_dw_mask, 1, azmin, azmax+1, 1, rmin, rmax+1, IN_attributes.dw_detected_percent, None, rng=dw_rng)
+                #reshape dark_water to water extent
+                dw_mask[tile_idx] = tile_dw_mask[tile_az-azmin, tile_r-rmin]
+            
             ### Update IN_water_pixels with the deleted water pixels
             # check if dw pixels are deleted = dw_mask pixels set to 2
-            if np.where(dw_mask==2)[0].size > 0:
-                my_api.printInfo(str("Nb detected dark water pixels : %d" % np.where(dw_mask==1)[0].size ))
-                my_api.printInfo(str("Nb non detected dark water pixels : %d" % np.where(dw_mask==2)[0].size ))
-                ### Update river_flag and IN_water_pixels with the deleted water pixels
-                river_flag[np.where(dw_mask==2)]=0
-                IN_water_pixels[ind]=river_flag
-                # delete the corresponding pixels in the dw mask to update indices values
-                dw_mask=np.delete(dw_mask,np.where(dw_mask==2))
-                ## Update size of tabs etc... because water pixels were deleted
-                size_of_tabs = np.count_nonzero(IN_water_pixels)
+            deleted = (dw_mask == 2)
+            if deleted.any():
+                my_api.printInfo(str("Nb detected dark water pixels : %d" % np.count_nonzero(dw_mask==1)))
+                my_api.printInfo(str("Nb non detected dark water pixels : %d" % np.count_nonzero(deleted)))
+                IN_water_pixels[r[deleted], az[deleted]] = 0
+                ## Update indices etc... because water pixels were deleted (order of np.nonzero is kept)
+                kept = ~deleted
+                r, az = r[kept], az[kept]
+                ind = (r, az)
+                river_flag = river_flag[kept]
+                pix_tile = pix_tile[kept]
+                dw_mask = dw_mask[kept]
+                size_of_tabs = r.size
                 my_api.printInfo(str("Nb water pixels: %d" % size_of_tabs))
-                ind = np.nonzero(IN_water_pixels)
-                r, az = [ind[0], ind[1]]
-                river_flag = IN_water_pixels[ind]
             ###  Build the classification array with water flag Dark_water flag
             classification_tab = np.ones(size_of_tabs) * IN_attributes.water_flag  # Classification as water
-            #locate DW pixels
-            dark_water_loc = np.where(dw_mask==1)
             #update classification value for dark water pixels with DW flag
-            classification_tab[dark_water_loc]= IN_attributes.darkwater_flag
+            classification_tab[dw_mask==1] = IN_attributes.darkwater_flag
         else :
             classification_tab = np.ones(size_of_tabs) * IN_attributes.water_flag
     else :
         classification_tab = np.ones(size_of_tabs) * IN_attributes.water_flag
         my_api.printInfo(str("No Dark Water will be simulated"))
 
+    # Azimuth indices in the whole pass (ind remains relative to IN_water_pixels)
+    az = az + IN_az_offset
+
     if IN_attributes.height_model_a_tab is not None:
         height_flag = IN_attributes.height_model_a_tab[ind]
         
@@ -321,52 +352,46 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
     sign = [-1, 1][IN_swath.lower() == 'right']
     y = sign * np.sqrt((ri + Hi) * (ri - Hi) / (1. + Hi / GEN_APPROX_RAD_EARTH))
 
+    # 3.1 - Group water pixels per water body (pixels of water body k are ind_sorted[offsets[k]:offsets[k+1]])
+    ind_lac = IN_attributes.ind_lac[ind]
+    nb_lac = max([lac.num for lac in IN_attributes.liste_lacs] + [0]) + 1
+    ind_sorted, offsets = my_tools.computeGroupIndex(ind_lac, nb_lac)
+
+    # 3.2 - Geolocate all water pixels at once, each one at the mean height of its water body
+    hmean_lut = np.zeros(offsets.size-1)
+    for lac in IN_attributes.liste_lacs:
+        hmean_lut[lac.num] = lac.hmean
+    lon, lat = math_fct.lonlat_from_azy(az, ri, IN_attributes, IN_swath, IN_unit="deg", h = hmean_lut[ind_lac])
+
+    # 3.3 - Compute height of each water body over its own pixels
     elevation_tab = np.zeros(len(az))
-        
     for lac in IN_attributes.liste_lacs:
-        
-        indice = np.where(np.logical_and(np.isin(r, lac.pixels[0]), np.isin(az, lac.pixels[1])))  # Get indices 1=lake and 2=river (remove 0=land)
+        indice = ind_sorted[offsets[lac.num]:offsets[lac.num+1]]
+        if indice.size != 0:
+            elevation_tab[indice] = (lac.compute_h)(lat[indice], lon[indice])
+
 
-        lon, lat = math_fct.lonlat_from_azy(az, ri, IN_attributes, IN_swath, IN_unit="deg", h = lac.hmean)
-        elevation_tab[indice] = (lac.compute_h)(lat[indice], lon[indice])
-      
-      
     # 4.1 - Compute noise over height
-    if IN_attributes.dark_water.lower() == "yes" :
-        noise_seed = int(str(time.time()).split('.')[1])
-        delta_h=np.zeros(elevation_tab.shape)
-        water_pixels=np.where(classification_tab==IN_attributes.water_flag)
-        dw_pixels=np.where(classification_tab==IN_attributes.darkwater_flag)
-        delta_h[water_pixels]=math_fct.calc_delta_h(angles[water_pixels],IN_attributes.noise_height,IN_attributes.height_bias_std, seed = noise_seed)
-        delta_h[dw_pixels]=math_fct.calc_delta_h(angles[dw_pixels],IN_attributes.dw_detected_noise_height,IN_attributes.height_bias_std, seed = noise_seed)
-    else : 
-        delta_h = math_fct.calc_delta_h(angles, IN_attributes.noise_height, IN_attributes.height_bias_std)
+    # Height bias: one value per swath, whatever the along-track chunk
+    height_bias = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, IN_swath, "height_bias").normal(0, IN_attributes.height_bias_std)
+    # Noise of each pixel: one stream per tile
+    delta_h = np.zeros(elevation_tab.shape)
+    for tile_number in np.unique(pix_tile):
+        noise_rng = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, IN_swath, "height_noise", tile_number)
+        tile_idx = np.flatnonzero(pix_tile == tile_number)
+        if IN_attributes.dark_water.lower() == "yes" :
+            # Water and dark water pixels share the same height bias
+            water_pixels = tile_idx[classification_tab[tile_idx] == IN_attributes.water_flag]
+            dw_pixels = tile_idx[classification_tab[tile_idx] == IN_attributes.darkwater_flag]
+            delta_h[water_pixels]=math_fct.calc_delta_h(angles[water_pixels],IN_attributes.noise_height,IN_attributes.height_bias_std, rng = noise_rng, IN_height_bias = height_bias)
+            delta_h[dw_pixels]=math_fct.calc_delta_h(angles[dw_pixels],IN_attributes.dw_detected_noise_height,IN_attributes.height_bias_std, rng = noise_rng, IN_height_bias = height_bias)
+        else : 
+            delta_h[tile_idx] = math_fct.calc_delta_h(angles[tile_idx], IN_attributes.noise_height, IN_attributes.height_bias_std, rng = noise_rng, IN_height_bias = height_bias)
 
     # 4.2 Add residual roll error
-    try:
-        
-        roll = Roll_module(IN_attributes.roll_file)
-        roll.interpolate_roll_on_sensor_grid(IN_attributes.orbit_time)
-        
-        ## Change roll values to simulate random acquisitions
-        ## TBD ##
-        
-        # Apply roll for each pixel
-        pixel_cloud_time = IN_attributes.orbit_time[az]
-        roll.interpolate_roll_on_pixelcloud(IN_attributes.orbit_time, pixel_cloud_time)
-
-        if IN_swath.lower() == 'right' :  # Sign depends on left / right swath
-            delta_h_roll = (roll.roll2_err_cloud-roll.roll2_cor_cloud)*y*1e-6
-            delta_h += delta_h_roll
-            
-        if IN_swath.lower() == 'left' :  # Sign depends on left / right swath
-            delta_h_roll = (roll.roll1_err_cloud-roll.roll1_cor_cloud)*y*1e-6
-            delta_h += delta_h_roll
-
-        ## Check what is the better value from roll_module to use as error
-
-    except:
-        my_api.printInfo("No roll error applied")
+    delta_h_roll = compute_roll_error(IN_attributes, IN_swath, az, y)
+    if delta_h_roll is not None:
+        delta_h += delta_h_roll
  
     # 4.3 Add tropospheric delay
 
@@ -385,20 +410,8 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
     # 5.3 - Compute final noisy heights (elevation + thermal noise + roll error + height model) 
     elevation_tab_noisy = elevation_tab + delta_h           
     
-    # 7 - Build velocity arrays
-    nb_pix_nadir = IN_attributes.x.size  # Nb pixels at nadir
-    # Init velocity arrays
-    vx = np.zeros(nb_pix_nadir)
-    vy = np.zeros(nb_pix_nadir)
-    vz = np.zeros(nb_pix_nadir)
-    # Compute first value
-    vx[0], vy[0], vz[0] = [(IN_attributes.x[1] - IN_attributes.x[0]), (IN_attributes.y[1] - IN_attributes.y[0]), (IN_attributes.z[1] - IN_attributes.z[0])]  / (IN_attributes.orbit_time[1] - IN_attributes.orbit_time[0])
-    # Compute last value
-    vx[-1], vy[-1], vz[-1] = [(IN_attributes.x[-1] - IN_attributes.x[-2]), (IN_attributes.y[-1] - IN_attributes.y[-2]), (IN_attributes.z[-1] - IN_attributes.z[-2])] / (IN_attributes.orbit_time[-1] - IN_attributes.orbit_time[-2])
-    # Compute middle values
-    for indp in range(1, nb_pix_nadir-1):
-        vx[indp], vy[indp], vz[indp] = [(IN_attributes.x[indp+1] - IN_attributes.x[indp-1]), (IN_attributes.y[indp+1] - IN_attributes.y[indp-1]), (IN_attributes.z[indp+1] - IN_attributes.z[indp-1])] / (IN_attributes.orbit_time[indp+1] - IN_attributes.orbit_time[indp-1])
- 
+    # 7 - Velocity arrays (computed once per pass, cf. read_orbit)
+    vx, vy, vz = IN_attributes.vx, IN_attributes.vy, IN_attributes.vz
 
     # Convert nadir latitudes/longitudes in degrees
     nadir_lat_deg = IN_attributes.lat[1:-1] * RAD2DEG
@@ -425,45 +438,12 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
     # Tiles correspond to theoretical tiles, with 60km length at nadir
     if lat.size != 0:  
 
-        # Retrieve the tile database (pass_number/tile_number/nadir_lon/nadir_lat/nadir_heading)
-        tile_db = IN_attributes.tile_database
-        # Subset the tile DB to the portion related to the orbit number
-        #tile_db_orbit = tile_db[np.where(tile_db[:,0] == IN_orbit_number)[0],:]
-        tmp_orbit_number = IN_orbit_number - 331  # Pass 1 in tile database file = pass 332 in last KML file (sept2015-v2)
-        if tmp_orbit_number < 1:
-            tmp_orbit_number += 584
-        tile_db_orbit = tile_db[np.where(tile_db[:,0] == tmp_orbit_number)[0],:]
-        # Compute the indices of nadir_lat_min and nadir_lat_max
-        nadir_lat_argmin = int(np.argmin(nadir_lat_deg))
-        nadir_lat_argmax = int(np.argmax(nadir_lat_deg))
-        # Get long and lat in degrees, associated to nadir_min_lat
-        nadir_lat_deg_min = nadir_lat_deg[nadir_lat_argmin]
-        nadir_lon_deg_min = nadir_lon_deg[nadir_lat_argmin]
-        # Get long and lat in degrees, associated to nadir_max_lat
-        nadir_lat_deg_max = nadir_lat_deg[nadir_lat_argmax]
-        nadir_lon_deg_max = nadir_lon_deg[nadir_lat_argmax]
-        # Construct the kd-tree for quick nearest-neighbor lookup        
-        tree = cKDTree(tile_db_orbit[:,2:4])
-        
-        # Retrieve index of tile_db_orbit the nearest of nadir_min_lat
-        ind_min = tree.query([nadir_lat_deg_min, nadir_lon_deg_min])
-        # Retrieve index of tile_db_orbit the nearest of nadir_max_lat
-        ind_max = tree.query([nadir_lat_deg_max, nadir_lon_deg_max])
-        tile_db_orbit_cropped = tile_db_orbit[max(0, min(ind_max[1], ind_min[1])-1):min(len(tile_db_orbit), max(ind_max[1], ind_min[1])+2),:]
-        vect_lat_lon_db_cropped = np.zeros([max(0,tile_db_orbit_cropped.shape[0]-1),2])
-                 
-        for i in range(max(0,tile_db_orbit_cropped.shape[0]-1)):
-            vect_lat_lon_db_cropped[i,0] = tile_db_orbit_cropped[i+1,2]-tile_db_orbit_cropped[i,2]
-            vect_lat_lon_db_cropped[i,1] = tile_db_orbit_cropped[i+1,3]-tile_db_orbit_cropped[i,3]                 
-            nb_az_traj = max(nadir_lat_argmax,nadir_lat_argmin)- min(nadir_lat_argmax,nadir_lat_argmin)+1
-            tile_values = np.zeros(nb_az_traj, int)
-        for i in range(min(nadir_lat_argmax,nadir_lat_argmin), max(nadir_lat_argmax,nadir_lat_argmin)+1):
-            dist = np.abs(((nadir_lat_deg[i]-tile_db_orbit_cropped[:-1,2])*vect_lat_lon_db_cropped[:,0] + (nadir_lon_deg[i]-tile_db_orbit_cropped[:-1,3])*vect_lat_lon_db_cropped[:,1])/np.sqrt(vect_lat_lon_db_cropped[:,0]**2+vect_lat_lon_db_cropped[:,1]**2))
-            tile_values[i] = tile_db_orbit_cropped[np.argmin(dist),1]
-        
         ## If you want only one tile (for some tests)
         #~ tile_values[:] = tile_values[0]
-        tile_list = np.unique(tile_values)
+        # Only the tiles covered by the water pixels (which may be an along-track chunk of the swath)
+        tile_list = np.unique(tile_values[max(0, az.min()):az.max()+1])
+        
+        pending_writes = collections.deque()  # Tiles being written by IN_writer_pool, in submission order
         
         for tile_number in tile_list:
             
@@ -506,40 +486,226 @@ def write_water_pixels_realPixC(IN_water_pixels, IN_swath, IN_cycle_number, IN_o
                 
                 # Update filenames with tile ref
                 IN_attributes.sisimp_filenames.updateWithTileRef(tile_ref, IN_attributes.orbit_time[nadir_az[0]], IN_attributes.orbit_time[nadir_az[-1]])
+                tile_filenames = (IN_attributes.sisimp_filenames.pixc_file, IN_attributes.sisimp_filenames.file_annot_file, IN_attributes.sisimp_filenames.pixc_vec_river_file)
                 
-                # Write main file
-                my_pixc.write_pixc_file(IN_attributes.sisimp_filenames.pixc_file+".nc", None, True)
-                
-                # Write annotation file
-                my_pixc.write_annotation_file(IN_attributes.sisimp_filenames.file_annot_file, IN_attributes.sisimp_filenames.pixc_file+".nc")  
-                
-                # Write shapefiles if asked
-                if IN_attributes.create_shapefile:
-                    my_pixc.write_pixc_asShp(IN_attributes.sisimp_filenames.pixc_file+"_pixc.shp")
-                    my_pixc.write_tvp_asShp(IN_attributes.sisimp_filenames.pixc_file+"_tvp.shp")
-                    
-                # Write PIXCVec files if asked
+                # Init PIXCVec product if asked
+                my_pixc_vec = None
                 if IN_attributes.create_pixc_vec_river:
-                    # Init PIXCVec product
                     my_pixc_vec = proc_real_pixc_vec_river.l2_hr_pixc_vec_river(sub_az, sub_r, IN_attributes.mission_start_time, IN_attributes.cycle_duration, IN_cycle_number, IN_orbit_number, tile_ref, IN_attributes.nb_pix_range, nadir_az.size)
-                    # Set improved geoloc
-                    my_pixc_vec.set_vectorproc(lat[az_indices], my_tools.convert_to_0_360(lon[az_indices]), elevation_tab[az_indices])
-                    # Compute river_flag
-                    my_pixc_vec.set_river_lake_tag(river_flag[az_indices]-1)  # -1 to have 0=lake and 1=river
-                    # Write PIXCVec file
-                    my_pixc_vec.write_file(IN_attributes.sisimp_filenames.pixc_vec_river_file+".nc", None, True)
-                    # Write as shapefile if asked
-                    if IN_attributes.create_shapefile:
-                        my_pixc_vec.write_file_asShp(IN_attributes.sisimp_filenames.pixc_vec_river_file+".shp")
+                    # Set improved geoloc of river pixels only (river_flag: 1=lake and 2=river)
+                    pixc_river_idx = np.where(river_flag[az_indices] == 2)[0]  # Indices of river pixels in the L2_HR_PIXC product
+                    river_indices = az_indices[pixc_river_idx]  # Indices of river pixels in the swath arrays
+                    my_pixc_vec.set_river_pixels(pixc_river_idx, lat[river_indices], my_tools.convert_to_0_360(lon[river_indices]), elevation_tab[river_indices])
+                
+                # Write tile files
+                if IN_writer_pool is None:
+                    write_tile_files(my_pixc, my_pixc_vec, tile_filenames, IN_attributes.create_shapefile, IN_attributes.vector_file_ext)
+                else:
+                    pending_writes.append(IN_writer_pool.apply_async(write_tile_files, (my_pixc, my_pixc_vec, tile_filenames, IN_attributes.create_shapefile, IN_attributes.vector_file_ext)))
+                    # Bound the number of tiles kept in memory while waiting to be written
+                    while len(pending_writes) >= 2 * IN_attributes.nb_writers:
+                        my_api.printInfo("== Tile %s written" % pending_writes.popleft().get())
+                IN_attributes.pixc_files.append(IN_attributes.sisimp_filenames.pixc_file+".nc")
+        
+        # Wait for the remaining tiles to be written, in submission order
+        while pending_writes:
+            my_api.printInfo("== Tile %s written" % pending_writes.popleft().get())
             
     else:  
         my_api.printInfo("No output data file to write")   
 
 
-def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycle_number):
+def get_tile_db_orbit(IN_tile_db, IN_pass_number):
+    """
+    Get the subset of the tile database related to a pass
+    
+    :param IN_tile_db: tile database (pass_number/tile_number/nadir_lat/nadir_lon/nadir_heading), sorted by pass number
+    :type IN_tile_db: 2D-array of float
+    :param IN_pass_number: pass number (in the numbering of the tile database)
+    :type IN_pass_number: int
+    
+    :return: OUT_tile_db_orbit = rows of IN_tile_db related to IN_pass_number
+    :rtype: OUT_tile_db_orbit = 2D-array of float
+    """
+    ind_start = np.searchsorted(IN_tile_db[:, 0], IN_pass_number, side="left")
+    ind_end = np.searchsorted(IN_tile_db[:, 0], IN_pass_number, side="right")
+    OUT_tile_db_orbit = IN_tile_db[ind_start:ind_end, :]
+    return OUT_tile_db_orbit
+
+
+def compute_roll_error(IN_attributes, IN_swath, IN_az, IN_y):
+    """
+    Compute the height error due to the residual roll (cross-over residual roll error file), for each pixel
+    
+    :param IN_attributes
+    :type IN_attributes
+    :param IN_swath: the name of the swath 
+    :type IN_swath: string ("Left" or "Right")
+    :param IN_az: azimuth indices of the pixels
+    :type IN_az: 1D-array of int
+    :param IN_y: cross-track distance of the pixels
+    :type IN_y: 1D-array of float
+    
+    :return: OUT_delta_h_roll = height error of each pixel (None if no roll error is applied)
+    :rtype: OUT_delta_h_roll = 1D-array of float
+    """
+    if IN_attributes.roll_file is None:
+        my_api.printInfo("No roll error applied")
+        return None
+    
+    try:
+        # Roll file read once per process, and residual roll error interpolated once per pass and swath
+        roll = get_roll_module(IN_attributes.roll_file)
+        
+        ## Change roll values to simulate random acquisitions
+        ## TBD ##
+        
+        ## Check what is the better value from roll_module to use as error
+        # Sign depends on left / right swath
+        OUT_delta_h_roll = roll.compute_height_error(IN_attributes.orbit_time, IN_swath, IN_az, IN_y)
+    except (IOError, ValueError) as exc:
+        my_api.printInfo("No roll error applied (%s)" % str(exc))
+        return None
+    
+    return OUT_delta_h_roll
+
+
+def compute_tile_values(IN_attributes, IN_orbit_number):
+    """
+    Compute the tile number of each nadir point of the pass, from the tile database
+    
+    :param IN_attributes
+    :type IN_attributes
+    :param IN_orbit_number: orbit number
+    :type IN_orbit_number: int
+    
+    :return: OUT_tile_values = tile number of each nadir point
+    :rtype: OUT_tile_values = 1D-array of int
+    """
+    # Convert nadir latitudes/longitudes in degrees (remove 1st and last values because just here for extrapolators (cf. read_orbit))
+    nadir_lat_deg = IN_attributes.lat[1:-1] * RAD2DEG
+    nadir_lon_deg = IN_attributes.lon[1:-1] * RAD2DEG
+    
+    # Retrieve the tile database (pass_number/tile_number/nadir_lon/nadir_lat/nadir_heading)
+    tile_db = IN_attributes.tile_database
+    # Subset the tile DB to the portion related to the orbit number
+    tmp_orbit_number = IN_orbit_number - 331  # Pass 1 in tile database file = pass 332 in last KML file (sept2015-v2)
+    if tmp_orbit_number < 1:
+        tmp_orbit_number += 584
+    tile_db_orbit = get_tile_db_orbit(tile_db, tmp_orbit_number)
+    if tile_db_orbit.shape[0] == 0:
+        my_api.exitWithError("Pass %d not found in the tile database" % tmp_orbit_number)
+    # Compute the indices of nadir_lat_min and nadir_lat_max
+    nadir_lat_argmin = int(np.argmin(nadir_lat_deg))
+    nadir_lat_argmax = int(np.argmax(nadir_lat_deg))
+    # Construct the kd-tree for quick nearest-neighbor lookup        
+    tree = cKDTree(tile_db_orbit[:,2:4])
+    # Retrieve index of tile_db_orbit the nearest of nadir_min_lat
+    ind_min = tree.query([nadir_lat_deg[nadir_lat_argmin], nadir_lon_deg[nadir_lat_argmin]])
+    # Retrieve index of tile_db_orbit the nearest of nadir_max_lat
+    ind_max = tree.query([nadir_lat_deg[nadir_lat_argmax], nadir_lon_deg[nadir_lat_argmax]])
+    tile_db_orbit_cropped = tile_db_orbit[max(0, min(ind_max[1], ind_min[1])-1):min(len(tile_db_orbit), max(ind_max[1], ind_min[1])+2),:]
+    if tile_db_orbit_cropped.shape[0] < 2:
+        my_api.exitWithError("Not enough tiles of pass %d in the tile database" % tmp_orbit_number)
+    
+    # Direction between consecutive tile centers
+    vect_lat_lon_db_cropped = np.diff(tile_db_orbit_cropped[:, 2:4], axis=0)
+    norm_vect = np.sqrt(vect_lat_lon_db_cropped[:,0]**2+vect_lat_lon_db_cropped[:,1]**2)
+    
+    # Each nadir point belongs to the tile with the nearest center along the track
+    nb_az_traj = max(nadir_lat_argmax,nadir_lat_argmin)- min(nadir_lat_argmax,nadir_lat_argmin)+1
+    OUT_tile_values = np.zeros(nb_az_traj, int)
+    ind_az = np.arange(min(nadir_lat_argmax,nadir_lat_argmin), max(nadir_lat_argmax,nadir_lat_argmin)+1)
+    nb_az_per_block = 10000  # Bounds memory use (nb tiles values per nadir point)
+    for ind_block in range(0, ind_az.size, nb_az_per_block):
+        ind_i = ind_az[ind_block:ind_block+nb_az_per_block]
+        dist = np.abs(((nadir_lat_deg[ind_i, np.newaxis]-tile_db_orbit_cropped[:-1,2])*vect_lat_lon_db_cropped[:,0] + (nadir_lon_deg[ind_i, np.newaxis]-tile_db_orbit_cropped[:-1,3])*vect_lat_lon_db_cropped[:,1])/norm_vect)
+        OUT_tile_values[ind_i] = tile_db_orbit_cropped[np.argmin(dist, axis=1),1]
+    
+    return OUT_tile_values
+
+
+def compute_az_chunks(IN_tile_values, IN_nb_az, IN_chunk_size):
+    """
+    Split the azimuth range of a swath in along-track chunks, whose boundaries are tile boundaries,
+    so that each tile is entirely processed within one chunk
+    
+    :param IN_tile_values: tile number of each nadir point
+    :type IN_tile_values: 1D-array of int
+    :param IN_nb_az: number of azimuth indices of the swath
+    :type IN_nb_az: int
+    :param IN_chunk_size: max number of azimuth indices per chunk (a chunk has at least 1 tile); <= 0 = no chunk
+    :type IN_chunk_size: int
+    
+    :return: OUT_chunks = (first, last+1) azimuth indices of each chunk
+    :rtype: OUT_chunks = list of tuple of int
+    """
+    if IN_chunk_size is None or IN_chunk_size <= 0:
+        return [(0, IN_nb_az)]
+    
+    # Azimuth indices where each run of tile ends
+    tile_ends = np.append(np.flatnonzero(np.diff(IN_tile_values)) + 1, IN_tile_values.size)
+    
+    OUT_chunks = []
+    chunk_start = 0
+    chunk_end = 0
+    for tile_end in tile_ends.tolist():
+        if (tile_end - chunk_start > IN_chunk_size) and (chunk_end > chunk_start):
+            OUT_chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+        chunk_end = tile_end
+    # Last chunk goes to the end of the swath
+    OUT_chunks.append((chunk_start, IN_nb_az))
+    
+    return OUT_chunks
+
+
+def write_tile_files(IN_my_pixc, IN_my_pixc_vec, IN_filenames, IN_create_shapefile, IN_vector_ext=".shp"):
+    """
+    Write the files of a tile: PIXC main file and annotation file, PIXCVecRiver file if asked, 
+    and associated shapefiles if asked. Unit of work of the writer pool of write_water_pixels_realPixC.
+    
+    :param IN_my_pixc: PIXC product of the tile
+    :type IN_my_pixc: proc_real_pixc.l2_hr_pixc
+    :param IN_my_pixc_vec: PIXCVecRiver product of the tile (None if not asked)
+    :type IN_my_pixc_vec: proc_real_pixc_vec_river.l2_hr_pixc_vec_river
+    :param IN_filenames: (PIXC file without extension, annotation file, PIXCVecRiver file without extension)
+    :type IN_filenames: tuple of string
+    :param IN_create_shapefile: if set, write shapefiles
+    :type IN_create_shapefile: boolean
+    :param IN_vector_ext: extension of the vector files, giving their format (.shp, .gpkg or .fgb)
+    :type IN_vector_ext: string
+    
+    :return: OUT_tile_ref = tile reference
+    :rtype: string
+    """
+    pixc_file, annot_file, pixc_vec_river_file = IN_filenames
+    
+    # Write main file
+    IN_my_pixc.write_pixc_file(pixc_file+".nc", None, True)
+    
+    # Write annotation file
+    IN_my_pixc.write_annotation_file(annot_file, pixc_file+".nc")  
+    
+    # Write shapefiles if asked
+    if IN_create_shapefile:
+        IN_my_pixc.write_pixc_asShp(pixc_file+"_pixc"+IN_vector_ext)
+        IN_my_pixc.write_tvp_asShp(pixc_file+"_tvp"+IN_vector_ext)
+        
+    # Write PIXCVec files if asked
+    if IN_my_pixc_vec is not None:
+        IN_my_pixc_vec.write_file(pixc_vec_river_file+".nc", None, True)
+        # Write as shapefile if asked
+        if IN_create_shapefile:
+            IN_my_pixc_vec.write_file_asShp(pixc_vec_river_file+IN_vector_ext)
+    
+    return IN_my_pixc.tile_ref
+
+
+def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycle_number, IN_orbit_number):
     """
     Read the water polygon shapefile and compute polygons in radar coordinates. 
-    Save the reprojected polygons in a new shapefile and return its name.
+    Store the reprojected polygons in an in-memory datasource (no temporary file on disk) and return it.
 
     Compute the part of water bodies polygons that is in the swath.
     This is needed to avoid folding of one swath on the other one due to
@@ -549,11 +715,15 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
     :type IN_filename: string 
     :param IN_swath: the name of the swath 
     :type IN_swath: string ("Left" or "Right")
-    :param IN_driver: OGR driver
+    :param IN_driver: OGR driver of the input shapefile
     :type IN_driver: -
+    :param IN_cycle_number: cycle number
+    :type IN_cycle_number: int
+    :param IN_orbit_number: orbit number
+    :type IN_orbit_number: int
     
-    :return OUT_file/Getname: full path of the shapefile with the water body polygons in radar coordinates
-    :rtype OUT_filename: string
+    :return OUT_datasource: in-memory datasource with the water body polygons in radar coordinates
+    :rtype OUT_datasource: OGR DataSource
     :return OUT_swath_polygons
     :rtype OUT_swath_polygons
     """
@@ -577,15 +747,13 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
     if nb_features == 0:
         return None, IN_attributes
     
-    # 3 - Create the output shapefile
+    # 3 - Create the output datasource in memory
     swath_t = '%s_swath' % IN_swath
-    OUT_filename = os.path.join(IN_attributes.out_dir, os.path.splitext(os.path.split(IN_filename)[1])[0] + '_tmp_radarproj_%s.shp' % swath_t)
-    if os.path.exists(OUT_filename):
-        IN_driver.DeleteDataSource(OUT_filename)
-    dataout = IN_driver.CreateDataSource(OUT_filename)
-    if dataout is None:
-        my_api.printError("Could not create file")
-    layerout = dataout.CreateLayer(str(os.path.splitext(os.path.split(OUT_filename)[1])[0]), None, geom_type=ogr.wkbPolygon)
+    layer_name = os.path.splitext(os.path.split(IN_filename)[1])[0] + '_tmp_radarproj_%s' % swath_t
+    OUT_datasource = ogr.GetDriverByName(str("Memory")).CreateDataSource(str(layer_name))
+    if OUT_datasource is None:
+        my_api.printError("Could not create in-memory datasource")
+    layerout = OUT_datasource.CreateLayer(str(layer_name), None, geom_type=ogr.wkbPolygon)
     # Create necessary output fields 
     layerout.CreateField(ogr.FieldDefn(str('RIV_FLAG'), ogr.OFTInteger))
     layerout.CreateField(ogr.FieldDefn(str('HEIGHT'), ogr.OFTReal))
@@ -594,13 +762,45 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
 
     floutDefn = layerout.GetLayerDefn()
     feature_out = ogr.Feature(floutDefn)
+    layerDefn = layer.GetLayerDefn()
 
     # 4 - Convert coordinates for each water body polygon
-    range_tab = []
-    OUT_near_range = None
-    
-    heau = []
+    # The vertices of the polygons are converted to radar coordinates in batches, 
+    # each batch in a single call to azr_from_lonlat, then the polygons are rebuilt from the arrays
     liste_lac = []
+    batch_polygons = []  # Polygons of the batch: (IND_LAC, RIV_FLAG, CODE, number of vertices of each ring)
+    batch_lon = []  # Longitudes of the vertices of each ring of the batch
+    batch_lat = []  # Latitudes of the vertices of each ring of the batch
+    batch_heau = []  # Water height of the vertices of each ring of the batch
+    
+    def write_batch():
+        """Convert the vertices of the batch in radar coordinates and add the reprojected polygons to the output layer"""
+        if len(batch_polygons) == 0:
+            return
+        az, r, near_range = azr_from_lonlat(np.concatenate(batch_lon), np.concatenate(batch_lat), IN_attributes, heau = np.concatenate(batch_heau))
+        IN_attributes.near_range = near_range[-batch_lon[-1].size:]  # Near range of the last converted ring
+        
+        ind_point = 0
+        for ind_lac, riv_flag, code, nb_points_per_ring in batch_polygons:
+            rings = []
+            for nb_points in nb_points_per_ring:
+                rings.append((az[ind_point:ind_point+nb_points], r[ind_point:ind_point+nb_points]))
+                ind_point += nb_points
+            # Add the output reprojected polygon to the output feature
+            feature_out.SetGeometry(my_shp.make_polygon_from_rings(rings))
+            # Set the RIV_FLAG field
+            feature_out.SetField(str("RIV_FLAG"), riv_flag)
+            # Set the CODE field
+            if code is not None:
+                feature_out.SetField(str("CODE"), code)
+            feature_out.SetField(str("IND_LAC"), ind_lac)
+            # Add the output feature to the output layer
+            feature_out.SetFID(-1)
+            layerout.CreateFeature(feature_out)
+        
+        del batch_polygons[:], batch_lon[:], batch_lat[:], batch_heau[:]
+    
+    nb_batch_points = 0
     for ind, polygon_index in enumerate(layer):
         geom = polygon_index.GetGeometryRef()
         
@@ -611,44 +811,29 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
             else:
                 riv_flag = 0
             
-            # 4.2 - Create the output polygon in radar projection
-            # 4.2.1 - Init output geometry
-            geom_out = ogr.Geometry(ogr.wkbPolygon)
-            # 4.2.2 - Compute the zone resulting of the intersection between polygon and swath
+            # 4.2 - Compute the zone resulting of the intersection between polygon and swath
             intersection = geom.Intersection(swath_polygon) 
-            # 4.2.3 - Convert polygons coordinates
-            add_ring = False
-            for ring in all_linear_rings(intersection):
-                npoints = ring.GetPointCount()
-
-                if npoints == 0:
+            
+            # 4.3 - Get the vertices of each ring and the height model of the water body
+            nb_points_per_ring = []
+            for ring in my_shp.get_polygon_rings(intersection):
+                if ring.shape[0] == 0:
                     continue  # ignore polygons completely outside the swath
-
-                points = np.transpose(np.array(ring.GetPoints()))
                 
-                lon = points[0]
-                lat = points[1]
+                lon = ring[:, 0]
+                lat = ring[:, 1]
                
-                x_c, y_c, zone_number, zone_letter = utm.from_latlon(lat[0], lon[0])
-                latlon = pyproj.Proj(init="epsg:4326")
-                utm_proj = pyproj.Proj("+proj=utm +zone={}{} +ellps=WGS84 +datum=WGS84 +units=m +no_defs".format(zone_number, zone_letter))
-                X, Y = pyproj.transform(latlon, utm_proj, lon, lat) 
-                
-                ring_xy = ogr.Geometry(ogr.wkbLinearRing)
-                for i in range(len(X)):
-                    ring_xy.AddPoint(X[i],Y[i])
-                poly_xy = ogr.Geometry(ogr.wkbPolygon)
-                poly_xy.AddGeometry(ring_xy)
-                
-                # area in ha
-                area = poly_xy.GetArea()/10000.
-           
-                layerDefn = layer.GetLayerDefn()
+                # Area in ha, computed in the UTM zone of the 1st point of the ring
+                zone_number = my_proj.get_utm_zone(lon[0], lat[0])
+                X, Y = my_proj.lonlat_to_utm(lon, lat, zone_number)
+                area = my_proj.compute_ring_area(X, Y)/10000.
                 
                 lon = lon * DEG2RAD
                 lat = lat * DEG2RAD
                 
                 lac = None
+                # Random values of the height model of the water body
+                lac_rng = my_rng.get_generator(IN_attributes.random_seed, IN_cycle_number, IN_orbit_number, IN_swath, "lake_height", ind+1)
                 
                 if IN_attributes.height_model == None:
                     lac = Constant_Lac(ind+1, IN_attributes, lat, IN_cycle_number)
@@ -660,14 +845,14 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
                 if IN_attributes.height_model == 'gaussian': 
                     if area > IN_attributes.height_model_min_area:
                         my_api.printInfo(str("Gaussian model applied for big water body of size %f ha" % area))
-                        lac = Gaussian_Lac(ind+1, IN_attributes, lat, lon, IN_cycle_number)
+                        lac = Gaussian_Lac(ind+1, IN_attributes, lat, lon, IN_cycle_number, rng=lac_rng)
                     else:
                         lac = Constant_Lac(ind+1, IN_attributes, lat, IN_cycle_number)
                         
                 if IN_attributes.height_model == 'polynomial': 
                     if area > IN_attributes.height_model_min_area:
                         my_api.printInfo(str("Polynomial model applied for big water body of size %f ha" % area))
-                        lac = Polynomial_Lac(ind+1, IN_attributes, lat, lon, IN_cycle_number)
+                        lac = Polynomial_Lac(ind+1, IN_attributes, lat, lon, IN_cycle_number, rng=lac_rng)
                     else:
                         lac = Constant_Lac(ind+1, IN_attributes, lat, IN_cycle_number)
                 
@@ -679,55 +864,40 @@ def reproject_shapefile(IN_filename, IN_swath, IN_driver, IN_attributes, IN_cycl
 
                 lac.set_hmean(np.mean(lac.compute_h(lat, lon)))
                 
-       
-                az, r, IN_attributes.near_range = azr_from_lonlat(lon, lat, IN_attributes, heau = lac.hmean)
+                # Vertices to convert in radar coordinates, at the mean height of the water body
+                batch_lon.append(lon)
+                batch_lat.append(lat)
+                batch_heau.append(np.full(lon.size, lac.hmean))
+                nb_points_per_ring.append(lon.size)
                 
-                range_tab = np.concatenate((range_tab, r), -1)
-                npoints = len(az)
-                if len(az) != len(lon):
-                    my_api.printDebug("Ignore polygons crossing the swath")
-                    continue  # Ignore polygons crossing the swath
-                for p in range(npoints):  # no fonction ring.SetPoints()
-                    ring.SetPoint(p, az[p], r[p])
-                ring.CloseRings()
-                add_ring = True
-                # Add the reprojected ring to the output geometry
-                geom_out.AddGeometry(ring)
-            # 4.2.4 - Add Output geometry
-            if add_ring:
-               
-                # Add the output reprojected polygon to the output feature
-                feature_out.SetGeometry(geom_out)
-                # Set the RIV_FLAG field
-                feature_out.SetField(str("RIV_FLAG"), riv_flag)
-                # Set the HEIGHT field
-                height_from_shp = False
-                layerDefn = layer.GetLayerDefn()
-                for i in range(layerDefn.GetFieldCount()):
-                    if IN_attributes.height_model == 'polynomial' or IN_attributes.height_model == 'gaussian':
-                        feature_out.SetField(str("CODE"),polygon_index.GetField("code"))
-                if not height_from_shp:
-                    IN_attributes.height_model_a_tab = None
-                
-                feature_out.SetField(str("IND_LAC"),ind+1)
-                
-                # Add the output feature to the output layer
-                layerout.CreateFeature(feature_out)
+            # 4.4 - Add the polygon to the batch
+            if len(nb_points_per_ring) != 0:
+                code = None
+                if (IN_attributes.height_model == 'polynomial' or IN_attributes.height_model == 'gaussian') and layerDefn.GetFieldCount() > 0:
+                    code = polygon_index.GetField("code")
+                batch_polygons.append((ind+1, riv_flag, code, nb_points_per_ring))
                 liste_lac.append(lac)
+                IN_attributes.height_model_a_tab = None
+                
+                nb_batch_points += sum(nb_points_per_ring)
+                if nb_batch_points >= REPROJ_BATCH_SIZE:
+                    write_batch()
+                    nb_batch_points = 0
+    
+    write_batch()
                 
     IN_attributes.swath_polygons = OUT_swath_polygons
     IN_attributes.liste_lacs = liste_lac
     
-    return OUT_filename, IN_attributes
+    return OUT_datasource, IN_attributes
 
 def project_array(coordinates, srcp='latlon', dstp='geocent'):
     """
     Project a numpy (n,2) array in projection srcp to projection dstp
     Returns a numpy (n,2) array.
     """
-    p1 = pyproj.Proj(proj=srcp, datum='WGS84')
-    p2 = pyproj.Proj(proj=dstp, datum='WGS84')
-    fx, fy, fz = pyproj.transform(p1, p2, coordinates[:,1], coordinates[:,0], coordinates[:,2])
+    transform = my_proj.get_transform_function("+proj=%s +datum=WGS84" % srcp, "+proj=%s +datum=WGS84" % dstp)
+    fx, fy, fz = transform(coordinates[:,1], coordinates[:,0], coordinates[:,2])
     # Re-create (n,2) coordinates
     # Inversion of lat and lon !
     return np.dstack([fx, fy, fz])[0]
@@ -736,33 +906,33 @@ def project_array(coordinates, srcp='latlon', dstp='geocent'):
 def make_swath_polygon(IN_swath, IN_attributes):
     """Make left of right swath polygon
     
+    The vertices of the polygon are cached (cf. my_cache), with a key built from the orbit arrays (after jitter) 
+    and the swath parameters, so the footprint is computed only once per orbit.
+    
     :param IN_swath 
     :type IN_swath
     """
-    sign = [-1, 1][IN_swath.lower() == 'right']
-    ymin = sign * IN_attributes.nr_cross_track
-    ymax = sign * IN_attributes.swath_width/2
-
-    n = len(IN_attributes.lon_init) - 4
-    az = np.arange(2, n + 2, 10)
-    y = ymin * np.ones(len(az))
-    lon1, lat1 = math_fct.lonlat_from_azy_old(az, y, IN_attributes.lat_init, IN_attributes.lon_init, IN_attributes.heading_init)
-    y = ymax * np.ones(len(az))
-    lon2, lat2 = math_fct.lonlat_from_azy_old(az, y, IN_attributes.lat_init, IN_attributes.lon_init, IN_attributes.heading_init)
-    lonswath = np.concatenate((lon1, lon2[::-1]))
-    latswath = np.concatenate((lat1, lat2[::-1]))
-    lonswath *= RAD2DEG
-    latswath *= RAD2DEG
-
-    swath_polygon = ogr.Geometry(ogr.wkbPolygon)
-    ring = ogr.Geometry(ogr.wkbLinearRing)
-    n = len(lonswath)
-    for i in range(n):
-        ring.AddPoint(lonswath[i], latswath[i])
-    ring.CloseRings()
-    swath_polygon.AddGeometry(ring)
-
-    return swath_polygon
+    
+    def compute_swath_vertices():
+        sign = [-1, 1][IN_swath.lower() == 'right']
+        ymin = sign * IN_attributes.nr_cross_track
+        ymax = sign * IN_attributes.swath_width/2
+    
+        n = len(IN_attributes.lon_init) - 4
+        az = np.arange(2, n + 2, 10)
+        y = ymin * np.ones(len(az))
+        lon1, lat1 = math_fct.lonlat_from_azy_old(az, y, IN_attributes.lat_init, IN_attributes.lon_init, IN_attributes.heading_init)
+        y = ymax * np.ones(len(az))
+        lon2, lat2 = math_fct.lonlat_from_azy_old(az, y, IN_attributes.lat_init, IN_attributes.lon_init, IN_attributes.heading_init)
+        lonswath = np.concatenate((lon1, lon2[::-1]))
+        latswath = np.concatenate((lat1, lat2[::-1]))
+        return {"lon": lonswath * RAD2DEG, "lat": latswath * RAD2DEG}
+    
+    key = my_cache.compute_key(IN_attributes.lat_init, IN_attributes.lon_init, IN_attributes.heading_init, 
+                               IN_swath.lower(), IN_attributes.nr_cross_track, IN_attributes.swath_width)
+    vertices = my_cache.get_cached_arrays(IN_attributes.cache_dir, "footprint", key, compute_swath_vertices)
+
+    return my_shp.make_polygon(vertices["lon"], vertices["lat"])
 
 def azr_from_lonlat(IN_lon, IN_lat, IN_attributes, heau = 0.):
     """
@@ -800,45 +970,67 @@ def azr_from_lonlat(IN_lon, IN_lat, IN_attributes, heau = 0.):
     psi = math_fct.linear_extrap(lat0, IN_attributes.lat_init, IN_attributes.heading_init)
     y = du * np.cos(psi)  # eq (3)
     OUT_azcoord = (math_fct.linear_extrap(lat0, IN_attributes.lat_init, np.arange(len(IN_attributes.lat_init))))
-    lat_0, lon_0 = IN_attributes.lat_init, IN_attributes.lon_init
+    
+    # Look for the nearest orbit point among nb_points around the 1st guess,
+    # i.e. the one for which the point is in the plane orthogonal to the track (gamma = 0)
     nb_points = 50
-    gamma = np.zeros([len(IN_lat), nb_points])
-    beta = np.zeros([len(IN_lat), nb_points])
-  
-    for i in range(nb_points):
-        k = OUT_azcoord.astype('i4')+i-int(nb_points/2)
-        bad_ind = np.logical_or((k < 0) , (k > len(IN_attributes.costheta_init)-1))
-        k[bad_ind] = 0.
-
-        theta = np.pi/2. - IN_lat
-        theta_0 = np.pi/2. - lat_0[k,]
-        phi = IN_lon
+    nb_orbit_points = len(IN_attributes.costheta_init)
+    shift = np.arange(nb_points) - int(nb_points/2)
+    
+    # Terms depending only on the points, computed once
+    theta = np.pi/2. - IN_lat
+    phi = IN_lon
+    sintheta_cosphi = np.sin(theta) * np.cos(phi)
+    sintheta_sinphi = np.sin(theta) * np.sin(phi)
+    costheta = np.cos(theta)
+    radius = np.broadcast_to(GEN_APPROX_RAD_EARTH + heau, IN_lat.shape)
+    
+    ind = np.zeros(len(IN_lat), int)
+    y = np.zeros(len(IN_lat), float)
+    
+    # Points are processed by chunks of AZR_CHUNK_SIZE to bound memory use (nb_points values per point)
+    for ind_start in range(0, len(IN_lat), AZR_CHUNK_SIZE):
+        chunk = slice(ind_start, ind_start+AZR_CHUNK_SIZE)
         
-        costheta_0 = IN_attributes.costheta_init[k,]
-        sintheta_0 = IN_attributes.sintheta_init[k,]
-        cosphi_0 = IN_attributes.cosphi_init[k,]
-        sinphi_0 = IN_attributes.sinphi_init[k,]
-        cospsi_0 = IN_attributes.cospsi_init[k,]
-        sinpsi_0 = IN_attributes.sinpsi_init[k,]
+        k = OUT_azcoord[chunk].astype('i4')[:, np.newaxis] + shift
+        bad_ind = np.logical_or((k < 0), (k > nb_orbit_points-1))
+        k[bad_ind] = 0
+        
+        costheta_0 = IN_attributes.costheta_init[k]
+        sintheta_0 = IN_attributes.sintheta_init[k]
+        cosphi_0 = IN_attributes.cosphi_init[k]
+        sinphi_0 = IN_attributes.sinphi_init[k]
+        cospsi_0 = IN_attributes.cospsi_init[k]
+        sinpsi_0 = IN_attributes.sinpsi_init[k]
+        
+        a = sintheta_cosphi[chunk, np.newaxis]
+        b = sintheta_sinphi[chunk, np.newaxis]
+        c = costheta[chunk, np.newaxis]
+        rad = radius[chunk, np.newaxis]
+        
+        gamma = rad*(a*(-cospsi_0*costheta_0*cosphi_0-sinpsi_0*sinphi_0) \
+                +b*(-cospsi_0*costheta_0*sinphi_0+sinpsi_0*cosphi_0) \
+                +c*(cospsi_0*sintheta_0))
+        gamma[bad_ind] = 9.99e20
+        
+        indice = np.argmin(np.abs(gamma), axis=1)
+        k_min = k[np.arange(indice.size), indice]
+        
+        # beta is only needed at the selected orbit point
+        a, b, c, rad = a[:, 0], b[:, 0], c[:, 0], rad[:, 0]
+        costheta_0 = IN_attributes.costheta_init[k_min]
+        sintheta_0 = IN_attributes.sintheta_init[k_min]
+        cosphi_0 = IN_attributes.cosphi_init[k_min]
+        sinphi_0 = IN_attributes.sinphi_init[k_min]
+        cospsi_0 = IN_attributes.cospsi_init[k_min]
+        sinpsi_0 = IN_attributes.sinpsi_init[k_min]
+        y[chunk] = rad*(a*(sinpsi_0*costheta_0*cosphi_0-cospsi_0*sinphi_0) \
+                +b*(sinpsi_0*costheta_0*sinphi_0+cospsi_0*cosphi_0) \
+                +c*(-sinpsi_0*sintheta_0))
+        y[chunk][bad_ind[np.arange(indice.size), indice]] = 9.99e20
+        
+        ind[chunk] = indice - int(nb_points/2)
         
-        gamma[:,i] = (GEN_APPROX_RAD_EARTH+heau)*(np.sin(theta)*np.cos(phi)*(-cospsi_0*costheta_0*cosphi_0-sinpsi_0*sinphi_0) \
-                +np.sin(theta)*np.sin(phi)*(-cospsi_0*costheta_0*sinphi_0+sinpsi_0*cosphi_0) \
-                +np.cos(theta)*(cospsi_0*sintheta_0))
-                
-        beta[:,i]= (GEN_APPROX_RAD_EARTH+heau)*(np.sin(theta)*np.cos(phi)*(sinpsi_0*costheta_0*cosphi_0-cospsi_0*sinphi_0) \
-                +np.sin(theta)*np.sin(phi)*(sinpsi_0*costheta_0*sinphi_0+cospsi_0*cosphi_0) \
-                +np.cos(theta)*(-sinpsi_0*sintheta_0))
-
-        gamma[bad_ind,i] = 9.99e20
-        beta[bad_ind,i] = 9.99e20
-                
-    ind = np.zeros(len(IN_lat), int)   
-    y = np.zeros(len(IN_lat), float)   
-             
-    for i in range(len(IN_lat)):
-        indice = np.argmin(np.abs(gamma[i,:]))
-        y[i] = beta[i, indice]
-        ind[i] = indice - int(nb_points/2)
     OUT_azcoord2 = OUT_azcoord  + ind
     # Compute range coordinate (across track)
     
@@ -850,17 +1042,3 @@ def azr_from_lonlat(IN_lon, IN_lat, IN_attributes, heau = 0.):
     OUT_near_range = r0
     
     return OUT_azcoord2, OUT_rcoord, OUT_near_range
-
-
-def all_linear_rings(geom):
-    """ Generator for all linear rings in a geometry """
-
-    if geom.GetGeometryName() == 'MULTIPOLYGON':
-        for polygon_index in range(geom.GetGeometryCount()):
-            polygon = geom.GetGeometryRef(polygon_index)
-            for line_index in range(polygon.GetGeometryCount()):
-                yield polygon.GetGeometryRef(line_index)
-
-    if geom.GetGeometryName() == 'POLYGON':
-        for line_index in range(geom.GetGeometryCount()):
-            yield geom.GetGeometryRef(line_index)